@@ -0,0 +1,260 @@
+# availability.py
+import calendar
+import logging
+import threading
+import time
+from bisect import bisect_left
+from functools import lru_cache
+from operator import itemgetter
+from datetime import date, datetime, time as dtime, timedelta
+
+logger = logging.getLogger(__name__)
+
+WEEKDAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+
+
+def _parse_time(value):
+    hour, minute = map(int, value.split(":"))
+    return dtime(hour, minute)
+
+
+class DayHours:
+    """Рабочий день: начало и конец, перерывы, длина слота и шаг сетки."""
+
+    def __init__(self, start="10:00", end="22:00", slot_minutes=180, step_minutes=None, breaks=()):
+        self.start = _parse_time(start)
+        self.end = _parse_time(end)
+        self.slot = timedelta(minutes=slot_minutes)
+        self.step = timedelta(minutes=step_minutes or slot_minutes)
+        self.breaks = [(_parse_time(b_start), _parse_time(b_end)) for b_start, b_end in breaks]
+
+
+class WorkingHours:
+    """
+    Расписание по дням недели. По умолчанию — 10:00–22:00, слоты по 3 часа.
+
+    В config.json:
+        "working_hours": {
+            "default": {"start": "10:00", "end": "22:00", "slot_minutes": 180, "step_minutes": 180,
+                        "breaks": [["14:00", "14:30"]]},
+            "sun": null
+        }
+    null — выходной; день без ключа берёт "default".
+    """
+
+    def __init__(self, default=None, weekdays=None):
+        self.default = default or DayHours()
+        self.weekdays = weekdays or {}  # 0..6 → DayHours или None (выходной)
+
+    @classmethod
+    def from_config(cls, cfg):
+        cfg = cfg or {}
+        default = DayHours(**cfg["default"]) if cfg.get("default") else DayHours()
+        weekdays = {}
+        for i, name in enumerate(WEEKDAYS):
+            if name in cfg:
+                weekdays[i] = DayHours(**cfg[name]) if cfg[name] else None
+        return cls(default, weekdays)
+
+    def for_weekday(self, weekday):
+        return self.weekdays.get(weekday, self.default)
+
+
+def _zone_name(tzinfo):
+    # pytz: .zone, zoneinfo: .key
+    return getattr(tzinfo, "zone", None) or getattr(tzinfo, "key", None)
+
+
+def bucket_by_date(busy, tz, first_day, last_day):
+    """
+    Раскладывает занятые интервалы по датам first_day..last_day (в часовом поясе tz).
+    Интервал, переходящий через полночь, попадает во все даты, которые он задевает.
+    """
+    zone = _zone_name(tz)
+    local = {}  # tzinfo → в том же ли он поясе, что и tz (тогда .date() уже локальная дата)
+
+    buckets = {}
+    for start, end in busy:
+        tzinfo = start.tzinfo
+        same = local.get(tzinfo)
+        if same is None:
+            same = local[tzinfo] = _zone_name(tzinfo) == zone
+        if same and end.tzinfo is tzinfo:
+            first, last = start.date(), end.date()
+        else:
+            first, last = start.astimezone(tz).date(), end.astimezone(tz).date()
+        if first == last:
+            if first_day <= first <= last_day:
+                buckets.setdefault(first, []).append((start, end))
+            continue
+        if last < first_day or first > last_day:
+            continue
+        current = max(first, first_day)
+        while current <= min(last, last_day):
+            buckets.setdefault(current, []).append((start, end))
+            current += timedelta(days=1)
+    return buckets
+
+
+@lru_cache(maxsize=1024)
+def _localize(tz, day, at):
+    """Начало/конец рабочего дня и перерывов: pytz.localize медленный, а дни одни и те же."""
+    return tz.localize(datetime.combine(day, at))
+
+
+def free_slots(days, busy, tz, hours):
+    """
+    Свободные слоты на дни days (по возрастанию): {date: [datetime начала слота, ...]}.
+    busy — занятые интервалы, отсортированные по началу (так их хранит AvailabilityCache).
+
+    Узлы сетки [c, c + slot) идут по возрастанию, поэтому по интервалам идёт
+    один указатель: для узла он продвигается до первого интервала, начавшегося
+    не раньше c + slot, и запоминает самый поздний конец среди пройденных.
+    Узел свободен, если этот конец не позже c и узел не задевает перерыв.
+    Итого O(E + узлы) на уже отсортированных интервалах.
+    """
+    starts = list(map(itemgetter(0), busy))
+    ends = list(map(itemgetter(1), busy))
+    passed = 0
+    latest = None  # самый поздний конец среди пройденных интервалов
+
+    free = {}
+    for current in days:
+        rules = hours.for_weekday(current.weekday())
+        if rules is None:
+            free[current] = []
+            continue
+        day_start = _localize(tz, current, rules.start)
+        day_end = _localize(tz, current, rules.end)
+        breaks = [(_localize(tz, current, b_start), _localize(tz, current, b_end)) for b_start, b_end in rules.breaks]
+        slots = []
+        candidate = day_start
+        while (slot_end := candidate + rules.slot) <= day_end:
+            if passed < len(starts) and starts[passed] < slot_end:
+                reached = bisect_left(starts, slot_end, passed)
+                last_end = max(ends[passed:reached])
+                if latest is None or last_end > latest:
+                    latest = last_end
+                passed = reached
+            if ((latest is None or latest <= candidate)
+                    and not (breaks and any(b_start < slot_end and b_end > candidate for b_start, b_end in breaks))):
+                slots.append(candidate)
+            candidate += rules.step
+        free[current] = slots
+    return free
+
+
+def free_slots_by_day(year, month, busy, tz, hours):
+    """
+    Свободные слоты на каждый день year/month: {день: [datetime начала слота, ...]}.
+    busy отсортированы по началу.
+    """
+    days = [date(year, month, day) for day in range(1, calendar.monthrange(year, month)[1] + 1)]
+    return {d.day: slots for d, slots in free_slots(days, busy, tz, hours).items() if slots}
+
+
+def free_slots_on_dates(dates, busy, tz, hours):
+    """Свободные слоты только на даты dates: {date: [datetime, ...]} (пустой список — окон нет)."""
+    return free_slots(sorted(dates), sorted(busy, key=itemgetter(0)), tz, hours)
+
+
+class AvailabilityCache:
+    """
+    Кэш доступности по месяцам: (year, month) → занятые интервалы и свободные слоты.
+
+    Записи живут ttl секунд. create_event/delete_event патчат закэшированный
+    месяц сразу, не дожидаясь истечения TTL. Занятые интервалы хранятся
+    отсортированными по началу: сортировка — один раз при загрузке месяца,
+    пересчёт после патча идёт по готовому порядку. Поколение ключа защищает от
+    ситуации, когда загрузка, начатая до изменения, кладёт в кэш устаревшие данные.
+    """
+
+    def __init__(self, ttl, compute_free):
+        self.ttl = ttl
+        self._compute_free = compute_free  # (year, month, busy по началу) → {день: [datetime, ...]}
+        self._lock = threading.Lock()
+        self._entries = {}  # (year, month) → (busy, free_by_day, stored_at)
+        self._generations = {}
+
+    def get(self, year, month):
+        """Возвращает (busy, free_by_day) или None, если месяца нет в кэше или он устарел."""
+        key = (year, month)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            busy, free_by_day, stored_at = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            return busy, free_by_day
+
+    def begin(self, year, month):
+        """Запоминает поколение месяца перед загрузкой из CalDAV."""
+        with self._lock:
+            return self._generations.get((year, month), 0)
+
+    def put(self, year, month, busy, generation=None):
+        """
+        Кладёт загруженные интервалы в кэш и возвращает свободные слоты.
+        Если после begin() месяц успели изменить — результат не кэшируется.
+        """
+        key = (year, month)
+        busy = sorted(busy, key=itemgetter(0))
+        free_by_day = self._compute_free(year, month, busy)
+        with self._lock:
+            if generation is not None and self._generations.get(key, 0) != generation:
+                logger.debug("Availability %s-%02d изменился во время загрузки, не кэшируем", year, month)
+                return free_by_day
+            self._entries[key] = (busy, free_by_day, time.monotonic())
+        return free_by_day
+
+    def _months_of(self, start, end):
+        months = []
+        y, m = start.year, start.month
+        while (y, m) <= (end.year, end.month):
+            months.append((y, m))
+            y, m = (y + 1, 1) if m == 12 else (y, m + 1)
+        return months
+
+    def _patch(self, start, end, change):
+        for key in self._months_of(start, end):
+            with self._lock:
+                self._generations[key] = self._generations.get(key, 0) + 1
+                entry = self._entries.get(key)
+            if entry is None:
+                continue
+            busy = change(entry[0])
+            if busy is None:
+                self.invalidate(*key)
+                continue
+            free_by_day = self._compute_free(key[0], key[1], busy)
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    self._entries[key] = (busy, free_by_day, entry[2])
+
+    def add_busy(self, start, end):
+        """Добавляет занятый интервал в закэшированные месяцы (после create_event)."""
+        self._patch(start, end, lambda busy: sorted(busy + [(start, end)], key=itemgetter(0)))
+
+    def remove_busy(self, start, end):
+        """Убирает занятый интервал (после delete_event); если его нет в кэше — месяц сбрасывается."""
+        def change(busy):
+            if (start, end) not in busy:
+                return None
+            rest = list(busy)
+            rest.remove((start, end))
+            return rest
+        self._patch(start, end, change)
+
+    def invalidate(self, year=None, month=None):
+        """Сбрасывает один месяц или весь кэш."""
+        with self._lock:
+            if year is None:
+                for key in self._entries:
+                    self._generations[key] = self._generations.get(key, 0) + 1
+                self._entries.clear()
+                return
+            key = (year, month)
+            self._generations[key] = self._generations.get(key, 0) + 1
+            self._entries.pop(key, None)
@@ -0,0 +1,110 @@
+# bench_availability.py
+"""
+Сравнение старого подбора слотов (каждый слот против каждого события)
+с sweep-line движком из availability.py.
+
+Движок работает на интервалах, отсортированных по началу, — так их хранит
+AvailabilityCache. Колонки:
+  sweep    — пересчёт слотов по готовому порядку (после create/delete_event);
+  load     — загрузка месяца в режиме caldav_sync "incremental" (по умолчанию):
+             CalendarIndex.between отдаёт интервалы уже по порядку, sorted()
+             в AvailabilityCache.put проходит их за один линейный проход;
+  unsorted — загрузка в режимах "report"/"freebusy": полная сортировка + sweep.
+
+    python bench_availability.py
+"""
+import calendar
+import random
+import time as tm
+from datetime import date, datetime, time, timedelta
+from operator import itemgetter
+
+import pytz
+
+from availability import WorkingHours, free_slots_by_day
+
+TZ = pytz.timezone("Europe/Moscow")
+
+
+def legacy_free_slots_month(year, month, busy_events, work_from=time(10, 0), work_to=time(22, 0),
+                            slot=timedelta(hours=3), step=timedelta(hours=3)):
+    """
+    Старый алгоритм из IrCalendar.find_free_slots_month (по умолчанию 10:00–22:00, шаг 3 часа):
+    каждый слот проверяется против каждого события дня через any().
+    """
+    busy_by_day = {}
+    for start, end in busy_events:
+        busy_by_day.setdefault(start.date().day, []).append((start, end))
+
+    free_by_day = {}
+    for day in range(1, calendar.monthrange(year, month)[1] + 1):
+        work_start = TZ.localize(datetime.combine(date(year, month, day), work_from))
+        work_end = TZ.localize(datetime.combine(date(year, month, day), work_to))
+        busy_slots = busy_by_day.get(day, [])
+        current = work_start
+        frees = []
+        while current + slot <= work_end:
+            nxt = current + slot
+            if not any(bs < nxt and be > current for bs, be in busy_slots):
+                frees.append(current)
+            current += step
+        if frees:
+            free_by_day[day] = frees
+    return free_by_day
+
+
+def make_events(year, month, count, seed=1):
+    """count событий внутри одного дня месяца, длиной 15 минут – 2 часа."""
+    rnd = random.Random(seed)
+    last_day = calendar.monthrange(year, month)[1]
+    events = []
+    for _ in range(count):
+        day = rnd.randint(1, last_day)
+        start = TZ.localize(datetime(year, month, day, rnd.randint(8, 21), rnd.choice((0, 15, 30, 45))))
+        events.append((start, start + timedelta(minutes=rnd.choice((15, 30, 60, 120)))))
+    return events
+
+
+def bench(fn, *args, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        started = tm.perf_counter()
+        result = fn(*args)
+        best = min(best, tm.perf_counter() - started)
+    return best, result
+
+
+def load_and_sweep(year, month, events, hours):
+    """Загрузка месяца в кэш, как в AvailabilityCache.put: сортировка интервалов + подбор слотов."""
+    return free_slots_by_day(year, month, sorted(events, key=itemgetter(0)), TZ, hours)
+
+
+def compare(year, month, counts, hours, legacy_args=(), repeat=5):
+    print(f"{'events':>8} {'legacy, ms':>11} {'sweep, ms':>10} {'x':>6}"
+          f" {'load, ms':>9} {'x':>6} {'unsorted, ms':>13} {'x':>6}")
+    for count in counts:
+        events = make_events(year, month, count)
+        ordered = sorted(events, key=itemgetter(0))
+        t_old, old = bench(legacy_free_slots_month, year, month, events, *legacy_args, repeat=repeat)
+        t_new, new = bench(free_slots_by_day, year, month, ordered, TZ, hours, repeat=repeat)
+        t_load, loaded = bench(load_and_sweep, year, month, ordered, hours, repeat=repeat)
+        t_raw, raw = bench(load_and_sweep, year, month, events, hours, repeat=repeat)
+        assert old == new == loaded == raw, f"результаты расходятся на {count} событиях"
+        print(f"{count:>8} {t_old * 1000:>11.2f} {t_new * 1000:>10.2f} {t_old / t_new:>5.1f}x"
+              f" {t_load * 1000:>9.2f} {t_old / t_load:>5.1f}x {t_raw * 1000:>13.2f} {t_old / t_raw:>5.1f}x")
+
+
+def main():
+    year, month = 2025, 5
+    print("сетка по умолчанию: слоты по 3 часа, 10:00–22:00")
+    compare(year, month, (0, 10, 100, 1000, 5000, 20000), WorkingHours())
+
+    print("\nслоты по 60 минут с шагом 5 минут, 09:00–21:00")
+    fine = WorkingHours.from_config({"default": {"start": "09:00", "end": "21:00",
+                                                 "slot_minutes": 60, "step_minutes": 5}})
+    legacy_args = (time(9, 0), time(21, 0), timedelta(minutes=60), timedelta(minutes=5))
+    compare(year, month, (100, 1000, 5000, 20000), fine, legacy_args, repeat=3)
+
+
+if __name__ == "__main__":
+    main()
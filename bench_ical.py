@@ -0,0 +1,121 @@
+# bench_ical.py
+"""
+Сравнение разбора событий через icalendar.Calendar.from_ical(...).walk()
+с построчным извлечением из ical_extract.py.
+
+    python bench_ical.py
+"""
+import random
+import time as tm
+from datetime import datetime, timedelta
+
+import pytz
+from icalendar import Calendar
+
+from ical_extract import extract_events
+
+TZ = pytz.timezone("Europe/Moscow")
+
+VTIMEZONE = """BEGIN:VTIMEZONE
+TZID:Europe/Moscow
+BEGIN:STANDARD
+DTSTART:19700101T000000
+TZOFFSETFROM:+0300
+TZOFFSETTO:+0300
+TZNAME:MSK
+END:STANDARD
+END:VTIMEZONE"""
+
+
+def _fold(line):
+    # RFC 5545: строки длиннее 75 октетов переносятся с пробелом в начале продолжения
+    parts = []
+    while len(line.encode("utf-8")) > 75:
+        cut = 60
+        parts.append(line[:cut])
+        line = " " + line[cut:]
+    parts.append(line)
+    return "\r\n".join(parts)
+
+
+def make_event(i, rnd):
+    start = datetime(2031, 9, 1, 10) + timedelta(days=rnd.randint(0, 90), hours=rnd.choice([0, 3, 6, 9]))
+    end = start + timedelta(hours=3)
+    kind = i % 10
+    if kind < 5:
+        dtstart = f"DTSTART;TZID=Europe/Moscow:{start:%Y%m%dT%H%M%S}"
+        dtend = f"DTEND;TZID=Europe/Moscow:{end:%Y%m%dT%H%M%S}"
+    elif kind < 8:
+        utc_start, utc_end = TZ.localize(start).astimezone(pytz.utc), TZ.localize(end).astimezone(pytz.utc)
+        dtstart, dtend = f"DTSTART:{utc_start:%Y%m%dT%H%M%SZ}", f"DTEND:{utc_end:%Y%m%dT%H%M%SZ}"
+    elif kind == 8:
+        dtstart, dtend = f"DTSTART:{start:%Y%m%dT%H%M%S}", f"DTEND:{end:%Y%m%dT%H%M%S}"
+    else:
+        dtstart, dtend = f"DTSTART;VALUE=DATE:{start:%Y%m%d}", f"DTEND;VALUE=DATE:{end + timedelta(days=1):%Y%m%d}"
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:{i:08d}-bench@ir",
+        "DTSTAMP:20310801T120000Z",
+        dtstart,
+        dtend,
+        _fold(f"SUMMARY:+7999{i:07d} Клиентка Номер{i}\\, повторная запись\\; комментарий администратора"),
+        _fold("DESCRIPTION:" + "Подробности визита. " * 8),
+    ]
+    if i % 25 == 0:
+        lines.append("RRULE:FREQ=WEEKLY;COUNT=4")
+    if i % 3 == 0:
+        lines += ["BEGIN:VALARM", "ACTION:DISPLAY", "SUMMARY:Напоминание", "TRIGGER:-PT1H", "END:VALARM"]
+    lines.append("END:VEVENT")
+    return lines
+
+
+def wrap(bodies):
+    return "\r\n".join(["BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//Telegram Bot//", VTIMEZONE]
+                       + bodies + ["END:VCALENDAR", ""])
+
+
+def legacy_parse(data):
+    """Как раньше в get_busy_slots_sync / is_slot_free: полное дерево и обход всех компонентов."""
+    result = []
+    for comp in Calendar.from_ical(data).walk():
+        if comp.name == "VEVENT":
+            result.append((str(comp.get("uid")), str(comp.get("summary")),
+                           comp.get("dtstart").dt, comp.get("dtend").dt))
+    return result
+
+
+def fast_parse(data):
+    return [(e["uid"], e["summary"], e["dtstart"], e["dtend"]) for e in extract_events(data)]
+
+
+def measure(fn, resources, repeat=3):
+    best = None
+    for _ in range(repeat):
+        t0 = tm.perf_counter()
+        for data in resources:
+            fn(data)
+        elapsed = tm.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    print(f"{'events':>7} {'layout':>10} {'icalendar, ms':>14} {'extract, ms':>12} {'speedup':>8}")
+    for n in (100, 300, 600):
+        rnd = random.Random(n)
+        events = [make_event(i, rnd) for i in range(n)]
+        layouts = {
+            # date_search отдаёт каждое событие отдельным ресурсом
+            "resources": [wrap(body) for body in events],
+            "single": [wrap([line for body in events for line in body])],
+        }
+        for name, resources in layouts.items():
+            for data in resources:
+                assert legacy_parse(data) == fast_parse(data), "результаты расходятся"
+            legacy = measure(legacy_parse, resources)
+            fast = measure(fast_parse, resources)
+            print(f"{n:>7} {name:>10} {legacy * 1000:>14.1f} {fast * 1000:>12.1f} {legacy / fast:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
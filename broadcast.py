@@ -0,0 +1,212 @@
+# broadcast.py
+"""
+Рассылка сообщения всем подписчикам.
+
+Сообщения отправляют несколько воркеров, общий RateLimiter держит лимиты
+Telegram: не больше rate сообщений в секунду на бота и одного сообщения
+в per_chat секунд в один чат. На RetryAfter (flood control) пауза ставится
+для всех воркеров сразу, ведь лимит общий для бота.
+
+Кто заблокировал бота (Forbidden) или чей чат исчез, удаляется из подписчиков.
+
+Состояние рассылки (кому уже отправлено) сохраняется в checkpoint-файл,
+поэтому после перезапуска рассылка продолжается с того же места.
+Сообщение, отправленное прямо перед падением и не успевшее попасть
+в checkpoint, может уйти повторно.
+
+Администратор получает сообщение с прогрессом, которое обновляется
+раз в report_interval секунд, и итог со скоростью отправки.
+"""
+import asyncio
+import logging
+import time
+from datetime import timedelta
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+from persistence import PersistentFile
+
+logger = logging.getLogger(__name__)
+
+SENT, BLOCKED, FAILED = "sent", "blocked", "failed"
+
+
+class RateLimiter:
+    """Не больше rate отправок в секунду всего и не чаще раза в per_chat секунд в один чат."""
+
+    def __init__(self, rate=25, per_chat=1.0):
+        self.interval = 1.0 / rate
+        self.per_chat = per_chat
+        self._lock = asyncio.Lock()
+        self._next = 0.0          # время ближайшего свободного общего слота (loop.time())
+        self._paused_until = 0.0
+        self._chat_next = {}
+
+    async def wait(self, chat_id):
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            now = loop.time()
+            at = max(now, self._next, self._paused_until, self._chat_next.get(chat_id, 0.0))
+            self._next = at + self.interval
+            self._chat_next[chat_id] = at + self.per_chat
+        if at > now:
+            await asyncio.sleep(at - now)
+
+    def pause(self, seconds):
+        """Flood control: никто не отправляет ближайшие seconds секунд."""
+        until = asyncio.get_running_loop().time() + seconds
+        self._paused_until = max(self._paused_until, until)
+
+
+def retry_after_seconds(error):
+    delay = error.retry_after
+    return delay.total_seconds() if isinstance(delay, timedelta) else float(delay)
+
+
+class Broadcaster:
+    """Одна рассылка за раз; состояние — в checkpoint_path."""
+
+    def __init__(self, storage, checkpoint_path, workers=8, rate=25, per_chat=1.0,
+                 report_interval=5, max_attempts=5, executor=None):
+        self.storage = storage
+        self.workers = workers
+        self.rate = rate
+        self.per_chat = per_chat
+        self.report_interval = report_interval
+        self.max_attempts = max_attempts
+        self.state = PersistentFile(checkpoint_path, None, executor=executor, delay=1.0)
+        self._task = None
+        self._session_done = 0    # отправлено после (пере)запуска — для скорости
+        self._session_started = 0.0
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    def start(self, bot, text, admin_id):
+        """Начинает рассылку text всем подписчикам; False, если другая рассылка ещё идёт."""
+        if self.running:
+            return False
+        self.state.value = {
+            "text": text,
+            "admin_id": admin_id,
+            "started": time.time(),
+            "finished": None,
+            "recipients": [sub["id"] for sub in self.storage.subscribers()],
+            "done": [],
+            SENT: 0, BLOCKED: 0, FAILED: 0,
+        }
+        self.state.changed()
+        self._task = asyncio.create_task(self._run(bot))
+        return True
+
+    def resume(self, bot):
+        """После перезапуска: продолжает незавершённую рассылку из checkpoint."""
+        job = self.state.value
+        if self.running or not job or job["finished"]:
+            return False
+        logger.info("[Broadcast] Продолжаем рассылку: %d из %d уже обработано",
+                    len(job["done"]), len(job["recipients"]))
+        self._task = asyncio.create_task(self._run(bot))
+        return True
+
+    async def _run(self, bot):
+        job = self.state.value
+        done = set(job["done"])
+        queue = asyncio.Queue()
+        for chat_id in job["recipients"]:
+            if chat_id not in done:
+                queue.put_nowait(chat_id)
+        limiter = RateLimiter(self.rate, self.per_chat)
+        self._session_done = 0
+        self._session_started = time.monotonic()
+
+        progress = await self._send_report(bot, job)
+        reporter = asyncio.create_task(self._report_loop(bot, job, progress))
+        try:
+            await asyncio.gather(*(self._worker(bot, queue, limiter, job) for _ in range(self.workers)))
+        finally:
+            reporter.cancel()
+        job["finished"] = time.time()
+        self.state.changed()
+        await self.state.durable()
+        logger.info("[Broadcast] Завершена: доставлено %d, заблокировали %d, ошибок %d",
+                    job[SENT], job[BLOCKED], job[FAILED])
+        await self._send_report(bot, job, progress)
+
+    async def _worker(self, bot, queue, limiter, job):
+        while True:
+            try:
+                chat_id = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                result = await self._send(bot, limiter, chat_id, job["text"])
+            except Exception:
+                logger.exception("[Broadcast] Ошибка отправки в %s", chat_id)
+                result = FAILED
+            job[result] += 1
+            job["done"].append(chat_id)
+            self._session_done += 1
+            self.state.changed()
+
+    async def _send(self, bot, limiter, chat_id, text):
+        for attempt in range(self.max_attempts):
+            await limiter.wait(chat_id)
+            try:
+                await bot.send_message(chat_id=chat_id, text=text)
+                return SENT
+            except RetryAfter as e:
+                delay = retry_after_seconds(e)
+                logger.warning("[Broadcast] Flood control, пауза %.0f с", delay)
+                limiter.pause(delay)
+            except Forbidden:
+                self.storage.remove_subscriber(chat_id)
+                return BLOCKED
+            except BadRequest as e:
+                if "chat not found" in str(e).lower():
+                    self.storage.remove_subscriber(chat_id)
+                    return BLOCKED
+                logger.warning("[Broadcast] %s: %s", chat_id, e)
+                return FAILED
+            except NetworkError as e:
+                logger.warning("[Broadcast] %s: %s, повтор", chat_id, e)
+                await asyncio.sleep(2 ** attempt)
+        return FAILED
+
+    # ── отчёт администратору ─────────────────────────────────────────────
+    def report_text(self, job):
+        total = len(job["recipients"])
+        processed = len(job["done"])
+        percent = processed * 100 // total if total else 100
+        elapsed = time.monotonic() - self._session_started
+        speed = self._session_done / elapsed if elapsed > 0 else 0.0
+        title = "✅ Рассылка завершена" if job["finished"] else "📣 Рассылка идёт"
+        text = (
+            f"{title}: {processed}/{total} ({percent}%)\n"
+            f"📬 Доставлено: {job[SENT]}\n"
+            f"🚫 Заблокировали бота: {job[BLOCKED]}\n"
+            f"⚠️ Ошибок: {job[FAILED]}\n"
+            f"⚡ {speed:.1f} сообщ./с"
+        )
+        if job["finished"]:
+            text += f"\n⏱ {timedelta(seconds=round(job['finished'] - job['started']))}"
+        return text
+
+    async def _send_report(self, bot, job, message=None):
+        try:
+            if message is None:
+                return await bot.send_message(chat_id=job["admin_id"], text=self.report_text(job))
+            await bot.edit_message_text(chat_id=job["admin_id"], message_id=message.message_id,
+                                        text=self.report_text(job))
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                logger.warning("[Broadcast] Не удалось обновить отчёт: %s", e)
+        except Exception as e:
+            logger.warning("[Broadcast] Не удалось отправить отчёт: %s", e)
+        return message
+
+    async def _report_loop(self, bot, job, message):
+        while message is not None:
+            await asyncio.sleep(self.report_interval)
+            await self._send_report(bot, job, message)
@@ -0,0 +1,160 @@
+# caldav_session.py
+import asyncio
+import logging
+from urllib.parse import urljoin
+
+import httpx
+from lxml import etree
+
+logger = logging.getLogger(__name__)
+
+NS = {"D": "DAV:", "C": "urn:ietf:params:xml:ns:caldav", "CS": "http://calendarserver.org/ns/"}
+
+PRINCIPAL_PROPFIND = """<?xml version="1.0" encoding="utf-8"?>
+<D:propfind xmlns:D="DAV:"><D:prop><D:current-user-principal/></D:prop></D:propfind>"""
+
+HOME_SET_PROPFIND = """<?xml version="1.0" encoding="utf-8"?>
+<D:propfind xmlns:D="DAV:" xmlns:C="urn:ietf:params:xml:ns:caldav">
+  <D:prop><C:calendar-home-set/></D:prop>
+</D:propfind>"""
+
+CALENDARS_PROPFIND = """<?xml version="1.0" encoding="utf-8"?>
+<D:propfind xmlns:D="DAV:"><D:prop><D:displayname/><D:resourcetype/></D:prop></D:propfind>"""
+
+
+class CalDAVError(Exception):
+    """Сервер CalDAV ответил ошибкой."""
+
+    def __init__(self, method, url, status):
+        super().__init__(f"{method} {url}: {status}")
+        self.method = method
+        self.url = url
+        self.status = status
+
+
+class NotFoundError(CalDAVError):
+    """404 на URL календаря — календарь переехал или удалён."""
+
+
+def parse_xml(response):
+    """Тело ответа как XML-дерево (None, если тело пустое или не XML)."""
+    if not response.content:
+        return None
+    try:
+        return etree.fromstring(response.content)
+    except etree.XMLSyntaxError:
+        return None
+
+
+class CalDAVSession:
+    """
+    Долгоживущее асинхронное подключение к CalDAV на весь процесс.
+
+    Держит один httpx.AsyncClient (keep-alive пул соединений), один раз находит
+    календарь по имени и дальше ходит сразу по его URL. Повторный поиск
+    календаря — только если сервер ответил 404 или редиректом.
+    Ни один запрос не блокирует event loop и не занимает поток.
+    """
+
+    def __init__(self, url, username, password, calendar_name, pool_size=10, timeout=30, executor=None):
+        self.url = url if url.endswith("/") else url + "/"
+        self.username = username
+        self.password = password
+        self.calendar_name = calendar_name
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.executor = executor  # BoundedExecutor: лимит и очередь запросов к серверу
+        self._lock = asyncio.Lock()
+        self._client = None
+        self._loop = None
+        self._calendar_url = None
+        self._moved = False
+
+    def _build_client(self):
+        return httpx.AsyncClient(
+            auth=httpx.BasicAuth(self.username, self.password),
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+            follow_redirects=True,
+        )
+
+    @property
+    def client(self):
+        # соединения пула привязаны к event loop'у, в котором созданы
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._client = self._build_client()
+            self._loop = loop
+        return self._client
+
+    async def request(self, method, url, body=None, depth=None, headers=None):
+        """Один HTTP-запрос к серверу. Ошибки статуса не бросает — это решает вызывающий."""
+        if self.executor is not None:
+            return await self.executor.run(self._send, method, url, body, depth, headers)
+        return await self._send(method, url, body, depth, headers)
+
+    async def _send(self, method, url, body, depth, headers):
+        headers = dict(headers or {})
+        if depth is not None:
+            headers["Depth"] = str(depth)
+        if body is not None and "Content-Type" not in headers:
+            headers["Content-Type"] = "application/xml; charset=utf-8"
+        response = await self.client.request(method, url, content=body, headers=headers)
+        if response.history and self._calendar_url is not None:
+            # Сервер перенаправил запрос — значит календарь переехал, при следующем обращении ищем заново
+            logger.info("CalDAV: редирект %s → %s, календарь будет найден заново",
+                        response.history[0].url, response.url)
+            self._moved = True
+        return response
+
+    async def _propfind_href(self, url, body, path):
+        response = await self.request("PROPFIND", url, body, depth=0)
+        tree = parse_xml(response) if response.status_code < 400 else None
+        href = tree.findtext(path, namespaces=NS) if tree is not None else None
+        return urljoin(str(response.url), href) if href else url
+
+    async def _discover(self):
+        principal = await self._propfind_href(self.url, PRINCIPAL_PROPFIND, ".//D:current-user-principal/D:href")
+        home = await self._propfind_href(principal, HOME_SET_PROPFIND, ".//C:calendar-home-set/D:href")
+        response = await self.request("PROPFIND", home, CALENDARS_PROPFIND, depth=1)
+        if response.status_code >= 400:
+            raise CalDAVError("PROPFIND", home, response.status_code)
+        tree = parse_xml(response)
+        for resp in tree.findall("D:response", namespaces=NS) if tree is not None else ():
+            if resp.find(".//D:resourcetype/C:calendar", namespaces=NS) is None:
+                continue
+            if resp.findtext(".//D:displayname", namespaces=NS) == self.calendar_name:
+                url = urljoin(str(response.url), resp.findtext("D:href", namespaces=NS))
+                logger.info("CalDAV: календарь '%s' найден: %s", self.calendar_name, url)
+                return url
+        raise Exception(f"Calendar '{self.calendar_name}' not found")
+
+    async def calendar(self):
+        """Возвращает URL календаря, при необходимости находит его на сервере."""
+        async with self._lock:
+            if self._calendar_url is None or self._moved:
+                self._moved = False
+                self._calendar_url = await self._discover()
+            return self._calendar_url
+
+    def invalidate(self):
+        """Сбрасывает найденный URL календаря."""
+        self._calendar_url = None
+
+    async def run(self, fn):
+        """
+        Выполняет await fn(calendar_url) на общем подключении.
+        Если сервер ответил 404 — календарь ищется заново и вызов повторяется один раз.
+        """
+        try:
+            return await fn(await self.calendar())
+        except NotFoundError:
+            logger.warning("CalDAV: календарь не найден по сохранённому URL, ищем заново")
+            self.invalidate()
+            return await fn(await self.calendar())
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+        self._client = None
+        self._calendar_url = None
@@ -0,0 +1,454 @@
+# caldav_sync.py
+import asyncio
+import logging
+from bisect import bisect_left
+from datetime import date, datetime, time, timedelta
+from operator import itemgetter
+from urllib.parse import quote, unquote, urljoin, urlsplit
+
+import pytz
+import recurring_ical_events
+from icalendar import Calendar
+
+from caldav_session import NS, CalDAVError, NotFoundError, parse_xml
+from ical_extract import extract_events
+
+logger = logging.getLogger(__name__)
+
+CTAG_PROPFIND = """<?xml version="1.0" encoding="utf-8"?>
+<D:propfind xmlns:D="DAV:" xmlns:CS="http://calendarserver.org/ns/">
+  <D:prop><CS:getctag/><D:sync-token/></D:prop>
+</D:propfind>"""
+
+ETAGS_PROPFIND = """<?xml version="1.0" encoding="utf-8"?>
+<D:propfind xmlns:D="DAV:">
+  <D:prop><D:getetag/></D:prop>
+</D:propfind>"""
+
+SYNC_COLLECTION = """<?xml version="1.0" encoding="utf-8"?>
+<D:sync-collection xmlns:D="DAV:">
+  <D:sync-token>{token}</D:sync-token>
+  <D:sync-level>1</D:sync-level>
+  <D:prop><D:getetag/></D:prop>
+</D:sync-collection>"""
+
+MULTIGET = """<?xml version="1.0" encoding="utf-8"?>
+<C:calendar-multiget xmlns:D="DAV:" xmlns:C="urn:ietf:params:xml:ns:caldav">
+  <D:prop><D:getetag/><C:calendar-data/></D:prop>
+{hrefs}
+</C:calendar-multiget>"""
+
+CALENDAR_QUERY = """<?xml version="1.0" encoding="utf-8"?>
+<C:calendar-query xmlns:D="DAV:" xmlns:C="urn:ietf:params:xml:ns:caldav">
+  <D:prop><D:getetag/><C:calendar-data/></D:prop>
+  <C:filter>
+    <C:comp-filter name="VCALENDAR">
+      <C:comp-filter name="VEVENT"><C:time-range start="{start}" end="{end}"/></C:comp-filter>
+    </C:comp-filter>
+  </C:filter>
+</C:calendar-query>"""
+
+FREE_BUSY_QUERY = """<?xml version="1.0" encoding="utf-8"?>
+<C:free-busy-query xmlns:C="urn:ietf:params:xml:ns:caldav">
+  <C:time-range start="{start}" end="{end}"/>
+</C:free-busy-query>"""
+
+MULTIGET_CHUNK = 200
+
+
+class SyncTokenInvalid(Exception):
+    """Сервер не принял сохранённый sync-token — нужна полная синхронизация."""
+
+
+class FreeBusyUnsupported(Exception):
+    """Сервер не умеет CALDAV:free-busy-query — нужно читать VEVENT'ы."""
+
+
+def _xml_escape(text):
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def _utc(value):
+    return value.astimezone(pytz.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def _status_code(status_text):
+    # "HTTP/1.1 404 Not Found" → 404
+    parts = (status_text or "").split()
+    return int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 200
+
+
+def parse_collection_props(tree):
+    """Из ответа PROPFIND depth 0 достаёт (ctag, sync-token)."""
+    if tree is None:
+        return None, None
+    ctag = tree.findtext(".//CS:getctag", namespaces=NS)
+    token = tree.findtext(".//D:prop/D:sync-token", namespaces=NS)
+    return ctag or None, token or None
+
+
+def parse_freebusy(data):
+    """
+    Из VCALENDAR с VFREEBUSY достаёт занятые периоды [(start, end), ...] (UTC).
+    FBTYPE=FREE пропускается; период вида start/PT1H превращается в start/end.
+    """
+    busy = []
+    for comp in Calendar.from_ical(data).walk("VFREEBUSY"):
+        periods = comp.get("freebusy", [])
+        if not isinstance(periods, list):
+            periods = [periods]
+        for period in periods:
+            if str(period.params.get("FBTYPE", "BUSY")).upper() == "FREE":
+                continue
+            start, end = period.dt
+            if isinstance(end, timedelta):
+                end = start + end
+            busy.append((start, end))
+    return busy
+
+
+def parse_multistatus(tree, collection_href=None):
+    """
+    Разбирает multistatus: возвращает ({href: etag} изменённых, {href удалённых}, sync-token, {href: calendar-data}).
+    Ответ о самой коллекции (href == collection_href) пропускается.
+    """
+    changed, deleted, data = {}, set(), {}
+    if tree is None:
+        return changed, deleted, None, data
+    for resp in tree.findall("D:response", namespaces=NS):
+        href = unquote(resp.findtext("D:href", default="", namespaces=NS))
+        if not href or (collection_href and href.rstrip("/") == unquote(collection_href).rstrip("/")):
+            continue
+        if _status_code(resp.findtext("D:status", namespaces=NS)) == 404:
+            deleted.add(href)
+            continue
+        for propstat in resp.findall("D:propstat", namespaces=NS):
+            if _status_code(propstat.findtext("D:status", namespaces=NS)) != 200:
+                continue
+            etag = propstat.findtext("D:prop/D:getetag", namespaces=NS)
+            if etag is not None:
+                changed[href] = etag
+            cdata = propstat.findtext("D:prop/C:calendar-data", namespaces=NS)
+            if cdata:
+                data[href] = cdata
+    token = tree.findtext("D:sync-token", namespaces=NS)
+    return changed, deleted, token, data
+
+
+async def calendar_query(session, start, end):
+    """
+    REPORT calendar-query: события, пересекающие [start, end).
+    Возвращает {href: (etag, calendar-data)}; повторы не развёрнуты — см. busy_intervals().
+    """
+    body = CALENDAR_QUERY.format(start=_utc(start), end=_utc(end))
+
+    async def query(calendar_url):
+        response = await session.request("REPORT", calendar_url, body, depth=1)
+        if response.status_code == 404:
+            raise NotFoundError("REPORT", calendar_url, 404)
+        if response.status_code >= 400:
+            raise CalDAVError("REPORT", calendar_url, response.status_code)
+        etags, _, _, data = parse_multistatus(parse_xml(response), urlsplit(calendar_url).path)
+        return {urljoin(calendar_url, quote(href)): (etags.get(href), cdata) for href, cdata in data.items()}
+
+    return await session.run(query)
+
+
+def _localize(value, tz):
+    """datetime → aware (floating — в tz); date события на весь день → полночь этой даты в tz."""
+    if isinstance(value, datetime):
+        return value if value.tzinfo else tz.localize(value)
+    if isinstance(value, date):
+        return tz.localize(datetime.combine(value, time()))
+    return None
+
+
+def _interval(dtstart, dtend, tz):
+    """
+    (начало, конец) события или None. Без DTEND событие на весь день длится
+    сутки, остальные — ноль (RFC 5545, 3.6.1).
+    """
+    if dtstart is None:
+        return None
+    if dtend is None:
+        all_day = isinstance(dtstart, date) and not isinstance(dtstart, datetime)
+        dtend = dtstart + timedelta(days=1) if all_day else dtstart
+    start, end = _localize(dtstart, tz), _localize(dtend, tz)
+    return (start, end) if start and end else None
+
+
+def _components(ical, start, end):
+    """Развёрнутые повторы разобранного VCALENDAR в [start, end) — в том же виде, что extract_events()."""
+    for comp in recurring_ical_events.of(ical).between(start, end):
+        yield {"dtstart": comp.get("dtstart").dt, "dtend": comp.get("dtend").dt if comp.get("dtend") else None,
+               "transp": str(comp.get("transp")).upper() if comp.get("transp") else None}
+
+
+def busy_intervals(data, tz, start, end):
+    """
+    Занятые интервалы (dtstart, dtend) одного ресурса, пересекающие [start, end),
+    по правилам free-busy: повторяющиеся события разворачиваются, события
+    с TRANSP:TRANSPARENT не занимают время, события на весь день занимают
+    свои даты целиком (с полуночи до полуночи в tz).
+    """
+    items = extract_events(data)
+    if any(item["recurring"] for item in items):
+        items = _components(Calendar.from_ical(data), start, end)
+    busy = []
+    for item in items:
+        if item["transp"] == "TRANSPARENT":
+            continue
+        interval = _interval(item["dtstart"], item["dtend"], tz)
+        if interval and interval[0] < end and interval[1] > start:
+            busy.append(interval)
+    return busy
+
+
+class CalendarIndex:
+    """
+    Локальный индекс событий календаря: href → (etag, uid, разобранный VCALENDAR).
+
+    refresh() сначала одним PROPFIND сверяет ctag/sync-token коллекции; если
+    ничего не менялось — на этом всё. Иначе забирает только изменения:
+    REPORT sync-collection (RFC 6578) с сохранённым токеном, а если сервер его
+    не поддерживает — список etag'ов. Изменённые события догружаются
+    calendar-multiget'ом, удалённые выбрасываются из индекса.
+
+    Интервалы неповторяющихся событий дополнительно лежат в _timeline,
+    упорядоченные по началу, — between() отдаёт их уже отсортированными.
+    """
+
+    def __init__(self, session, tz):
+        self.session = session
+        self.tz = tz
+        self._lock = asyncio.Lock()
+        self._events = {}      # href → {"etag", "uid", "ical", "recurring", "intervals"}
+        self._by_uid = {}      # uid → href
+        self._timeline = []    # (dtstart, dtend) неповторяющихся событий по началу
+        self._marker = None    # ctag / sync-token коллекции на момент последней синхронизации
+        self._sync_token = None
+        self._sync_supported = True
+
+    # ── запросы к серверу ────────────────────────────────────────────────
+    async def _request(self, calendar_url, method, body, depth):
+        response = await self.session.request(method, calendar_url, body, depth=depth)
+        if response.status_code == 404:
+            raise NotFoundError(method, calendar_url, 404)
+        return response
+
+    async def _collection_marker(self, calendar_url):
+        response = await self._request(calendar_url, "PROPFIND", CTAG_PROPFIND, 0)
+        if response.status_code >= 400:
+            return None
+        ctag, token = parse_collection_props(parse_xml(response))
+        return ctag or token
+
+    async def _sync_collection(self, calendar_url):
+        body = SYNC_COLLECTION.format(token=_xml_escape(self._sync_token or ""))
+        response = await self._request(calendar_url, "REPORT", body, 1)
+        # 403/409 valid-sync-token — токен устарел
+        if response.status_code in (403, 409) and self._sync_token:
+            raise SyncTokenInvalid()
+        if response.status_code >= 400:
+            raise CalDAVError("REPORT sync-collection", calendar_url, response.status_code)
+        return parse_multistatus(parse_xml(response), urlsplit(calendar_url).path)
+
+    async def _list_etags(self, calendar_url):
+        response = await self._request(calendar_url, "PROPFIND", ETAGS_PROPFIND, 1)
+        if response.status_code >= 400:
+            raise CalDAVError("PROPFIND getetag", calendar_url, response.status_code)
+        etags, _, _, _ = parse_multistatus(parse_xml(response), urlsplit(calendar_url).path)
+        return etags
+
+    async def _multiget(self, calendar_url, hrefs):
+        result = {}
+        hrefs = sorted(hrefs)
+        for i in range(0, len(hrefs), MULTIGET_CHUNK):
+            chunk = hrefs[i:i + MULTIGET_CHUNK]
+            body = MULTIGET.format(hrefs="\n".join(f"  <D:href>{_xml_escape(quote(h))}</D:href>" for h in chunk))
+            response = await self._request(calendar_url, "REPORT", body, 1)
+            if response.status_code >= 400:
+                raise CalDAVError("REPORT calendar-multiget", calendar_url, response.status_code)
+            etags, _, _, data = parse_multistatus(parse_xml(response), urlsplit(calendar_url).path)
+            for href, cdata in data.items():
+                result[href] = (etags.get(href), cdata)
+        return result
+
+    # ── индекс ───────────────────────────────────────────────────────────
+    def _index_entry(self, etag, data):
+        uid, recurring, intervals = None, False, []
+        for item in extract_events(data):
+            uid = uid or item["uid"]
+            recurring = recurring or item["recurring"]
+            interval = _interval(item["dtstart"], item["dtend"], self.tz)
+            if interval and item["transp"] != "TRANSPARENT":
+                intervals.append(interval)
+        # полное дерево нужно только для разворота повторов в between()
+        ical = Calendar.from_ical(data) if recurring else None
+        return {"etag": etag, "uid": uid, "ical": ical, "recurring": recurring, "intervals": intervals}
+
+    def _add(self, href, entry):
+        self._events[href] = entry
+        if entry["uid"]:
+            self._by_uid[entry["uid"]] = href
+        if not entry["recurring"]:
+            self._timeline.extend(entry["intervals"])
+
+    def _drop(self, href):
+        entry = self._events.pop(href, None)
+        if entry is None:
+            return
+        if entry["uid"] and self._by_uid.get(entry["uid"]) == href:
+            del self._by_uid[entry["uid"]]
+        if not entry["recurring"]:
+            for interval in entry["intervals"]:
+                i = bisect_left(self._timeline, interval)
+                if i < len(self._timeline) and self._timeline[i] == interval:
+                    del self._timeline[i]
+
+    async def _apply(self, calendar_url, changed, deleted):
+        for href in deleted & set(self._events):
+            self._drop(href)
+        stale = [href for href, etag in changed.items()
+                 if href not in self._events or self._events[href]["etag"] != etag]
+        if not stale:
+            return 0
+        fetched = await self._multiget(calendar_url, stale)
+        for href in fetched:
+            self._drop(href)
+        for href, (etag, data) in fetched.items():
+            try:
+                entry = self._index_entry(etag, data)
+            except Exception as e:
+                logger.warning("CalDAV sync: не удалось разобрать %s: %s", href, e)
+                continue
+            self._add(href, entry)
+        # новые интервалы дописаны в хвост — timsort сливает их с упорядоченной частью
+        self._timeline.sort()
+        return len(stale)
+
+    async def _refresh(self, calendar_url):
+        marker = await self._collection_marker(calendar_url)
+        if marker is not None and marker == self._marker:
+            return False
+
+        if self._sync_supported:
+            full = self._sync_token is None
+            try:
+                result = await self._sync_collection(calendar_url)
+            except SyncTokenInvalid:
+                logger.info("CalDAV sync: sync-token отклонён сервером, полная синхронизация")
+                self._sync_token, full = None, True
+                result = await self._sync_collection(calendar_url)
+            except CalDAVError as e:
+                if isinstance(e, NotFoundError):
+                    raise
+                logger.info("CalDAV sync: sync-collection не поддерживается (%s), сверяем etag'и", e)
+                self._sync_supported, result = False, None
+            if result is not None:
+                changed, deleted, token, _ = result
+                if full:
+                    deleted |= set(self._events) - set(changed)
+                deleted &= set(self._events)
+                fetched = await self._apply(calendar_url, changed, deleted)
+                self._sync_token = token
+                self._marker = marker
+                logger.info("CalDAV sync: %d изменено, %d удалено, в индексе %d",
+                            fetched, len(deleted), len(self._events))
+                return True
+
+        etags = await self._list_etags(calendar_url)
+        deleted = set(self._events) - set(etags)
+        fetched = await self._apply(calendar_url, etags, deleted)
+        self._marker = marker
+        logger.info("CalDAV sync (etag): %d изменено, %d удалено, в индексе %d",
+                    fetched, len(deleted), len(self._events))
+        return True
+
+    async def refresh(self):
+        """Подтягивает изменения с сервера. Возвращает True, если что-то изменилось."""
+        async with self._lock:
+            return await self.session.run(self._refresh)
+
+    def reset(self):
+        self._events.clear()
+        self._by_uid.clear()
+        self._timeline.clear()
+        self._marker = None
+        self._sync_token = None
+
+    def href_by_uid(self, uid):
+        return self._by_uid.get(uid)
+
+    def between(self, start, end):
+        """
+        Занятые интервалы (dtstart, dtend), пересекающие [start, end), с разворотом
+        повторов — отсортированные по началу.
+        """
+        busy = [(s, e) for s, e in self._timeline[:bisect_left(self._timeline, (end,))] if e > start]
+        expanded = []
+        for entry in list(self._events.values()):
+            if not entry["recurring"]:
+                continue
+            for item in _components(entry["ical"], start, end):
+                interval = _interval(item["dtstart"], item["dtend"], self.tz)
+                if interval and item["transp"] != "TRANSPARENT":
+                    expanded.append(interval)
+        if expanded:
+            # timsort сливает готовый отсортированный кусок с развёрнутыми повторами
+            busy.extend(expanded)
+            busy.sort(key=itemgetter(0))
+        return busy
+
+
+UNSUPPORTED_STATUSES = (403, 405, 501)  # free-busy-query запрещён или не реализован
+
+
+class FreeBusyQuery:
+    """
+    Занятость через REPORT free-busy-query (RFC 4791, 7.10): сервер сам
+    разворачивает повторы и отдаёт только периоды FREEBUSY, без тел событий.
+
+    Если сервер такой отчёт не поддерживает, это запоминается, и дальше
+    busy() сразу бросает FreeBusyUnsupported — вызывающий читает VEVENT'ы.
+    """
+
+    def __init__(self, session, tz):
+        self.session = session
+        self.tz = tz
+        self.supported = None  # None — ещё не проверяли
+
+    async def _query(self, calendar_url, body):
+        response = await self.session.request("REPORT", calendar_url, body, depth=1)
+        if response.status_code == 404:
+            raise NotFoundError("REPORT free-busy-query", calendar_url, 404)
+        if response.status_code >= 400:
+            raise CalDAVError("REPORT free-busy-query", calendar_url, response.status_code)
+        return response.text
+
+    async def busy(self, start, end):
+        """Занятые интервалы в [start, end) в часовом поясе tz."""
+        if self.supported is False:
+            raise FreeBusyUnsupported()
+        body = FREE_BUSY_QUERY.format(start=_utc(start), end=_utc(end))
+        try:
+            data = await self.session.run(lambda calendar_url: self._query(calendar_url, body))
+            periods = parse_freebusy(data)
+        except NotFoundError:
+            raise
+        except CalDAVError as e:
+            if e.status not in UNSUPPORTED_STATUSES:
+                # 5xx и прочие сбои — временные: этот раз читаем VEVENT'ы, режим не меняем
+                logger.warning("CalDAV free-busy-query: %s, в этот раз читаем VEVENT'ы", e)
+                raise FreeBusyUnsupported(str(e))
+            self._unsupported(e)
+        except ValueError as e:
+            self._unsupported(e)  # ответ не VFREEBUSY
+        self.supported = True
+        return [(b_start.astimezone(self.tz), b_end.astimezone(self.tz)) for b_start, b_end in periods]
+
+    def _unsupported(self, error):
+        """403/405/501 или ответ не VFREEBUSY — отчёт не поддерживается до перезапуска."""
+        logger.info("CalDAV free-busy-query не поддерживается (%s), читаем VEVENT'ы", error)
+        self.supported = False
+        raise FreeBusyUnsupported(str(error))
@@ -0,0 +1,102 @@
+# executors.py
+import asyncio
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class ExecutorBusy(Exception):
+    """Очередь исполнителя заполнена — задача отклонена, а не поставлена в хвост."""
+
+
+class BoundedExecutor:
+    """
+    Именованный исполнитель со своим лимитом одновременных задач и ограниченной очередью.
+
+    Каждому виду работы — свой исполнитель (CalDAV, git, CPU), чтобы медленный
+    сервер календаря не занимал потоки, нужные правке прайса или сохранению профиля.
+    Если в очереди уже max_queue задач, run() сразу бросает ExecutorBusy.
+
+    threads=True — fn блокирующая и выполняется в собственном пуле потоков;
+    threads=False — fn корутина, исполнитель только ограничивает параллелизм.
+    """
+
+    def __init__(self, name, workers, max_queue, threads=True):
+        self.name = name
+        self.workers = workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix=name) if threads else None
+        self._slots = asyncio.Semaphore(workers)
+        self.queued = 0        # ждут свободного места сейчас
+        self.running = 0
+        self.max_queued = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.wait_total = 0.0  # суммарное ожидание в очереди, секунд
+        self.wait_max = 0.0
+
+    async def run(self, fn, *args, **kwargs):
+        """Выполняет fn(*args, **kwargs), дождавшись свободного места в исполнителе."""
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            raise ExecutorBusy(f"{self.name}: очередь заполнена ({self.queued} задач)")
+        self.submitted += 1
+        queued_at = time.monotonic()
+        self.queued += 1
+        self.max_queued = max(self.max_queued, self.queued)
+        try:
+            await self._slots.acquire()
+        finally:
+            self.queued -= 1
+        waited = time.monotonic() - queued_at
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+
+        self.running += 1
+        try:
+            if self._pool is None:
+                return await fn(*args, **kwargs)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._pool, functools.partial(fn, *args, **kwargs))
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.running -= 1
+            self.completed += 1
+            self._slots.release()
+
+    def stats(self):
+        started = self.submitted - self.queued
+        return {
+            "name": self.name,
+            "workers": self.workers,
+            "running": self.running,
+            "queued": self.queued,
+            "max_queued": self.max_queued,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "wait_avg": self.wait_total / started if started else 0.0,
+            "wait_max": self.wait_max,
+        }
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+
+
+def log_stats(executors):
+    """Одна строка в лог на каждый исполнитель."""
+    for executor in executors:
+        s = executor.stats()
+        logger.info("[Executor %s] running %d/%d, queued %d (max %d), done %d, failed %d, rejected %d, "
+                    "wait avg %.3f c / max %.3f c",
+                    s["name"], s["running"], s["workers"], s["queued"], s["max_queued"],
+                    s["completed"], s["failed"], s["rejected"], s["wait_avg"], s["wait_max"])
@@ -0,0 +1,164 @@
+# ical_extract.py
+"""
+Быстрое извлечение из iCalendar-текста только того, что читают горячие пути бота:
+DTSTART, DTEND, TZID, SUMMARY, UID, TRANSP и наличие повторов (RRULE/RDATE/RECURRENCE-ID).
+
+Текст разбирается построчно, без построения дерева icalendar.Calendar.
+Всё нестандартное (DURATION вместо DTEND, неизвестный TZID, VALUE=PERIOD,
+кривой формат даты) уходит в icalendar — результат тот же, просто медленнее.
+"""
+import re
+from datetime import date, datetime
+
+import pytz
+from icalendar import Calendar
+
+_UNFOLD = re.compile(r"\r?\n[ \t]")
+# NAME;PARAM=...;PARAM="...:...":VALUE — двоеточие внутри кавычек значением не считается
+_CONTENT_LINE = re.compile(r'([A-Za-z0-9-]+)((?:;[^:;"]*=(?:"[^"]*"|[^:;"]*))*):(.*)')
+_TEXT_UNESCAPE = re.compile(r"\\([\\;,nN])")
+
+_RECURRENCE = ("RRULE", "RDATE", "RECURRENCE-ID")
+_WANTED = ("DTSTART", "DTEND", "DURATION", "SUMMARY", "UID", "TRANSP") + _RECURRENCE
+_HEAD = max(map(len, _WANTED))  # сколько символов строки хватает, чтобы узнать имя
+
+_zones = {}  # TZID → pytz-зона (или None, если такой зоны нет)
+
+
+class _Unusual(Exception):
+    """Строка, которую быстрый разбор не берётся понимать — идём в icalendar."""
+
+
+def _zone(tzid):
+    if tzid not in _zones:
+        try:
+            _zones[tzid] = pytz.timezone(tzid)
+        except pytz.UnknownTimeZoneError:
+            # свой VTIMEZONE (Outlook, /mozilla.org/...) — разбирает только icalendar
+            _zones[tzid] = None
+    zone = _zones[tzid]
+    if zone is None:
+        raise _Unusual(tzid)
+    return zone
+
+
+def _params(raw):
+    params = {}
+    for part in raw[1:].split(";") if raw else ():
+        key, _, value = part.partition("=")
+        params[key.upper()] = value.strip('"')
+    return params
+
+
+def _parse_value(value, params):
+    """
+    20311201T070000Z → datetime UTC, 20311201T070000 + TZID → datetime в зоне,
+    без TZID → naive (floating), 20311201 → date.
+    """
+    kind = params.get("VALUE", "DATE-TIME").upper()
+    if kind == "DATE" or (len(value) == 8 and kind == "DATE-TIME" and value.isdigit()):
+        if len(value) != 8:
+            raise _Unusual(value)
+        return date(int(value[:4]), int(value[4:6]), int(value[6:8]))
+    if kind != "DATE-TIME" or len(value) not in (15, 16) or value[8] != "T":
+        raise _Unusual(value)
+    dt = datetime(int(value[:4]), int(value[4:6]), int(value[6:8]),
+                  int(value[9:11]), int(value[11:13]), int(value[13:15]))
+    if len(value) == 16:
+        if value[15] != "Z":
+            raise _Unusual(value)
+        return pytz.utc.localize(dt)
+    tzid = params.get("TZID")
+    return _zone(tzid).localize(dt) if tzid else dt
+
+
+def _new_event():
+    return {"uid": None, "summary": None, "dtstart": None, "dtend": None, "tzid": None, "transp": None,
+            "recurring": False}
+
+
+def _extract_fast(text):
+    events = []
+    event = None
+    depth = 0  # вложенные компоненты внутри VEVENT (VALARM и т.п.)
+    for line in _UNFOLD.sub("", text).splitlines():
+        # имена свойств и компонентов регистронезависимы (RFC 5545, 3.1)
+        head = line[:_HEAD].upper()
+        if head.startswith("BEGIN:"):
+            if event is not None:
+                depth += 1
+            elif line[6:].strip().upper() == "VEVENT":
+                event, depth = _new_event(), 0
+            continue
+        if head.startswith("END:"):
+            if event is None:
+                continue
+            if depth:
+                depth -= 1
+            else:
+                events.append(event)
+                event = None
+            continue
+        if event is None or depth or not head.startswith(_WANTED):
+            continue
+
+        match = _CONTENT_LINE.match(line)
+        if match is None:
+            raise _Unusual(line)
+        name, raw_params, value = match.groups()
+        name = name.upper()
+        if name in _RECURRENCE:
+            event["recurring"] = True
+        elif name == "UID":
+            event["uid"] = value
+        elif name == "TRANSP":
+            event["transp"] = value.strip().upper()
+        elif name == "SUMMARY":
+            event["summary"] = _TEXT_UNESCAPE.sub(
+                lambda m: "\n" if m.group(1) in "nN" else m.group(1), value)
+        elif name == "DURATION":
+            # DURATION вместо DTEND — пусть считает icalendar
+            raise _Unusual(line)
+        elif name in ("DTSTART", "DTEND"):
+            params = _params(raw_params)
+            event[name.lower()] = _parse_value(value, params)
+            if name == "DTSTART":
+                event["tzid"] = params.get("TZID")
+    if event is not None:
+        raise _Unusual("VEVENT без END")
+    return events
+
+
+def _extract_icalendar(text):
+    events = []
+    for comp in Calendar.from_ical(text).walk("VEVENT"):
+        event = _new_event()
+        event["uid"] = str(comp["uid"]) if comp.get("uid") else None
+        event["summary"] = str(comp["summary"]) if comp.get("summary") else None
+        event["transp"] = str(comp["transp"]).upper() if comp.get("transp") else None
+        event["recurring"] = any(comp.get(name) for name in _RECURRENCE)
+        if comp.get("dtstart"):
+            event["dtstart"] = comp["dtstart"].dt
+            event["tzid"] = comp["dtstart"].params.get("TZID")
+        if comp.get("dtend"):
+            event["dtend"] = comp["dtend"].dt
+        elif event["dtstart"] is not None and comp.get("duration"):
+            event["dtend"] = event["dtstart"] + comp["duration"].dt
+        events.append(event)
+    return events
+
+
+def extract_events(data):
+    """
+    Разбирает VCALENDAR (str или bytes) и возвращает по словарю на каждый VEVENT:
+    {"uid", "summary", "dtstart", "dtend", "tzid", "transp", "recurring"}.
+
+    dtstart/dtend — datetime (с зоной, если она указана, иначе naive), date для
+    событий на весь день или None, если свойства нет. transp — "OPAQUE",
+    "TRANSPARENT" или None (свойства нет — по RFC 5545 это OPAQUE).
+    """
+    text = data.decode("utf-8") if isinstance(data, bytes) else data
+    try:
+        return _extract_fast(text)
+    except (_Unusual, ValueError):
+        return _extract_icalendar(text)
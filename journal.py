@@ -0,0 +1,313 @@
+# journal.py
+"""
+Заявки и лист ожидания в памяти + журнал изменений (JSON lines) на диске.
+
+Каждое изменение — одна строка в конце журнала, файл целиком не переписывается.
+fsync делается пачкой: фоновый поток сбрасывает всё накопленное раз в
+fsync_interval секунд, поэтому частые изменения не ждут диска по одному.
+
+При старте состояние собирается из последнего снимка (snapshot) и хвоста журнала.
+Когда журнал вырастает больше compact_bytes, в фоне пишется новый снимок,
+а журнал начинается заново.
+
+Подписчики, открытые месяцы, отложенные действия и служебные отметки
+остаются в JSON-файлах (files).
+"""
+import copy
+import json
+import logging
+import os
+import threading
+
+from storage import BookingIndex, Storage
+
+logger = logging.getLogger(__name__)
+
+
+class JournalStorage(Storage):
+    """
+    Записи журнала: {"seq": 17, "op": "created", "booking": {...}}
+                    {"seq": 18, "op": "confirmed", "id": "...", "fields": {"status": "confirmed"}}
+                    {"seq": 19, "op": "waitlist_join", "date": "2031-09-12", "user_id": "42"}
+    op для изменения заявки — новый статус (confirmed, rejected, cancelled) или "updated".
+    """
+
+    def __init__(self, path, snapshot_path, files, compact_bytes=1_000_000, fsync_interval=0.05, executor=None):
+        self.path = path
+        self.snapshot_path = snapshot_path
+        self.files = files  # JsonStorage: подписчики и открытые месяцы
+        self.executor = executor  # BoundedExecutor с потоками: fsync по durable()
+        self.compact_bytes = compact_bytes
+        self.fsync_interval = fsync_interval
+        self._lock = threading.RLock()
+        self._bookings = BookingIndex()
+        self._waitlist = {}   # "YYYY-MM-DD" → [user_id, ...]
+        self._seq = 0
+        self._sync_lock = threading.Lock()  # fsync идёт без self._lock, но не во время смены файла
+        self._dirty = threading.Event()
+        self._stop = threading.Event()
+        self._compacting = False
+        self._compact_lock = threading.Lock()  # два сжатия сразу затёрли бы друг другу .old
+        self.fresh = not (os.path.exists(snapshot_path) or os.path.exists(path))
+        self._recover()
+        self._file = open(path, "a", encoding="utf-8")
+        self._flusher = threading.Thread(target=self._flush_loop, name="journal-fsync", daemon=True)
+        self._flusher.start()
+        if os.path.exists(path + ".old"):
+            self.compact()  # прошлое сжатие не дописало снимок
+
+    # ── восстановление ───────────────────────────────────────────────────
+    def _recover(self):
+        snapshot_seq = 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+            snapshot_seq = self._seq = snapshot["seq"]
+            self._bookings = BookingIndex(snapshot["bookings"])
+            self._waitlist = snapshot["waitlist"]
+        replayed = 0
+        # .old остаётся, если процесс упал посреди сжатия; записи до снимка пропускаются по seq
+        for path in (self.path + ".old", self.path):
+            replayed += self._replay(path, snapshot_seq)
+        logger.info("Journal: снимок seq=%d, из журнала применено %d записей, заявок %d",
+                    snapshot_seq, replayed, len(self._bookings))
+
+    def _replay(self, path, after_seq):
+        if not os.path.exists(path):
+            return 0
+        with open(path, "rb") as f:
+            lines = f.read().split(b"\n")
+        replayed = 0
+        offset = 0
+        for n, line in enumerate(lines):
+            start, offset = offset, offset + len(line) + 1
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                if n < len(lines) - 1:
+                    raise
+                # последняя строка недописана — процесс упал во время записи; отрезаем её,
+                # иначе следующая запись приклеится к обрывку
+                logger.warning("Journal: недописанная запись в конце %s отброшена", path)
+                os.truncate(path, start)
+                break
+            if entry["seq"] <= after_seq:
+                continue
+            self._apply(entry)
+            self._seq = entry["seq"]
+            replayed += 1
+        return replayed
+
+    def _apply(self, entry):
+        op = entry["op"]
+        if op == "created":
+            self._bookings.add(entry["booking"])
+        elif op == "waitlist_join":
+            self._waitlist.setdefault(entry["date"], []).append(entry["user_id"])
+        elif op == "waitlist_leave":
+            lst = self._waitlist.get(entry["date"], [])
+            if entry["user_id"] in lst:
+                lst.remove(entry["user_id"])
+            if not lst:
+                self._waitlist.pop(entry["date"], None)
+        else:  # изменение заявки
+            self._bookings.update(entry["id"], entry["fields"])
+
+    # ── запись ───────────────────────────────────────────────────────────
+    def _append(self, entry):
+        """Применяет изменение в памяти и дописывает его в журнал. Вызывать под self._lock."""
+        self._seq += 1
+        entry = {"seq": self._seq, **entry}
+        self._apply(entry)
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._dirty.set()
+        if not self._compacting and self._file.tell() >= self.compact_bytes:
+            self._compacting = True
+            threading.Thread(target=self.compact, name="journal-compact", daemon=True).start()
+
+    def _flush_loop(self):
+        while not self._stop.is_set():
+            self._dirty.wait()
+            # изменения, пришедшие за интервал, попадут в тот же fsync
+            self._stop.wait(self.fsync_interval)
+            self.sync()
+
+    def sync(self):
+        """Сбрасывает накопленные записи журнала на диск."""
+        with self._sync_lock:
+            with self._lock:
+                if self._file.closed:
+                    return
+                self._dirty.clear()
+                self._file.flush()
+                fd = self._file.fileno()
+            os.fsync(fd)
+
+    def compact(self):
+        """Пишет снимок текущего состояния и начинает журнал заново."""
+        try:
+            with self._compact_lock:
+                self._compact()
+        finally:
+            self._compacting = False
+
+    def _compact(self):
+        with self._sync_lock, self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._dirty.clear()
+            snapshot = {"seq": self._seq, "bookings": self._bookings.all(), "waitlist": self._waitlist}
+            data = json.dumps(snapshot, ensure_ascii=False)
+            # .old от прерванного сжатия ещё не вошёл ни в какой снимок — затирать его нельзя;
+            # его записи уже в памяти, поэтому сначала снимок, а журнал сожмётся в следующий раз
+            if not os.path.exists(self.path + ".old"):
+                self._file.close()
+                os.replace(self.path, self.path + ".old")
+                self._file = open(self.path, "a", encoding="utf-8")
+        # снимок пишется уже без блокировки — новые изменения идут в новый журнал
+        tmp = self.snapshot_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.snapshot_path)
+        os.remove(self.path + ".old")
+        logger.info("Journal: снимок seq=%d записан, журнал сжат", snapshot["seq"])
+
+    def import_from(self, source):
+        """Первый запуск: переносит заявки и лист ожидания из JSON-файлов и сразу пишет снимок."""
+        with self._lock:
+            self._bookings = BookingIndex(source.bookings())
+            self._waitlist = source.waitlist()
+        self.compact()
+        logger.info("Journal: перенесено заявок %d из JSON-файлов", len(self._bookings))
+
+    # ── заявки ───────────────────────────────────────────────────────────
+    def bookings(self):
+        with self._lock:
+            return copy.deepcopy(self._bookings.all())
+
+    def get_booking(self, booking_id):
+        with self._lock:
+            booking = self._bookings.get(booking_id)
+            return copy.deepcopy(booking) if booking is not None else None
+
+    def user_bookings(self, user_id, statuses=None):
+        with self._lock:
+            return copy.deepcopy(self._bookings.query(user_id=user_id, statuses=statuses))
+
+    def bookings_by_status(self, status):
+        with self._lock:
+            return copy.deepcopy(self._bookings.query(statuses=(status,)))
+
+    def month_bookings(self, month, statuses=None):
+        with self._lock:
+            return copy.deepcopy(self._bookings.query(month=month, statuses=statuses))
+
+    def add_booking(self, booking):
+        with self._lock:
+            self._append({"op": "created", "booking": copy.deepcopy(booking)})
+
+    def update_booking(self, booking_id, **fields):
+        with self._lock:
+            if self._bookings.get(booking_id) is None:
+                return None
+            op = fields["status"] if "status" in fields else "updated"
+            self._append({"op": op, "id": booking_id, "fields": fields})
+            return copy.deepcopy(self._bookings.get(booking_id))
+
+    # ── лист ожидания ────────────────────────────────────────────────────
+    def waitlist(self):
+        with self._lock:
+            return copy.deepcopy(self._waitlist)
+
+    def waitlist_for(self, key):
+        with self._lock:
+            return list(self._waitlist.get(key, []))
+
+    def user_waitlist(self, user_id):
+        with self._lock:
+            return [key for key, lst in self._waitlist.items() if user_id in lst]
+
+    def join_waitlist(self, key, user_id):
+        with self._lock:
+            if user_id in self._waitlist.get(key, []):
+                return False
+            self._append({"op": "waitlist_join", "date": key, "user_id": user_id})
+            return True
+
+    def leave_waitlist(self, key, user_id):
+        with self._lock:
+            if user_id not in self._waitlist.get(key, []):
+                return False
+            self._append({"op": "waitlist_leave", "date": key, "user_id": user_id})
+            return True
+
+    def pop_waitlist(self, key):
+        with self._lock:
+            lst = self._waitlist.get(key)
+            if not lst:
+                return None
+            user_id = lst[0]
+            self._append({"op": "waitlist_leave", "date": key, "user_id": user_id})
+            return user_id
+
+    # ── подписчики и открытые месяцы — в JSON-файлах ─────────────────────
+    def subscribers(self):
+        return self.files.subscribers()
+
+    def add_subscriber(self, subscriber):
+        return self.files.add_subscriber(subscriber)
+
+    def remove_subscriber(self, user_id):
+        return self.files.remove_subscriber(user_id)
+
+    def subscriber_count(self):
+        return self.files.subscriber_count()
+
+    def is_subscriber(self, user_id):
+        return self.files.is_subscriber(user_id)
+
+    def recent_subscribers(self, n):
+        return self.files.recent_subscribers(n)
+
+    def subscriber_stats(self, today):
+        return self.files.subscriber_stats(today)
+
+    def open_months(self):
+        return self.files.open_months()
+
+    def open_month(self, key):
+        return self.files.open_month(key)
+
+    def scheduled_jobs(self):
+        return self.files.scheduled_jobs()
+
+    def save_job(self, job):
+        self.files.save_job(job)
+
+    def delete_job(self, job_id):
+        return self.files.delete_job(job_id)
+
+    def get_meta(self, key):
+        return self.files.get_meta(key)
+
+    def set_meta(self, key, value):
+        self.files.set_meta(key, value)
+
+    async def durable(self):
+        if self.executor is not None:
+            await self.executor.run(self.sync)
+        else:
+            self.sync()
+        await self.files.durable()
+
+    def close(self):
+        self.files.close()
+        self._stop.set()
+        self._dirty.set()
+        self.sync()
+        with self._sync_lock, self._lock:
+            self._file.close()
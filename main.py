@@ -1,12 +1,11 @@
 import logging
 import asyncio
-import caldav
 import calendar
 import re
-from icalendar import Calendar
 from icalendar import Calendar as ICalCalendar, Event as ICalEvent
 from datetime import datetime, time, timedelta
 import pytz
+import httpx
 import locale
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes, ConversationHandler,MessageHandler,filters
@@ -17,7 +16,23 @@ from faq import get_faq_handler, get_faq_callback_handler, get_faq_menu_handler
 from eyelash_secret_easteregg import setup_secret_easteregg
 from dateutil.relativedelta import relativedelta
 from datetime import date as _date
+import time as _time
+from operator import itemgetter
 from cryptography.fernet import Fernet
+from caldav_session import CalDAVError, CalDAVSession, NotFoundError
+from availability import AvailabilityCache, WorkingHours, bucket_by_date, free_slots_by_day, free_slots_on_dates
+from caldav_sync import CalendarIndex, FreeBusyQuery, FreeBusyUnsupported, busy_intervals, calendar_query
+from ical_extract import extract_events
+from executors import BoundedExecutor, ExecutorBusy, log_stats
+from storage import JsonStorage, PendingApprovals, SqliteStorage, iso_date
+from journal import JournalStorage
+from profiles import ProfileRepository
+from persistence import PersistentFile, TEXT_CODEC
+from broadcast import Broadcaster
+from waitlist_offers import WaitlistDispatcher
+from waitlist_watch import AvailabilityWatcher
+from scheduler import JobScheduler
+from reminders import AppointmentReminders
 
 # Загрузка конфигурации
 CONFIG_FILE = "config.json"
@@ -36,19 +51,51 @@ PRICE_URL = config.get("price_url")
 CALENDAR_NAME = config.get("calendar_name", "Work")
 LOG_FILE = config.get("log_file", "bot.log")
 USERS_FILE = config.get("users_file", "users.json")
+SUBSCRIBERS_LOG = config.get("subscribers_log", "users.jsonl")  # новые подписчики, по строке на каждого
+JOBS_FILE = config.get("jobs_file", "jobs.json")  # отложенные действия (для storage "json" и "journal")
+META_FILE = config.get("meta_file", "meta.json")  # служебные отметки (для storage "json" и "journal")
+PROFILE_REMINDER_DELAY = config.get("profile_reminder_delay", 300)  # секунд до напоминания о незаполненной анкете
+REMINDER_OFFSETS = config.get("reminder_offsets", [24, 2])  # за сколько часов до визита напоминать
+REMINDER_RATE = config.get("reminder_rate", 25)  # напоминаний в секунду
+RECENT_SUBSCRIBERS = 20  # сколько последних подписчиков показывать в /subscribers
+BROADCAST_STATE = config.get("broadcast_state", "broadcast.json")  # checkpoint рассылки
+BROADCAST_RATE = config.get("broadcast_rate", 25)  # сообщений в секунду (лимит Telegram — около 30)
+BROADCAST_WORKERS = config.get("broadcast_workers", 8)
 ADMIN_IDS = config.get("admin_ids")
 ADMIN_ID = config.get("admin_id")
 PHONE = config.get("phone")
 WAITLIST_FILE = config.get("waitlist_file", "waitlist.json")
+WAITLIST_OFFERS_FILE = config.get("waitlist_offers_file", "waitlist_offers.json")  # слоты, предложенные листу ожидания
+WAITLIST_FANOUT = config.get("waitlist_fanout", 1)  # скольким из очереди предлагать слот одновременно
+WAITLIST_CLAIM_MINUTES = config.get("waitlist_claim_minutes", 15)  # минут на ответ, потом — следующим в очереди
+WAITLIST_WATCH_FILE = config.get("waitlist_watch_file", "waitlist_watch.json")  # снимки окон на даты с очередью
+WAITLIST_WATCH_INTERVAL = config.get("waitlist_watch_interval", 120)  # секунд между проверками календаря
 OPEN_MONTHS_FILE = config.get("open_months")
 BOOKINGS_FILE = config.get("bookings")
-PROFILES_FILE = config.get("profiles")
+PROFILES_FILE = config.get("profiles")  # старый формат: все профили одним токеном, переносится в PROFILES_DB
+PROFILES_DB = config.get("profiles_db", "profiles.db")
+PROFILES_FLUSH_DELAY = config.get("profiles_flush_delay", 2.0)  # секунд между изменением профиля и записью файла
 ASK_FIRST_NAME, ASK_LAST_NAME, ASK_PHONE = range(3)
 EDIT_USER_ID, EDIT_FIELD_CHOICE, EDIT_FIELD_INPUT = range(3)
 FERNET_KEY = config.get("fernet_key")
 INSTAGRAM_URL = config.get("instagram_url", "https://instagram.com/")
 NOTICE_FILE = config.get("notice_file", "notice.txt")
 NOTICE_STATE = 990    # уникальный int, не пересекается с другими state'ами
+CALDAV_POOL_SIZE = config.get("caldav_pool_size", 10)
+CALDAV_TIMEOUT = config.get("caldav_timeout", 30)
+AVAILABILITY_TTL = config.get("availability_ttl", 300)  # секунд
+CALDAV_SYNC_MODE = config.get("caldav_sync", "incremental")  # "incremental" (ctag/sync-token), "freebusy" или "report"
+PREFETCH_INTERVAL = config.get("prefetch_interval", 120)  # секунд, должно быть меньше availability_ttl
+WORKING_HOURS = WorkingHours.from_config(config.get("working_hours"))
+STORAGE_BACKEND = config.get("storage", "json")  # "json" (файлы как раньше), "sqlite" или "journal"
+STORAGE_PATH = config.get("storage_path", "bot.db")
+JOURNAL_PATH = config.get("journal_path", "journal.jsonl")
+JOURNAL_SNAPSHOT = config.get("journal_snapshot", "journal.snapshot.json")
+JOURNAL_COMPACT_BYTES = config.get("journal_compact_bytes", 1_000_000)
+JOURNAL_FSYNC_INTERVAL = config.get("journal_fsync_interval", 0.05)  # секунд
+PERSIST_DELAY = config.get("persist_delay", 0.05)  # секунд: изменения JSON-файлов за это время пишутся одной записью
+EXECUTORS_CONFIG = config.get("executors", {})  # {"calendar": {"workers": 8, "queue": 100}, "git": ..., "cpu": ...}
+EXECUTOR_STATS_INTERVAL = config.get("executor_stats_interval", 600)  # секунд
 
 # Настройки логирования
 logging.basicConfig(
@@ -62,28 +109,83 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 TZ = pytz.timezone("Europe/Moscow")
 locale.setlocale(locale.LC_TIME, 'ru_RU.UTF-8')
-pending_bookings = {}  # должно быть глобально
 from git import Repo
 import shutil
 
 import uuid
 
-pending_bookings = {}  # booking_id → {user_id, name, date, slot}
 if not FERNET_KEY:
     raise RuntimeError("В config.json должен быть указан fernet_key")
 FERNET = Fernet(FERNET_KEY.encode())
+
+def _executor(name, workers, queue, threads=True):
+    cfg = EXECUTORS_CONFIG.get(name, {})
+    return BoundedExecutor(name, cfg.get("workers", workers), cfg.get("queue", queue), threads=threads)
+
+# Раздельные исполнители: медленный CalDAV не отнимает места у git и шифрования
+CALENDAR_IO = _executor("calendar", CALDAV_POOL_SIZE, 100, threads=False)  # запросы к CalDAV (async)
+GIT_IO      = _executor("git", 1, 5)                                      # клон/пуш прайса
+CPU         = _executor("cpu", 2, 50)                                     # BeautifulSoup, Fernet, расчёт слотов
+DISK_IO     = _executor("disk", 1, 100)                                   # запись JSON-файлов, один писатель
+EXECUTORS = [CALENDAR_IO, GIT_IO, CPU, DISK_IO]
+PROFILES = ProfileRepository(PROFILES_DB, FERNET, flush_delay=PROFILES_FLUSH_DELAY, executor=CPU)
+PROFILES.migrate_from_blob(PROFILES_FILE)  # один раз, при первом запуске с PROFILES_DB
+
+def open_storage():
+    """Хранилище заявок, листа ожидания, подписчиков и открытых месяцев."""
+    json_storage = JsonStorage(BOOKINGS_FILE, WAITLIST_FILE, USERS_FILE, OPEN_MONTHS_FILE,
+                               executor=DISK_IO, delay=PERSIST_DELAY, subscribers_log=SUBSCRIBERS_LOG,
+                               jobs_file=JOBS_FILE, meta_file=META_FILE)
+    if STORAGE_BACKEND == "sqlite":
+        storage = SqliteStorage(STORAGE_PATH)
+        storage.migrate_from(json_storage)  # один раз, при первом запуске на SQLite
+        return storage
+    if STORAGE_BACKEND == "journal":
+        storage = JournalStorage(JOURNAL_PATH, JOURNAL_SNAPSHOT, json_storage,
+                                 compact_bytes=JOURNAL_COMPACT_BYTES, fsync_interval=JOURNAL_FSYNC_INTERVAL,
+                                 executor=DISK_IO)
+        if storage.fresh:
+            storage.import_from(json_storage)  # один раз, при первом запуске с журналом
+        return storage
+    return json_storage
+
+STORAGE = open_storage()
+# Заявки, ждущие администратора: booking_id → {user_id, name, date, slot}; при промахе — из STORAGE
+pending_bookings = PendingApprovals(STORAGE)
+logger.info("[Booking] Заявок ждут подтверждения: %d", pending_bookings.warm())
+# Отложенные действия (напоминания и т.п.): переживают перезапуск, выполняются на JobQueue
+SCHEDULER = JobScheduler(STORAGE)
+REMINDERS = AppointmentReminders(SCHEDULER, STORAGE, TZ, offsets=REMINDER_OFFSETS, rate=REMINDER_RATE)
+BROADCASTER = Broadcaster(STORAGE, BROADCAST_STATE, workers=BROADCAST_WORKERS, rate=BROADCAST_RATE,
+                          executor=DISK_IO)
+WAITLIST = WaitlistDispatcher(STORAGE, SCHEDULER, WAITLIST_OFFERS_FILE, TZ, fanout=WAITLIST_FANOUT,
+                              claim_minutes=WAITLIST_CLAIM_MINUTES, executor=DISK_IO, delay=PERSIST_DELAY)
+# окна, освобождённые прямо в календаре, на даты с очередью (IrCalendar объявлен ниже)
+WAITLIST_WATCH = AvailabilityWatcher(STORAGE, WAITLIST, lambda dates: IrCalendar().free_slots_on_dates(dates), TZ,
+                                     WAITLIST_WATCH_FILE, executor=DISK_IO, delay=PERSIST_DELAY)
+
+# Одно подключение к CalDAV на весь процесс (keep-alive + найденный один раз календарь)
+CALDAV = CalDAVSession(CALDAV_URL, USERNAME, PASSWORD, CALENDAR_NAME,
+                       pool_size=CALDAV_POOL_SIZE, timeout=CALDAV_TIMEOUT, executor=CALENDAR_IO)
+# Локальный индекс событий, догружается по ctag / sync-token
+CALENDAR_INDEX = CalendarIndex(CALDAV, TZ)
+# Только периоды занятости, без тел событий
+FREE_BUSY = FreeBusyQuery(CALDAV, TZ)
+
 def encrypt_bytes(b: bytes) -> bytes:
     return FERNET.encrypt(b)
 
 def decrypt_bytes(b: bytes) -> bytes:
     return FERNET.decrypt(b)
 
+NOTICE = PersistentFile(NOTICE_FILE, "", codec=TEXT_CODEC, executor=DISK_IO, delay=PERSIST_DELAY)
+
 def load_notice() -> str:
-    return open(NOTICE_FILE, "r", encoding="utf‑8").read().strip() if os.path.exists(NOTICE_FILE) else ""
+    return NOTICE.value
 
 def save_notice(text: str):
-    with open(NOTICE_FILE, "w", encoding="utf‑8") as f:
-        f.write(text.strip())
+    NOTICE.value = text.strip()
+    NOTICE.changed()
 
 
 # ———————— Нормализация телефона ————————
@@ -121,24 +223,13 @@ def format_notice(raw: str) -> str:
     return f"‼️ *{txt}* ‼️"
 
 
-def load_waitlist() -> dict:
-    if os.path.exists(WAITLIST_FILE):
-        with open(WAITLIST_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {}
-
-def save_waitlist(waitlist: dict):
-    with open(WAITLIST_FILE, "w", encoding="utf-8") as f:
-        json.dump(waitlist, f, ensure_ascii=False, indent=2)
-
 async def view_waitlist(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     user_id = str(query.from_user.id)
 
-    waitlist = load_waitlist()
-    # ищем все даты, где пользователь есть в очереди
-    entries = [key for key, lst in waitlist.items() if user_id in lst]
+    # все даты, где пользователь есть в очереди
+    entries = STORAGE.user_waitlist(user_id)
 
     if not entries:
         await query.edit_message_text("📭 Вы ни в одной очереди ожидания не состоите.", reply_markup=get_main_menu(int(user_id)))
@@ -165,70 +256,19 @@ async def cancel_waitlist(update: Update, context: ContextTypes.DEFAULT_TYPE):
     _, _, key = query.data.partition("cancel_wait_")
     user_id = str(query.from_user.id)
 
-    waitlist = load_waitlist()
-    lst = waitlist.get(key, [])
-    if user_id not in lst:
+    if not STORAGE.leave_waitlist(key, user_id):
         await query.edit_message_text("❌ Вы уже не в этой очереди.", reply_markup=get_main_menu(int(user_id)))
         return
 
-    lst.remove(user_id)
-    if lst:
-        waitlist[key] = lst
-    else:
-        del waitlist[key]
-    save_waitlist(waitlist)
-
     # подтверждаем юзеру
     y, m, d = key.split("-")
     date_str = f"{d}.{m}.{y}"
     await query.edit_message_text(f"✅ Вы удалены из листа ожидания на {date_str}.", reply_markup=get_main_menu(int(user_id)))
 
 
-def load_profiles():
-    if not os.path.exists(PROFILES_FILE):
-        return {}
-    with open(PROFILES_FILE, "rb") as f:
-        encrypted = f.read()
-    try:
-        decrypted = decrypt_bytes(encrypted)
-        return json.loads(decrypted.decode("utf-8"))
-    except Exception as e:
-        logger.error("Не удалось расшифровать profiles: %s", e)
-        return {}
-
-def save_profiles(profiles):
-    data = json.dumps(profiles, ensure_ascii=False).encode("utf-8")
-    encrypted = encrypt_bytes(data)
-    with open(PROFILES_FILE, "wb") as f:
-        f.write(encrypted)
-
-
-def load_bookings():
-    if os.path.exists(BOOKINGS_FILE):
-        with open(BOOKINGS_FILE, "r") as f:
-            return json.load(f)
-    return []
-
-def save_bookings(bookings):
-    with open(BOOKINGS_FILE, "w") as f:
-        json.dump(bookings, f, indent=4)
-
-
-
-def load_open_months():
-    if not os.path.exists(OPEN_MONTHS_FILE):
-        return []
-    with open(OPEN_MONTHS_FILE, "r") as f:
-        return json.load(f)
-
-def save_open_months(open_months):
-    with open(OPEN_MONTHS_FILE, "w") as f:
-        json.dump(open_months, f, indent=4)
-
-
 def get_closed_months(n=6):
     now = datetime.now(TZ)
-    open_months = set(load_open_months())
+    open_months = set(STORAGE.open_months())
     closed = []
 
     for i in range(n):
@@ -248,7 +288,7 @@ async def admin_edit_user_profile(update: Update, context: ContextTypes.DEFAULT_
         return ConversationHandler.END
 
     # Список всех профилей
-    profiles = load_profiles()
+    profiles = PROFILES.all()
     keyboard = []
 
     for uid, profile in profiles.items():
@@ -300,73 +340,81 @@ async def admin_save_user_field(update: Update, context: ContextTypes.DEFAULT_TY
         await update.message.reply_text("⚠️ Ошибка: не выбраны пользователь или поле.")
         return ConversationHandler.END
 
-    profiles = load_profiles()
-    if user_id not in profiles:
+    if not PROFILES.update(user_id, **{field: user_input}):
         await update.message.reply_text("⚠️ Пользователь не найден.")
         return ConversationHandler.END
 
-    profiles[user_id][field] = user_input
-    save_profiles(profiles)
     logger.info(f"[Admin] Обновлён профиль {user_id}: {field} = {user_input}")
     await update.message.reply_text("✅ Данные обновлены успешно.")
     return ConversationHandler.END
 
+async def delete_booking_event(b):
+    """
+    Удаляет событие заявки из календаря: по href, а не вышло — по summary, как раньше.
+    Возвращает (deleted, failed): failed — CalDAV ответил ошибкой или не ответил,
+    событие, возможно, осталось в календаре.
+    """
+    day, month, year = map(int, b["date"].split("."))
+    hour, minute    = map(int, b["slot"].split(":"))
+    failed = False
+    if b.get("event_href"):
+        start_dt = TZ.localize(datetime(year, month, day, hour, minute))
+        try:
+            if await delete_event_by_href(
+                b["event_href"], start_dt, start_dt + timedelta(hours=BOOKING_DURATION_HOURS)
+            ):
+                return True, False
+        except (CalDAVError, httpx.HTTPError, ExecutorBusy) as e:
+            logger.error(f"[Cancel] Не удалось удалить событие {b['event_href']}: {e}")
+            failed = True
+    # старые заявки (без href), календарь переехал или DELETE по href не прошёл — ищем по summary
+    prof = PROFILES.get(b["user_id"], {})
+    summary = f"{prof.get('phone','')} {prof.get('first_name','')} {prof.get('last_name','')}"
+    try:
+        if await delete_event(year, month, day, hour, minute, summary):
+            return True, False
+    except (CalDAVError, httpx.HTTPError, ExecutorBusy) as e:
+        logger.error(f"[Cancel] Не удалось удалить событие заявки {b['id']} по summary: {e}")
+        failed = True
+    return False, failed
+
+
 async def user_cancel_booking(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     user_id = query.from_user.id
 
     booking_id = query.data.replace("user_cancel_", "")
-    bookings = load_bookings()
-
-    for b in bookings:
-        if b["id"] == booking_id and b["user_id"] == user_id:
-            if b["status"] in ("pending", "confirmed"):
-                b["status"] = "cancelled"
-                save_bookings(bookings)
-                pending_bookings.pop(booking_id, None)
-                # — уведомляем первому в листе ожидания на эту дату —
-                key = datetime.strptime(b["date"], "%d.%m.%Y").strftime("%Y-%m-%d")
-                waitlist = load_waitlist()
-                queue = waitlist.get(key, [])
-                if queue:
-                    next_user = queue.pop(0)
-                    if queue:
-                        waitlist[key] = queue
-                    else:
-                        del waitlist[key]
-                    save_waitlist(waitlist)
-
-                    await context.bot.send_message(
-                        chat_id=int(next_user),
-                        text=(
-                            f"🔔 На {b['date']} освободился слот! "
-                            "Нажмите, чтобы выбрать время:"
-                        ),
-                        reply_markup=InlineKeyboardMarkup([[
-                            InlineKeyboardButton("📅 Выбрать время", callback_data="calendar_open")
-                        ]])
-                    )
-
-                # 2) Удаляем событие из календаря
-                day, month, year = map(int, b["date"].split("."))
-                hour, minute    = map(int, b["slot"].split(":"))
-                # собираем summary так же, как при создании
-                prof = load_profiles().get(str(user_id), {})
-                summary = f"{prof.get('phone','')} {prof.get('first_name','')} {prof.get('last_name','')}"
-                deleted = delete_event(year, month, day, hour, minute, summary)
-                if not deleted:
-                    logger.warning(f"[Cancel] Событие не найдено/не удалено: {summary} at {day}.{month}.{year} {hour:02d}:{minute:02d}")
-
-                await query.edit_message_text("✅ Ваша запись успешно отменена.")
-
-                # Уведомление админу (опционально)
-                await context.bot.send_message(
-                    chat_id=ADMIN_ID,
-                    text=f"🚫 Пользователь *{b['name']}* отменил запись:\n📅 {b['date']} в {b['slot']}",
-                    parse_mode="Markdown"
-                )
-                return
+    b = STORAGE.get_booking(booking_id)
+
+    if b and b["user_id"] == user_id and b["status"] in ("pending", "confirmed"):
+        STORAGE.update_booking(booking_id, status="cancelled")
+        pending_bookings.pop(booking_id, None)
+        REMINDERS.booking_cancelled(booking_id)
+
+        # 2) Удаляем событие из календаря — до предложения слота листу ожидания,
+        #    чтобы у получившего предложение слот уже не был занят
+        deleted, failed = await delete_booking_event(b)
+        if not deleted and not failed:
+            day, month, year = b["date"].split(".")
+            logger.warning(f"[Cancel] Событие не найдено: заявка {booking_id} at {day}.{month}.{year} {b['slot']}")
+
+        # — предлагаем слот листу ожидания на эту дату (если событие не застряло в календаре) —
+        if not failed:
+            await WAITLIST.slot_freed(context, b["date"], b["slot"])
+
+        await query.edit_message_text("✅ Ваша запись успешно отменена.")
+
+        # Уведомление админу (опционально)
+        admin_text = f"🚫 Пользователь *{b['name']}* отменил запись:\n📅 {b['date']} в {b['slot']}"
+        if failed:
+            admin_text += "\n❗ Событие не удалось удалить из календаря — удалите его вручную."
+        await context.bot.send_message(
+            chat_id=ADMIN_ID,
+            text=admin_text,
+            parse_mode="Markdown"
+        )
+        return
 
     await query.edit_message_text("❌ Невозможно отменить эту запись.")
 
@@ -381,7 +429,7 @@ async def admin_free_slots_month(update: Update, context: ContextTypes.DEFAULT_T
 
     today = datetime.now(TZ).date()
     current_key = f"{today.year}-{today.month:02d}"
-    open_months = sorted(load_open_months())
+    open_months = sorted(STORAGE.open_months())
 
     # Список месяцев: текущий + первый следующий открытый
     months = [current_key]
@@ -392,11 +440,13 @@ async def admin_free_slots_month(update: Update, context: ContextTypes.DEFAULT_T
 
     cal = IrCalendar()
     blocks = []
+    # все месяцы отчёта — одной загрузкой
+    availability = await cal.get_months_availability([tuple(map(int, key.split("-"))) for key in months])
 
     for key in months:
         year, month = map(int, key.split("-"))
         month_name = datetime(year, month, 1).strftime("%B %Y")
-        free_by_day = await cal.find_free_slots_month(year, month)
+        _, free_by_day = availability[(year, month)]
 
         lines = []
         for day, slots in sorted(free_by_day.items()):
@@ -433,13 +483,10 @@ async def admin_month_bookings(update: Update, context: ContextTypes.DEFAULT_TYP
 
     now = datetime.now(TZ)
     month_start = datetime(now.year, now.month, 1).date()
-    month_end = (month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
-
-    bookings = load_bookings()
-    profiles = load_profiles()
 
-    # Фильтруем заявки по месяцу
-    month_bookings = [b for b in bookings if b["status"] == "confirmed"]
+    # Только подтверждённые заявки текущего месяца — запрос по индексу месяца
+    month_bookings = STORAGE.month_bookings(month_start.strftime("%Y-%m"), ("confirmed",))
+    month_bookings.sort(key=lambda b: (iso_date(b["date"]), b["slot"]))
 
     response = f"📅 *Заявки за {month_start.strftime('%B %Y')}*\n\n"
     if not month_bookings:
@@ -447,7 +494,7 @@ async def admin_month_bookings(update: Update, context: ContextTypes.DEFAULT_TYP
     else:
         for b in month_bookings:
             user_id = str(b["user_id"])
-            profile = profiles.get(user_id, {})
+            profile = PROFILES.get(user_id, {})
             response += (
                 f"👤 {profile.get('first_name', '–')} {profile.get('last_name', '–')}\n"
                 f"📱 {profile.get('phone', '–')}\n"
@@ -461,8 +508,7 @@ async def show_user_profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     user_id = str(query.from_user.id)
-    profiles = load_profiles()
-    profile = profiles.get(user_id)
+    profile = PROFILES.get(user_id)
 
     if not profile:
         await query.edit_message_text("📝 Профиль не найден. Вы можете заполнить его при следующей записи.")
@@ -529,8 +575,7 @@ async def ask_phone(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     try:
         # Сохраняем профиль
-        profiles = load_profiles()
-        profiles[user_id] = {
+        profile = {
             "first_name": context.user_data.get("first_name", "неизвестно"),
             "last_name":  context.user_data.get("last_name",  "неизвестно"),
             "phone":      phone or "неизвестно",
@@ -539,14 +584,13 @@ async def ask_phone(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         # Добавляем запись в историю профиля, если она есть
         booking_id = context.user_data.get("confirm_booking_id")
-        bookings = load_bookings()
-        for b in bookings:
-            if b["id"] == booking_id:
-                profiles[user_id]["history"].append(f"{b['date']} {b['slot']}")
-                break
+        b = STORAGE.get_booking(booking_id) if booking_id else None
+        if b:
+            profile["history"].append(f"{b['date']} {b['slot']}")
 
-        save_profiles(profiles)
-        logger.info(f"[Profile] Профиль сохранён для user_id={user_id}: {profiles[user_id]}")
+        PROFILES.put(user_id, profile)
+        SCHEDULER.cancel(f"profile_reminder:{user_id}")  # анкета заполнена — напоминать не о чем
+        logger.info(f"[Profile] Профиль сохранён для user_id={user_id}: {profile}")
 
         # Уведомляем пользователя
         await update.message.reply_text(
@@ -574,6 +618,7 @@ async def ask_phone(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 parse_mode="Markdown",
                 reply_markup=InlineKeyboardMarkup(buttons)
             )
+            WAITLIST.booking_submitted(booking_id)
         # —————————————
 
         # Завершаем ConversationHandler
@@ -592,8 +637,7 @@ async def show_user_bookings(update: Update, context: ContextTypes.DEFAULT_TYPE)
     await query.answer()
     user_id = query.from_user.id
 
-    bookings = load_bookings()
-    my = [b for b in bookings if b["user_id"] == user_id and b["status"] in ("pending", "confirmed")]
+    my = STORAGE.user_bookings(user_id, ("pending", "confirmed"))
 
     if not my:
         await query.edit_message_text("📭 У вас нет активных записей.", reply_markup=get_main_menu(user_id))
@@ -616,12 +660,13 @@ async def admin_open_month_button(update: Update, context: ContextTypes.DEFAULT_
         return
 
     key = query.data.replace("admin_open_", "")
-    open_months = load_open_months()
-
-    if key not in open_months:
-        open_months.append(key)
-        save_open_months(open_months)
-        await query.edit_message_text(f"✅ Месяц *{key}* открыт для записи.", parse_mode="Markdown")
+    if STORAGE.open_month(key):
+        await query.edit_message_text(
+            f"✅ Месяц *{key}* открыт для записи.", parse_mode="Markdown",
+            reply_markup=InlineKeyboardMarkup([[
+                InlineKeyboardButton("📣 Сообщить подписчикам", callback_data=f"broadcast_month_{key}")
+            ]])
+        )
     else:
         await query.edit_message_text(f"ℹ️ Месяц *{key}* уже был открыт.", parse_mode="Markdown")
 
@@ -679,11 +724,26 @@ def upload_price_to_github():
     except Exception as e:
         logger.error(f"❌ Ошибка при выгрузке в GitHub: {e}")
         
+
+def compute_free_slots_month(year: int, month: int, busy_events):
+    """
+    Свободные слоты по рабочему расписанию (working_hours) для всех дней year/month.
+    Возвращает dict: {день: [datetime1, datetime2, ...], ...}.
+    """
+    return free_slots_by_day(year, month, busy_events, TZ, WORKING_HOURS)
+
+
+# Кэш доступности по месяцам, общий для всех IrCalendar()
+AVAILABILITY = AvailabilityCache(AVAILABILITY_TTL, compute_free_slots_month)
+_month_loads = {}  # (year, month) → asyncio.Task загрузки, чтобы одновременные запросы ждали её, а не шли в CalDAV
+
+
 class IrCalendar:
     def __init__(self):
         self.caldav_url = CALDAV_URL
         self.username = USERNAME
         self.password = PASSWORD
+        self.session = CALDAV  # общее подключение, а не новый клиент на каждый запрос
         logger.info("IrCalendar initialized with CalDAV URL: %s", self.caldav_url)
 
     def parse_datetime(self, dt_obj):
@@ -693,92 +753,62 @@ class IrCalendar:
             return dt_obj if dt_obj.tzinfo else TZ.localize(dt_obj)
         return None
 
-    def get_busy_slots_sync(self, selected_date):
-        """Получает занятые слоты синхронно на указанную дату из CalDAV."""
+    def _busy_from_events(self, events, start_dt, end_dt):
+        """{href: (etag, calendar-data)} → список (dtstart, dtend) в [start_dt, end_dt)."""
+        busy = []
+        for _, data in events.values():
+            busy.extend(busy_intervals(data, TZ, start_dt, end_dt))
+        return busy
+
+    async def get_busy_slots(self, selected_date):
+        """Получает занятые слоты на указанную дату из CalDAV."""
         logger.info("Getting busy slots for date: %s", selected_date)
         try:
-            client = caldav.DAVClient(url=self.caldav_url, username=self.username, password=self.password)
-            my_principal = client.principal()
-            calendars = my_principal.calendars()
-
-            if not calendars:
-                logger.warning("No calendars found.")
-                return []
-
-            for c in calendars:
-                if c.name == CALENDAR_NAME:  # Предполагаем, что нужный календарь называется 'Work'
-                    calendar = client.calendar(url=c.url)
-                    events = calendar.date_search(selected_date)
-
-                    busy_slots = []
-                    for event in events:
-                        gcal = Calendar.from_ical(event.data)
-                        for component in gcal.walk():
-                            if component.name == "VEVENT":
-                                dtstart = self.parse_datetime(component.get('dtstart').dt)
-                                dtend = self.parse_datetime(component.get('dtend').dt)
-                                if dtstart and dtend:
-                                    busy_slots.append((dtstart, dtend))
-                    logger.info("Found busy slots: %s", busy_slots)
-                    return busy_slots
+            start_dt = TZ.localize(datetime.combine(selected_date, time(0, 0)))
+            end_dt   = start_dt + timedelta(days=1)
+            events = await calendar_query(self.session, start_dt, end_dt)
+            busy_slots = self._busy_from_events(events, start_dt, end_dt)
+            logger.info("Found busy slots: %s", busy_slots)
+            return busy_slots
         except Exception as e:
             logger.error("Error while getting calendar events: %s", e)
             return []
 
-    async def get_busy_slots(self, selected_date):
-        """Асинхронно вызывает синхронный метод."""
-        logger.debug("Asynchronously getting busy slots for date: %s", selected_date)
-        loop = asyncio.get_event_loop()
-        busy_slots = await loop.run_in_executor(None, self.get_busy_slots_sync, selected_date)
-        return busy_slots
-
     async def find_free_slots_async(self, selected_date):
-        """Асинхронно находит свободные слоты с шагом 3 часа."""
+        """Асинхронно находит свободные слоты на день (из закэшированного месяца)."""
         logger.info("Finding free slots for date: %s", selected_date)
-        work_start_dt = TZ.localize(datetime.combine(selected_date, time(10, 0)))
-        work_end_dt = TZ.localize(datetime.combine(selected_date, time(22, 0)))
-
-        busy_slots = await self.get_busy_slots(selected_date)  # Асинхронный вызов
-        free_slots = []
-
-        current_start = work_start_dt
-        while current_start < work_end_dt:
-            current_end = current_start + timedelta(hours=3)
-            is_busy = any(start < current_end and end > current_start for start, end in busy_slots)
-
-            if not is_busy:
-                free_slots.append(current_start)
-
-            current_start = current_end
-
+        free_by_day = await self.find_free_slots_month(selected_date.year, selected_date.month)
+        free_slots = free_by_day.get(selected_date.day, [])
         logger.info("Found free slots: %s", free_slots)
         return free_slots
 
-    def _get_month_events_sync(self, start_date: _date, end_date: _date):
+    async def _fetch_events(self, start_date: _date, end_date: _date):
+        """Как _get_month_events, но ошибки CalDAV пробрасываются наружу."""
+        start_dt = TZ.localize(datetime.combine(start_date, time(0, 0)))
+        end_dt   = TZ.localize(datetime.combine(end_date, time(0, 0)))
+        if CALDAV_SYNC_MODE == "incremental":
+            # Один PROPFIND, если ничего не менялось; иначе догружаем только изменения
+            try:
+                await CALENDAR_INDEX.refresh()
+                return CALENDAR_INDEX.between(start_dt, end_dt)
+            except Exception as e:
+                logger.warning(f"Incremental sync failed, falling back to REPORT: {e}")
+        elif CALDAV_SYNC_MODE == "freebusy":
+            try:
+                return await FREE_BUSY.busy(start_dt, end_dt)
+            except FreeBusyUnsupported:
+                pass
+
+        events = await calendar_query(self.session, start_dt, end_dt)
+        return self._busy_from_events(events, start_dt, end_dt)
+
+    async def _get_month_events(self, start_date: _date, end_date: _date):
         """
-        Синхронно получает все события из CalDAV между start_date и end_date.
+        Получает все события из CalDAV между start_date и end_date.
         Возвращает список (dtstart, dtend).
         """
         try:
-            client = caldav.DAVClient(url=self.caldav_url, username=self.username, password=self.password)
-            principal = client.principal()
-            calendars = principal.calendars()
-            if not calendars:
-                return []
-            for c in calendars:
-                if c.name == CALENDAR_NAME:
-                    calendar_obj = client.calendar(url=c.url)
-                    events = calendar_obj.date_search(start_date, end_date)
-                    busy = []
-                    for ev in events:
-                        gcal = Calendar.from_ical(ev.data)
-                        for comp in gcal.walk():
-                            if comp.name == "VEVENT":
-                                dtstart = self.parse_datetime(comp.get("dtstart").dt)
-                                dtend   = self.parse_datetime(comp.get("dtend").dt)
-                                if dtstart and dtend:
-                                    busy.append((dtstart, dtend))
-                    return busy
+            return await self._fetch_events(start_date, end_date)
         except Exception as e:
             logger.error(f"Error fetching month events: {e}")
         return []
@@ -789,43 +819,125 @@ class IrCalendar:
         """
         start = _date(year, month, 1)
         end   = (start + relativedelta(months=1))
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(
-            None,
-            self._get_month_events_sync,
-            start,
-            end
-        )
+        return await self._get_month_events(start, end)
+
+    async def get_busy_by_day(self, start_date: _date, end_date: _date):
+        """
+        Занятые интервалы за произвольный диапазон [start_date, end_date) одним запросом,
+        разложенные по датам: {date: [(dtstart, dtend), ...]}.
+        """
+        busy = await self._fetch_events(start_date, end_date)
+        return bucket_by_date(busy, TZ, start_date, end_date - timedelta(days=1))
+
+    async def free_slots_on_dates(self, dates):
+        """
+        Свободные слоты только на даты dates, прямо из календаря (мимо кэша месяцев):
+        {date: [datetime, ...]}. Подряд идущие даты — одним запросом, диапазоны — параллельно.
+        """
+        runs = []
+        for day in sorted(set(dates)):
+            if runs and runs[-1][-1] + timedelta(days=1) == day:
+                runs[-1].append(day)
+            else:
+                runs.append([day])
+        results = await asyncio.gather(*[
+            self._fetch_events(run[0], run[-1] + timedelta(days=1)) for run in runs
+        ])
+        free = {}
+        for run, busy in zip(runs, results):
+            free.update(free_slots_on_dates(run, busy, TZ, WORKING_HOURS))
+        return free
+
+    async def _load_months(self, keys):
+        """
+        Загружает несколько месяцев: один запрос на каждый непрерывный диапазон
+        месяцев, разные диапазоны — параллельно. Результат раскладывается по месяцам в кэш.
+        """
+        generations = {key: AVAILABILITY.begin(*key) for key in keys}
+        runs = []
+        for key in sorted(keys):
+            prev = runs[-1][-1] if runs else None
+            if prev and _date(*prev, 1) + relativedelta(months=1) == _date(*key, 1):
+                runs[-1].append(key)
+            else:
+                runs.append([key])
+
+        results = await asyncio.gather(*[
+            self._fetch_events(_date(*run[0], 1), _date(*run[-1], 1) + relativedelta(months=1))
+            for run in runs
+        ])
+
+        loaded = {}
+        for run, busy in zip(runs, results):
+            # одна сортировка на весь диапазон: срезы по месяцам сохраняют порядок,
+            # и AVAILABILITY.put проходит их за один линейный проход
+            busy.sort(key=itemgetter(0))
+            for year, month in run:
+                month_start = TZ.localize(datetime(year, month, 1))
+                month_end = TZ.localize(datetime(year, month, 1) + relativedelta(months=1))
+                month_busy = [(s, e) for s, e in busy if s < month_end and e > month_start]
+                free_by_day = AVAILABILITY.put(year, month, month_busy, generations[(year, month)])
+                loaded[(year, month)] = (month_busy, free_by_day)
+        return loaded
+
+    async def get_months_availability(self, months, force: bool = False):
+        """
+        Возвращает {(year, month): (busy, free_by_day)} для списка месяцев.
+        Что есть в кэше — из кэша, остальное — одной загрузкой на все недостающие месяцы.
+        Одновременные запросы тех же месяцев ждут уже идущую загрузку.
+        force=True — загрузить заново, даже если в кэше есть свежие данные.
+        """
+        result, pending, to_load = {}, {}, []
+        for key in dict.fromkeys(months):
+            cached = None if force else AVAILABILITY.get(*key)
+            if cached is not None:
+                result[key] = cached
+            elif key in _month_loads:
+                pending[key] = _month_loads[key]
+            else:
+                to_load.append(key)
+
+        if to_load:
+            task = asyncio.ensure_future(self._load_months(to_load))
+            for key in to_load:
+                _month_loads[key] = task
+                pending[key] = task
+
+            def _done(_, keys=tuple(to_load), task=task):
+                for key in keys:
+                    if _month_loads.get(key) is task:
+                        del _month_loads[key]
+            task.add_done_callback(_done)
+
+        for task in set(pending.values()):
+            keys = [key for key, t in pending.items() if t is task]
+            try:
+                loaded = await asyncio.shield(task)
+            except Exception as e:
+                if force:
+                    raise
+                # Ошибку не кэшируем: следующий запрос снова сходит в CalDAV
+                logger.error(f"Error fetching month events: {e}")
+                loaded = {key: ([], compute_free_slots_month(*key, [])) for key in keys}
+            for key in keys:
+                result[key] = loaded[key]
+        return result
+
+    async def get_month_availability(self, year: int, month: int, force: bool = False):
+        """
+        Возвращает (busy, free_by_day) за месяц из кэша, при промахе — загружает из CalDAV.
+        force=True — загрузить заново, даже если в кэше есть свежие данные.
+        """
+        result = await self.get_months_availability([(year, month)], force=force)
+        return result[(year, month)]
 
     async def find_free_slots_month(self, year: int, month: int):
         """
-        Находит свободные 3-часовые окна в диапазоне 10:00–22:00
-        для всех дней year/month за один запрос.
+        Находит свободные окна по рабочему расписанию
+        для всех дней year/month (из кэша доступности).
         Возвращает dict: {день: [datetime1, datetime2, ...], ...}.
         """
-        busy_events = await self.get_month_events(year, month)
-        # Группируем по дню
-        busy_by_day = {}
-        for start, end in busy_events:
-            d = start.date().day
-            busy_by_day.setdefault(d, []).append((start, end))
-
-        free_by_day = {}
-        last_day = calendar.monthrange(year, month)[1]
-        for day in range(1, last_day + 1):
-            work_start = TZ.localize(datetime.combine(_date(year, month, day), time(10, 0)))
-            work_end   = TZ.localize(datetime.combine(_date(year, month, day), time(22, 0)))
-            busy_slots = busy_by_day.get(day, [])
-            current = work_start
-            frees = []
-            while current < work_end:
-                nxt = current + timedelta(hours=3)
-                if not any(bs < nxt and be > current for bs, be in busy_slots):
-                    frees.append(current)
-                current = nxt
-            if frees:
-                free_by_day[day] = frees
-
+        _, free_by_day = await self.get_month_availability(year, month)
         return free_by_day
 
     async def update_calendar_status(self, year: int, month: int):
@@ -835,105 +947,216 @@ class IrCalendar:
         """
         # 1) Тянем разом все свободные слоты на месяц
         free_by_day = await self.find_free_slots_month(year, month)
+        return calendar_days_status(year, month, free_by_day)
 
-        days_status = {}
-        today = datetime.now(TZ).date()
-        last_day = calendar.monthrange(year, month)[1]
-
-        for day in range(1, last_day + 1):
-            # прошедшие дни — ❌
-            if datetime(year, month, day).date() < today:
-                days_status[day] = "❌"
-            # есть свободные — ✅
-            elif day in free_by_day:
-                days_status[day] = "✅"
-            # иначе — ⛔
-            else:
-                days_status[day] = "⛔"
 
-        return days_status
+def calendar_days_status(year: int, month: int, free_by_day):
+    """Статусы дней месяца: ❌ — прошедший, ✅ — есть окна, ⛔ — окон нет."""
+    days_status = {}
+    today = datetime.now(TZ).date()
+    last_day = calendar.monthrange(year, month)[1]
+
+    for day in range(1, last_day + 1):
+        # прошедшие дни — ❌
+        if datetime(year, month, day).date() < today:
+            days_status[day] = "❌"
+        # есть свободные — ✅
+        elif day in free_by_day:
+            days_status[day] = "✅"
+        # иначе — ⛔
+        else:
+            days_status[day] = "⛔"
+
+    return days_status
+
+
+def warm_calendar_status(year: int, month: int):
+    """Статусы дней из прогретого кэша или None, если месяц ещё не загружен (или закрыт)."""
+    if f"{year}-{month:02d}" not in STORAGE.open_months():
+        return None
+    cached = AVAILABILITY.get(year, month)
+    if cached is None:
+        return None
+    return calendar_days_status(year, month, cached[1])
+
+
+def prefetch_months():
+    """Месяцы, которые держим прогретыми: текущий и все открытые впереди."""
+    now = datetime.now(TZ)
+    current_key = f"{now.year}-{now.month:02d}"
+    keys = {current_key} | {key for key in STORAGE.open_months() if key >= current_key}
+    return [tuple(map(int, key.split("-"))) for key in sorted(keys)]
+
+
+async def prefetch_availability(context: ContextTypes.DEFAULT_TYPE):
+    """Фоновая задача JobQueue: обновляет кэш доступности, пока его никто не спросил."""
+    cal = IrCalendar()
+    months = prefetch_months()
+    names = ", ".join(f"{year}-{month:02d}" for year, month in months)
+    started = _time.monotonic()
+    try:
+        # все месяцы одной загрузкой, а не по запросу на каждый
+        await cal.get_months_availability(months, force=True)
+    except Exception as e:
+        logger.error("[Prefetch] %s: ошибка за %.2f c: %s", names, _time.monotonic() - started, e)
+    else:
+        logger.info("[Prefetch] %s обновлены за %.2f c", names, _time.monotonic() - started)
+
+async def watch_waitlist_dates(context: ContextTypes.DEFAULT_TYPE):
+    """Фоновая задача JobQueue: окна, освобождённые прямо в календаре, на даты с листом ожидания."""
+    try:
+        opened = await WAITLIST_WATCH.check(context)
+    except Exception as e:
+        logger.error("[Waitlist] Не удалось проверить календарь: %s", e)
+        return
+    for day in opened:
+        AVAILABILITY.invalidate(day.year, day.month)  # в кэше месяца эти окна ещё заняты
+
+async def connect_calendar():
+    """Возвращает URL CalDAV-календаря по имени (из общего подключения)."""
+    return await CALDAV.calendar()
+
+BOOKING_DURATION_HOURS = 1   # длительность события в календаре для подтверждённой заявки
+EVENT_CREATED  = "created"   # событие записано в календарь
+EVENT_CONFLICT = "conflict"  # слот уже занят (по индексу/кэшу или сервер вернул 412)
+EVENT_FAILED   = "failed"    # календарь недоступен или ответил ошибкой — событие не записано
+
+
+async def busy_overlapping(start_dt: datetime, end_dt: datetime):
+    """
+    Занятые интервалы, пересекающие [start_dt, end_dt).
+    incremental — из индекса (один PROPFIND, если ничего не менялось),
+    иначе из свежего кэша месяца, а если его нет — одним REPORT.
+    """
+    if CALDAV_SYNC_MODE == "incremental":
+        try:
+            await CALENDAR_INDEX.refresh()
+            return CALENDAR_INDEX.between(start_dt, end_dt)
+        except Exception as e:
+            logger.warning(f"Incremental sync failed, falling back to REPORT: {e}")
+    else:
+        cached = [AVAILABILITY.get(*key) for key in {(start_dt.year, start_dt.month), (end_dt.year, end_dt.month)}]
+        if all(entry is not None for entry in cached):
+            return [(s, e) for busy, _ in cached for s, e in busy if s < end_dt and e > start_dt]
 
-def connect_calendar():
-    """Возвращает объект CalDAV-календаря по имени."""
-    client = caldav.DAVClient(url=CALDAV_URL, username=USERNAME, password=PASSWORD)
-    principal = client.principal()
-    for c in principal.calendars():
-        if c.name == CALENDAR_NAME:
-            return client.calendar(url=c.url)
-    raise Exception(f"Calendar '{CALENDAR_NAME}' not found")
+    events = await calendar_query(CALDAV, start_dt, end_dt)
+    busy = []
+    for _, data in events.values():
+        busy.extend(busy_intervals(data, TZ, start_dt, end_dt))
+    return busy
 
-def is_slot_free(year: int, month: int, day: int, hour: int, minute: int, duration_hours: float) -> bool:
+async def is_slot_free(year: int, month: int, day: int, hour: int, minute: int, duration_hours: float) -> bool:
     """Проверяет, свободен ли указанный интервал."""
-    cal = connect_calendar()
     start_dt = TZ.localize(datetime(year, month, day, hour, minute))
     end_dt   = start_dt + timedelta(hours=duration_hours)
-    events = cal.date_search(start_dt.date(), (end_dt + timedelta(days=1)).date())
-    for ev in events:
-        gcal = ICalCalendar.from_ical(ev.data)
-        for comp in gcal.walk():
-            if comp.name == "VEVENT":
-                ev_start = comp.get("dtstart").dt
-                ev_end   = comp.get("dtend").dt
-                if isinstance(ev_start, datetime) and not ev_start.tzinfo:
-                    ev_start = TZ.localize(ev_start)
-                if isinstance(ev_end, datetime) and not ev_end.tzinfo:
-                    ev_end = TZ.localize(ev_end)
-                # проверяем пересечение
-                if ev_start < end_dt and ev_end > start_dt:
-                    return False
-    return True
+    return not await busy_overlapping(start_dt, end_dt)
 
-def create_event(year: int, month: int, day: int, hour: int, minute: int,
-                 duration_hours: float, summary: str) -> bool:
+def event_uid(start_dt: datetime) -> str:
+    """UID (и имя ресурса) события для слота: у одного слота — всегда один и тот же."""
+    return f"booking-{start_dt:%Y%m%dT%H%M}"
+
+async def create_event(year: int, month: int, day: int, hour: int, minute: int,
+                       duration_hours: float, summary: str):
     """
-    Создаёт событие в календаре, если слот свободен.
+    Атомарно создаёт событие в календаре, если слот ещё свободен.
     summary — строка «телефон Имя Фамилия».
+
+    Пересечение проверяется по индексу/кэшу, затем один PUT с If-None-Match: *
+    на href, вычисленный из времени слота: если событие для этого слота уже
+    кто-то записал, сервер ответит 412, а не создаст дубль.
+    Возвращает (EVENT_CREATED, uid, href), (EVENT_CONFLICT, None, None) или
+    (EVENT_FAILED, None, None), если календарь недоступен;
+    uid и href сохраняются в заявку, чтобы потом удалить событие одним DELETE.
     """
-    if not is_slot_free(year, month, day, hour, minute, duration_hours):
+    start_dt = TZ.localize(datetime(year, month, day, hour, minute))
+    end_dt   = start_dt + timedelta(hours=duration_hours)
+    try:
+        busy = await busy_overlapping(start_dt, end_dt)
+    except (CalDAVError, httpx.HTTPError, ExecutorBusy) as e:
+        logger.error(f"Не удалось проверить слот {day}.{month}.{year} {hour:02d}:{minute:02d}: {e}")
+        return EVENT_FAILED, None, None
+    if busy:
         logger.warning(f"Slot {day}.{month}.{year} {hour:02d}:{minute:02d} occupied")
-        return False
+        return EVENT_CONFLICT, None, None
 
-    cal = connect_calendar()
     ical = ICalCalendar()
     ical.add("prodid", "-//Telegram Bot//")
     ical.add("version", "2.0")
 
     ev = ICalEvent()
-    start_dt = TZ.localize(datetime(year, month, day, hour, minute))
-    end_dt   = start_dt + timedelta(hours=duration_hours)
-
-    ev.add("uid", str(uuid.uuid4()))
+    uid = event_uid(start_dt)
+    ev.add("uid", uid)
     ev.add("dtstamp", datetime.now(TZ))
     ev.add("dtstart", start_dt)
     ev.add("dtend",   end_dt)
     ev.add("summary", summary)
 
     ical.add_component(ev)
-    cal.add_event(ical.to_ical())
+
+    async def put(calendar_url):
+        href = f"{calendar_url.rstrip('/')}/{uid}.ics"
+        response = await CALDAV.request("PUT", href, ical.to_ical(),
+                                        headers={"Content-Type": "text/calendar; charset=utf-8",
+                                                 "If-None-Match": "*"})
+        if response.status_code == 412:
+            return None
+        if response.status_code == 404:
+            raise NotFoundError("PUT", href, 404)  # календарь переехал — CALDAV.run найдёт его заново
+        if response.status_code >= 400:
+            raise CalDAVError("PUT", href, response.status_code)
+        return href
+
+    try:
+        href = await CALDAV.run(put)
+    except (CalDAVError, httpx.HTTPError, ExecutorBusy) as e:
+        logger.error(f"Не удалось создать событие {day}.{month}.{year} {hour:02d}:{minute:02d}: {e}")
+        return EVENT_FAILED, None, None
+    if href is None:
+        logger.warning(f"Slot {day}.{month}.{year} {hour:02d}:{minute:02d} occupied (412)")
+        return EVENT_CONFLICT, None, None
+    AVAILABILITY.add_busy(start_dt, end_dt)
     logger.info(f"Created calendar event: {summary} at {start_dt}")
+    return EVENT_CREATED, uid, href
+
+async def delete_event_by_href(href: str, start_dt: datetime, end_dt: datetime) -> bool:
+    """
+    Удаляет событие одним DELETE по href, сохранённому в заявке.
+    Возвращает False, если такого ресурса на сервере уже нет.
+    """
+    response = await CALDAV.request("DELETE", href)
+    if response.status_code == 404:
+        return False
+    if response.status_code >= 400:
+        raise CalDAVError("DELETE", href, response.status_code)
+    AVAILABILITY.remove_busy(start_dt, end_dt)
+    logger.info(f"Deleted event from calendar: {href}")
     return True
 
-def delete_event(year: int, month: int, day: int,
-                 hour: int, minute: int,
-                 summary: str) -> bool:
+async def delete_event(year: int, month: int, day: int,
+                       hour: int, minute: int,
+                       summary: str) -> bool:
     """
     Ищет в календаре событие с точным start_dt и summary и удаляет его.
     Возвращает True, если найдено и удалено.
     """
-    cal = connect_calendar()
     start_dt = TZ.localize(datetime(year, month, day, hour, minute))
     # ищем все события за этот день
-    events = cal.date_search(start_dt.date(), start_dt.date() + timedelta(days=1))
-    for ev in events:
-        gcal = ICalCalendar.from_ical(ev.data)
-        for comp in gcal.walk():
-            if comp.name == "VEVENT" and comp.get("summary") == summary:
-                ev_start = comp.get("dtstart").dt
+    events = await calendar_query(CALDAV, start_dt, start_dt + timedelta(days=1))
+    for href, (_, data) in events.items():
+        for item in extract_events(data):
+            if item["summary"] == summary:
+                ev_start = item["dtstart"]
                 # нормализуем timezone
                 if isinstance(ev_start, datetime) and not ev_start.tzinfo:
                     ev_start = TZ.localize(ev_start)
                 if ev_start == start_dt:
-                    ev.delete()
+                    ev_end = item["dtend"]
+                    if isinstance(ev_end, datetime) and not ev_end.tzinfo:
+                        ev_end = TZ.localize(ev_end)
+                    response = await CALDAV.request("DELETE", href)
+                    if response.status_code >= 400 and response.status_code != 404:
+                        raise CalDAVError("DELETE", href, response.status_code)
+                    AVAILABILITY.remove_busy(ev_start, ev_end)
                     logger.info(f"Deleted event from calendar: {summary} at {start_dt}")
                     return True
     return False
@@ -947,7 +1170,7 @@ def generate_calendar(year, month, days_status, mode="auto"):
     mode = "auto" → автоопределение.
     """
     logger.debug("Generating calendar for year: %d, month: %d, mode: %s", year, month, mode)
-    open_months = load_open_months()
+    open_months = STORAGE.open_months()
     key = f"{year}-{month:02d}"
     if key not in open_months:
         logger.info("Месяц %s-%s не открыт для записи.", year, month)
@@ -1046,10 +1269,49 @@ async def admin_notice_save(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         save_notice(text)
         reply = "✅ Объявление обновлено."
+    await NOTICE.durable()
 
     await update.message.reply_text(reply, reply_markup=get_main_menu(update.effective_user.id))
+    if load_notice():
+        await update.message.reply_text(
+            "Разослать объявление всем подписчикам?",
+            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("📣 Разослать", callback_data="broadcast_notice")]])
+        )
     return ConversationHandler.END
 
+async def admin_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Рассылка объявления или сообщения об открытом месяце всем подписчикам."""
+    query = update.callback_query
+    await query.answer()
+    if query.from_user.id not in ADMIN_IDS:
+        await query.edit_message_text("⛔ У вас нет прав.")
+        return
+
+    if query.data == "broadcast_notice":
+        text = load_notice()
+        if not text:
+            await query.edit_message_text("ℹ️ Объявление пустое — рассылать нечего.")
+            return
+        text = f"📣 {text}"
+    else:
+        key = query.data.replace("broadcast_month_", "")
+        month_name = datetime.strptime(key, "%Y-%m").strftime("%B %Y")
+        text = f"🗓 Открыта запись на {month_name}! Выберите удобный день: /start"
+
+    if BROADCASTER.start(context.bot, text, query.from_user.id):
+        await query.edit_message_text(f"📣 Рассылка запущена: {STORAGE.subscriber_count()} подписчиков.")
+    else:
+        await query.edit_message_text("⏳ Предыдущая рассылка ещё идёт, дождитесь её окончания.")
+
+async def resume_broadcast(context: ContextTypes.DEFAULT_TYPE):
+    """После перезапуска продолжает прерванную рассылку."""
+    BROADCASTER.resume(context.bot)
+
+
+async def schedule_missing_reminders(context: ContextTypes.DEFAULT_TYPE):
+    """Один раз: напоминания заявкам, подтверждённым до появления напоминаний (в event loop — запись пачкой)."""
+    REMINDERS.schedule_missing()
+
 def get_main_menu(user_id=None):
     """Создает меню с основными кнопками."""
     keyboard = [
@@ -1094,15 +1356,13 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     username = user.username if user.username else "Нет"
     date_subscribed = datetime.now().strftime("%Y-%m-%d %H:%M")
 
-    # Проверяем, есть ли уже пользователь в базе
-    if not any(sub["id"] == user_id for sub in subscribers):
-        subscribers.append({
-            "id": user_id,
-            "name": user_name,
-            "username": username,
-            "date_subscribed": date_subscribed
-        })
-        save_users(subscribers)
+    # Добавляем пользователя в базу, если его там ещё нет
+    if STORAGE.add_subscriber({
+        "id": user_id,
+        "name": user_name,
+        "username": username,
+        "date_subscribed": date_subscribed
+    }):
         logger.info(f"Новый подписчик: {user_name} (@{username}, {user_id})")
 
     # Отправляем пользователю календарь
@@ -1110,15 +1370,17 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     cal = IrCalendar()
     now = datetime.now(TZ)
 
-    days_status = {day: "❓" for day in range(1, 32)}
-    reply_markup = generate_calendar(now.year, now.month, days_status)
+    # Если фоновая задача уже прогрела месяц — сразу рисуем готовый календарь
+    days_status = warm_calendar_status(now.year, now.month)
+    reply_markup = generate_calendar(now.year, now.month, days_status or {day: "❓" for day in range(1, 32)})
 
     combined_keyboard = get_main_menu(user_id).inline_keyboard + reply_markup.inline_keyboard
     full_reply_markup = InlineKeyboardMarkup(combined_keyboard)
 
     message = await update.message.reply_text("📅 Выберите дату:", reply_markup=full_reply_markup)
 
-    asyncio.create_task(update_calendar_after_sync(message, now.year, now.month, cal))
+    if days_status is None:
+        asyncio.create_task(update_calendar_after_sync(message, now.year, now.month, cal))
 
 async def subscribers_count(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
@@ -1128,13 +1390,19 @@ async def subscribers_count(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.effective_message.reply_text("⛔ У вас нет прав для выполнения этой команды.")
         return
 
-    count = len(subscribers)
-    message = f"📊 *Всего подписчиков: {count}*\n\n"
+    stats = STORAGE.subscriber_stats(datetime.now().strftime("%Y-%m-%d"))  # как date_subscribed в start
+    message = (
+        f"📊 *Всего подписчиков: {stats['total']}*\n"
+        f"🆕 Сегодня: {stats['today']}\n"
+        f"📆 В этом месяце: {stats['month']}\n\n"
+    )
+    separator = "\\-" * 30
 
-    if count == 0:
-        message += "❌ Нет подписчиков."
+    if stats["total"] == 0:
+        message += "❌ Нет подписчиков\\."
     else:
-        for sub in subscribers:
+        message += f"Последние {min(RECENT_SUBSCRIBERS, stats['total'])}:\n\n"
+        for sub in STORAGE.recent_subscribers(RECENT_SUBSCRIBERS):
             name = escape_markdown(sub['name'], version=2)
             user_id = sub['id']
             date_subscribed = escape_markdown(sub['date_subscribed'], version=2)
@@ -1146,7 +1414,7 @@ async def subscribers_count(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 f"\\(ID: `{user_id}`\\)\n"
                 f"📅 Подписался: {date_subscribed}\n"
                 f"{username_display}\n"
-                f"{'\\-' * 30}\n"
+                f"{separator}\n"
             )
     # Кнопки для навигации
     keyboard = [
@@ -1164,7 +1432,7 @@ async def update_calendar_after_sync(message, year, month, cal, user_id=None):
 
 #    loading_message = await message.reply_text("⏳ Загружаем данные...")
     key = f"{year}-{month:02d}"
-    if key not in load_open_months():
+    if key not in STORAGE.open_months():
         await message.edit_text("⛔ *Этот месяц закрыт для записи*", parse_mode="Markdown")
         return
     loading_message = await message.reply_text("⏳ Загружаем данные...")
@@ -1192,7 +1460,7 @@ async def change_month(update: Update, context: ContextTypes.DEFAULT_TYPE):
         direction, _, year, month = parts
         year, month = int(year), int(month)
         key = f"{year}-{month:02d}"
-        if key not in load_open_months():
+        if key not in STORAGE.open_months():
             await query.edit_message_text("⛔ *Этот месяц закрыт для записи*", parse_mode="Markdown")
             return
 
@@ -1208,6 +1476,13 @@ async def change_month(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 month = 1
 
         cal = IrCalendar()
+        days_status = warm_calendar_status(year, month)
+        if days_status is not None:
+            reply_markup = generate_calendar(year, month, days_status)
+            combined_keyboard = get_main_menu(user_id).inline_keyboard + reply_markup.inline_keyboard
+            await query.edit_message_text("📅 Выберите дату:", reply_markup=InlineKeyboardMarkup(combined_keyboard))
+            return
+
         days_status = {day: "❓" for day in range(1, 32)}
         reply_markup = generate_calendar(year, month, days_status)
         message = await query.edit_message_text("📅 Выберите дату:", reply_markup=reply_markup)
@@ -1236,6 +1511,9 @@ async def day_selected(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     cal = IrCalendar()  # Инициализируем объект IrCalendar
     free_slots = await cal.find_free_slots_async(selected_date)
+    # слоты, предложенные листу ожидания, видят только те, кому их предложили
+    held = WAITLIST.held_slots(selected_date.strftime("%Y-%m-%d"), query.from_user.id)
+    free_slots = [slot for slot in free_slots if slot.strftime('%H:%M') not in held]
 
     if not free_slots:
         date_str = selected_date.strftime('%d.%m.%Y')
@@ -1271,15 +1549,10 @@ async def join_waitlist(update: Update, context: ContextTypes.DEFAULT_TYPE):
     date_str = f"{int(day):02d}.{int(month):02d}.{year}"
     user_id = str(query.from_user.id)
 
-    waitlist = load_waitlist()
-    lst = waitlist.get(key, [])
-    if user_id in lst:
+    if not STORAGE.join_waitlist(key, user_id):
         await query.edit_message_text(f"❗ Вы уже в очереди на {date_str}.")
         return
 
-    lst.append(user_id)
-    waitlist[key] = lst
-    save_waitlist(waitlist)
     await query.edit_message_text(
         f"✅ Добавил вас в лист ожидания на {date_str}.\n"
         "Мы уведомим вас, как только появится окно."
@@ -1295,8 +1568,8 @@ async def calendar_open(update: Update, context: ContextTypes.DEFAULT_TYPE):
     now = datetime.now(TZ)
     cal = IrCalendar()
 
-    days_status = {day: "❓" for day in range(1, 32)}
-    reply_markup = generate_calendar(now.year, now.month, days_status)
+    days_status = warm_calendar_status(now.year, now.month)
+    reply_markup = generate_calendar(now.year, now.month, days_status or {day: "❓" for day in range(1, 32)})
 
     combined_keyboard = get_main_menu(user_id).inline_keyboard + reply_markup.inline_keyboard
     full_reply_markup = InlineKeyboardMarkup(combined_keyboard)
@@ -1312,8 +1585,10 @@ async def calendar_open(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.message.delete()
         await query.message.reply_text("📅 Выберите дату:", reply_markup=full_reply_markup)
 
+    if days_status is not None:
+        return
     key = f"{now.year}-{now.month:02d}"
-    if key in load_open_months():
+    if key in STORAGE.open_months():
         asyncio.create_task(update_calendar_after_sync(query.message, now.year, now.month, cal, user_id))
     else:
         await query.message.edit_text("⛔ *Этот месяц закрыт для записи*", parse_mode="Markdown")
@@ -1327,12 +1602,19 @@ async def calendar_back(update: Update, context: ContextTypes.DEFAULT_TYPE):
     now = datetime.now(TZ)
     cal = IrCalendar()
 
+    days_status = warm_calendar_status(now.year, now.month)
+    if days_status is not None:
+        reply_markup = generate_calendar(now.year, now.month, days_status)
+        combined_keyboard = get_main_menu(user_id).inline_keyboard + reply_markup.inline_keyboard
+        await query.edit_message_text("📅 Выберите дату:", reply_markup=InlineKeyboardMarkup(combined_keyboard))
+        return
+
     days_status = {day: "❓" for day in range(1, 32)}
     reply_markup = generate_calendar(now.year, now.month, days_status)
     message = await query.edit_message_text("📅 Выберите дату:", reply_markup=reply_markup)
 
     key = f"{now.year}-{now.month:02d}"
-    if key in load_open_months():
+    if key in STORAGE.open_months():
         asyncio.create_task(update_calendar_after_sync(message, now.year, now.month, cal, user_id))
     else:
         await message.edit_text("⛔ *Этот месяц закрыт для записи*", parse_mode="Markdown")
@@ -1365,21 +1647,6 @@ async def contacts_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.message.reply_text(f"📞 Наш номер телефона: {phone_number}", reply_markup=get_main_menu(int(query.from_user.id)))
 
 
-def load_users():
-    """Загружает список подписчиков из файла."""
-    if not os.path.exists(USERS_FILE):
-        return []
-    with open(USERS_FILE, "r") as file:
-        return json.load(file)
-
-def save_users(users):
-    """Сохраняет список подписчиков в файл."""
-    with open(USERS_FILE, "w") as file:
-        json.dump(users, file, indent=4)
-
-# Загружаем подписчиков при запуске
-subscribers = load_users()
-
 async def book_slot(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Запись на выбранный слот."""
     logger.info("Booking slot...")
@@ -1400,16 +1667,41 @@ async def book_slot(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 async def book_appointment(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    _, year, month, day, slot = update.callback_query.data.split("_")
+    return await start_booking(update, context, int(year), int(month), int(day), slot)
+
+
+async def claim_waitlist_slot(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """«Занять» из предложения листа ожидания: кто нажал первым, тот и записывается."""
+    query = update.callback_query
+    offer = await WAITLIST.claim(context, query.data.replace("claim_", ""), query.from_user.id)
+    if offer is None:
+        await query.answer()
+        await query.edit_message_text("😔 Этот слот уже занят или время на ответ вышло.")
+        return
+    year, month, day = map(int, offer["key"].split("-"))
+    return await start_booking(update, context, year, month, day, offer["slot"], offer_id=offer["id"])
+
+
+async def start_booking(update: Update, context: ContextTypes.DEFAULT_TYPE, year, month, day, slot, offer_id=None):
+    """Заявка на слот: анкета для новых клиентов, иначе сразу администратору."""
     query = update.callback_query
     await query.answer()
 
-    _, year, month, day, slot = query.data.split("_")
-    selected_date = datetime(int(year), int(month), int(day)).strftime('%d.%m.%Y')
+    selected_date = datetime(year, month, day).strftime('%d.%m.%Y')
 
     user = query.from_user
     user_id = user.id
     user_name = user.full_name
 
+    if offer_id is None:
+        key = f"{year}-{month:02d}-{day:02d}"
+        if slot in WAITLIST.held_slots(key, user_id):
+            await query.edit_message_text("⏳ Это время сейчас предложено клиентам из листа ожидания, выберите другое.")
+            return
+        # слот предложен самому пользователю, а он выбрал его в календаре — занимаем предложение
+        offer_id = await WAITLIST.claim_for_booking(context, key, slot, user_id)
+
     booking_id = str(uuid.uuid4())
     booking_data = {
         "id": booking_id,
@@ -1419,13 +1711,13 @@ async def book_appointment(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "slot": slot,
         "status": "pending"
     }
+    if offer_id is not None:
+        WAITLIST.attach_booking(offer_id, booking_id)
 
-    # Загрузка профилей
-    profiles = load_profiles()
     user_key = str(user_id)
 
     # Если у пользователя нет профиля — отправляем анкету
-    if user_key not in profiles:
+    if user_key not in PROFILES:
         logger.info(f"[Booking] Новый пользователь {user_id}, начинаем анкету перед записью")
         context.user_data["confirm_booking_id"] = booking_id
         pending_bookings[booking_id] = {
@@ -1435,29 +1727,18 @@ async def book_appointment(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "slot": slot
         }
 
-        # 💾 Сохраняем в файл
-        bookings = load_bookings()
-        bookings.append(booking_data)
-        save_bookings(bookings)
+        # 💾 Сохраняем
+        STORAGE.add_booking(booking_data)
 
         # Запрос анкеты
         await query.edit_message_text("📋 Для записи, пожалуйста, заполните ваш профиль.\n\nВведите ваше *имя*:")
 
-        # ⏰ Запускаем напоминание через 5 минут
-        async def remind_if_no_profile():
-            await asyncio.sleep(300)  # 5 минут
-            profiles_check = load_profiles()
-            if user_key not in profiles_check and context.user_data.get("confirm_booking_id") == booking_id:
-                logger.info(f"[Booking] Напоминание пользователю {user_id} о незавершённой анкете")
-                await context.bot.send_message(
-                    chat_id=user_id,
-                    text=f"⏰ Вы начали запись на {selected_date} в {slot}, но не завершили анкету.\nХотите продолжить?",
-                    reply_markup=InlineKeyboardMarkup([
-                        [InlineKeyboardButton("📋 Продолжить", callback_data="calendar_open")]
-                    ])
-                )
-
-        asyncio.create_task(remind_if_no_profile())
+        # ⏰ Напоминание через 5 минут (новая запись заменяет прежнее напоминание)
+        SCHEDULER.schedule(
+            "profile_reminder", PROFILE_REMINDER_DELAY,
+            {"user_id": user_id, "booking_id": booking_id, "date": selected_date, "slot": slot},
+            key=f"profile_reminder:{user_id}"
+        )
         return ASK_FIRST_NAME
 
     # ✅ Если профиль уже есть — сразу подтверждение админу
@@ -1470,10 +1751,9 @@ async def book_appointment(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "slot": slot
     }
 
-    # 💾 Сохраняем
-    bookings = load_bookings()
-    bookings.append(booking_data)
-    save_bookings(bookings)
+    # 💾 Сохраняем — и ждём записи на диск, прежде чем звать админа
+    STORAGE.add_booking(booking_data)
+    await STORAGE.durable()
 
     # 🔔 Админу
     buttons = [
@@ -1489,11 +1769,30 @@ async def book_appointment(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"🕒 *Время:* {slot}"
     )
     await context.bot.send_message(chat_id=ADMIN_ID, text=text, parse_mode="Markdown", reply_markup=InlineKeyboardMarkup(buttons))
+    WAITLIST.booking_submitted(booking_id)
 
     # 🔄 Пользователю
     await query.edit_message_text(f"🕒 Запрос на запись отправлен!\n\nОжидайте подтверждения администратора.")
 
 
+async def remind_unfinished_profile(context: ContextTypes.DEFAULT_TYPE, data):
+    """Отложенное действие: напоминает о незаполненной анкете, если заявка всё ещё её ждёт."""
+    user_id = data["user_id"]
+    booking = STORAGE.get_booking(data["booking_id"])
+    if str(user_id) in PROFILES or booking is None or booking["status"] != "pending":
+        return
+    logger.info(f"[Booking] Напоминание пользователю {user_id} о незавершённой анкете")
+    await context.bot.send_message(
+        chat_id=user_id,
+        text=f"⏰ Вы начали запись на {data['date']} в {data['slot']}, но не завершили анкету.\nХотите продолжить?",
+        reply_markup=InlineKeyboardMarkup([
+            [InlineKeyboardButton("📋 Продолжить", callback_data="calendar_open")]
+        ])
+    )
+
+SCHEDULER.register("profile_reminder", remind_unfinished_profile)
+
+
 async def handle_admin_response(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -1508,16 +1807,15 @@ async def handle_admin_response(update: Update, context: ContextTypes.DEFAULT_TY
     user_name = booking["name"]
     slot_info = f"{booking['date']} в {booking['slot']}"
     # Обновляем статус заявки
-    bookings = load_bookings()
-    for b in bookings:
-        if b["id"] == booking_id:
-            b["status"] = "confirmed" if action == "confirm" else "rejected"
-            break
-    save_bookings(bookings)
+    updated = STORAGE.update_booking(booking_id, status="confirmed" if action == "confirm" else "rejected")
 
-    # Удаляем из памяти
+    # Удаляем из памяти (до первого await — повторное нажатие уже не найдёт заявку)
     del pending_bookings[booking_id]
 
+    if action == "confirm" and updated:
+        REMINDERS.booking_confirmed(updated)
+    await WAITLIST.booking_resolved(context, booking_id, confirmed=action == "confirm")
+
     if action == "reject":
         await context.bot.send_message(user_id, f"❌ К сожалению, ваша запись на *{slot_info}* была отклонена.", parse_mode="Markdown")
         await query.edit_message_text(f"❌ Заявка на {slot_info} отклонена.")
@@ -1532,38 +1830,37 @@ async def handle_admin_response(update: Update, context: ContextTypes.DEFAULT_TY
     year, month, day = map(int, booking["date"].split(".")[::-1])  # 'dd.mm.YYYY'
     hour, minute = map(int, booking["slot"].split(":"))
     # Формируем summary из профиля
-    profiles = load_profiles()
-    prof = profiles.get(str(user_id), {})
+    prof = PROFILES.get(user_id, {})
     phone = prof.get("phone", "")
     name  = prof.get("first_name", "")
     last  = prof.get("last_name", "")
     summary = f"{phone} {name} {last}"
 
-    created = create_event(year, month, day, hour, minute, 1, summary)
-    if not created:
+    status, uid, href = await create_event(year, month, day, hour, minute, BOOKING_DURATION_HOURS, summary)
+    if status == EVENT_CREATED:
+        # UID/href события — чтобы отмена была одним DELETE, без поиска по summary
+        STORAGE.update_booking(booking_id, event_uid=uid, event_href=href)
+    if status == EVENT_CONFLICT:
         # Если слот вдруг оказался занят, сообщаем админу
         await context.bot.send_message(
             ADMIN_ID,
             f"❗ Не удалось добавить событие в календарь: слот {slot_info} уже занят."
         )
+    if status == EVENT_FAILED:
+        await context.bot.send_message(
+            ADMIN_ID,
+            f"❗ Не удалось добавить событие в календарь: {slot_info} — календарь недоступен, добавьте событие вручную."
+        )
     # --- Конец нового блока ---
 
-    # 📋 Проверяем профиль
-    profiles = load_profiles()
-    user_key = str(user_id)
-    if user_key not in profiles:
+    # 📋 Проверяем профиль: если есть — добавляем запись в историю
+    if not PROFILES.add_history(user_id, slot_info):
         context.user_data["confirm_booking_id"] = booking_id  # 👈 ВОТ ЗДЕСЬ
         await context.bot.send_message(
             user_id,
             "📋 Чтобы в будущем записываться быстрее, пожалуйста, заполните ваш профиль.\n\nВведите ваше *имя*:"
         )
         return ASK_FIRST_NAME  # 👈 запустить анкету
-    else:
-        # Добавить запись в историю (если профиль есть)
-        history = profiles[user_key].get("history", [])
-        history.append(slot_info)
-        profiles[user_key]["history"] = history
-        save_profiles(profiles)
 
 async def show_bookings(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
@@ -1571,7 +1868,7 @@ async def show_bookings(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("⛔ У вас нет прав.")
         return
 
-    bookings = load_bookings()
+    bookings = STORAGE.bookings()
     if not bookings:
         await update.message.reply_text("📭 Заявок пока нет.")
         return
@@ -1701,7 +1998,7 @@ async def edit_price(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return ConversationHandler.END
 
     global price_items
-    price_items = parse_html_price()
+    price_items = await CPU.run(parse_html_price)
 
     keyboard = [
         [InlineKeyboardButton(f"{name} — {price}", callback_data=f"edit_{i}")]
@@ -1753,11 +2050,14 @@ async def edit_field(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     elif action == "save_edit":
         # Сохраняем HTML
-        update_price_html()
-        upload_price_to_github()  # 👈 ДОБАВЬ ЭТО
+        await CPU.run(update_price_html)
+        try:
+            await GIT_IO.run(upload_price_to_github)  # 👈 ДОБАВЬ ЭТО
+        except ExecutorBusy as e:
+            logger.warning(f"❌ Выгрузка в GitHub пропущена: {e}")
         # Заново загружаем price_items
         global price_items
-        price_items = parse_html_price()
+        price_items = await CPU.run(parse_html_price)
 
         # Кнопки
         keyboard = [
@@ -1830,14 +2130,34 @@ def update_price_html():
     #    f.write(str(soup))
 
 
+async def close_caldav(application):
+    """Закрывает пул соединений CalDAV, пулы исполнителей и хранилища при остановке бота."""
+    await PROFILES.close()  # несохранённые профили и файлы — до остановки исполнителей
+    await STORAGE.durable()
+    await NOTICE.durable()
+    await BROADCASTER.state.durable()
+    await WAITLIST.state.durable()
+    await WAITLIST_WATCH.state.durable()
+    await CALDAV.close()
+    for executor in EXECUTORS:
+        executor.shutdown()
+    STORAGE.close()
+
+
+async def report_executor_stats(context: ContextTypes.DEFAULT_TYPE):
+    """Периодически пишет в лог глубину очередей и время ожидания исполнителей."""
+    log_stats(EXECUTORS)
+
+
 def main():
     """Запуск бота."""
     logger.info("Bot started.")
-    application = Application.builder().token(TOKEN).build()
+    application = Application.builder().token(TOKEN).post_shutdown(close_caldav).build()
 
     booking_conv = ConversationHandler(
         entry_points=[
-            CallbackQueryHandler(book_appointment, pattern=r"^book_\d+_\d+_\d+_\d+:\d+$")
+            CallbackQueryHandler(book_appointment, pattern=r"^book_\d+_\d+_\d+_\d+:\d+$"),
+            CallbackQueryHandler(claim_waitlist_slot, pattern=r"^claim_[0-9a-f]+$"),
         ],
         states={
             ASK_FIRST_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, ask_first_name)],
@@ -1929,10 +2249,32 @@ def main():
     application.add_handler(
         CallbackQueryHandler(view_waitlist, pattern="^view_waitlist$")
     )
+    application.add_handler(
+        CallbackQueryHandler(admin_broadcast, pattern=r"^broadcast_(notice|month_\d{4}-\d{2})$")
+    )
     application.add_handler(
         CallbackQueryHandler(cancel_waitlist, pattern=r"^cancel_wait_\d{4}-\d{2}-\d{2}$")
     )
 
+    # На JobQueue держатся отложенные действия (напоминания, окна листа ожидания) и фоновые задачи —
+    # без неё бот молча терял бы их, поэтому не запускаемся
+    if application.job_queue is None:
+        raise RuntimeError("JobQueue недоступна: установите python-telegram-bot[job-queue] (APScheduler)")
+    SCHEDULER.attach(application.job_queue)
+    application.job_queue.run_once(schedule_missing_reminders, when=1, name="reminders_backfill")
+    # Фоновый прогрев кэша доступности (текущий + открытые месяцы)
+    application.job_queue.run_repeating(
+        prefetch_availability, interval=PREFETCH_INTERVAL, first=1, name="availability_prefetch"
+    )
+    application.job_queue.run_once(resume_broadcast, when=1, name="broadcast_resume")
+    application.job_queue.run_repeating(
+        watch_waitlist_dates, interval=WAITLIST_WATCH_INTERVAL, first=5, name="waitlist_watch"
+    )
+    application.job_queue.run_repeating(
+        report_executor_stats, interval=EXECUTOR_STATS_INTERVAL, first=EXECUTOR_STATS_INTERVAL,
+        name="executor_stats"
+    )
+
     application.run_polling()
 
 
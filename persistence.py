@@ -0,0 +1,201 @@
+# persistence.py
+"""
+Файлы с данными, у которых один писатель.
+
+Значение держится в памяти; обработчики меняют его сразу (в event loop, по
+одному — гонок чтение-изменение-запись нет) и вызывают changed(). Запись
+на диск делает одна фоновая задача на файл: все изменения, пришедшие за
+delay секунд или пока шла предыдущая запись, уходят одной записью.
+Пишется атомарно (временный файл + fsync + rename) в исполнителе, не в event loop.
+
+    await f.durable()  — дождаться, пока текущее состояние окажется на диске.
+
+PersistentFile — значение целиком (JSON/текст), файл переписывается.
+AppendLog      — JSON lines, новые записи дописываются в конец.
+"""
+import asyncio
+import json
+import logging
+import os
+from abc import ABC, abstractmethod
+
+logger = logging.getLogger(__name__)
+
+
+def atomic_write(path, data):
+    """Записывает bytes так, что на диске остаётся либо старый файл, либо новый целиком."""
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def json_codec(**dump_kwargs):
+    encode = lambda value: json.dumps(value, ensure_ascii=False, **dump_kwargs).encode("utf-8")
+    decode = lambda data: json.loads(data.decode("utf-8"))
+    return encode, decode
+
+
+TEXT_CODEC = (lambda value: value.encode("utf-8"), lambda data: data.decode("utf-8").strip())
+
+
+class _BackgroundWriter(ABC):
+    """
+    Общая часть: номера изменений, фоновая задача записи и ожидание durable().
+    Наследник обязан задать _take() — что писать (берётся в event loop) и _store(data) — как.
+    """
+
+    def __init__(self, path, executor=None, delay=0.05):
+        self.path = path
+        self.executor = executor  # BoundedExecutor с потоками: запись файла
+        self.delay = delay
+        self._version = 0         # номер последнего изменения
+        self._written = 0         # номер изменения, которое уже на диске
+        self._waiters = []        # (version, future) из durable()
+        self._writer = None
+
+    @abstractmethod
+    def _take(self):
+        ...
+
+    @abstractmethod
+    def _store(self, data):
+        ...
+
+    def _restore(self, data):
+        """Запись не удалась — вернуть взятое в _take(), чтобы записать в следующий раз."""
+
+    def changed(self):
+        """Отмечает изменение; запись произойдёт в фоне."""
+        self._version += 1
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush_now()  # вне event loop (скрипты, миграция) — пишем сразу
+            return
+        self._start_writer(loop)
+
+    def _start_writer(self, loop):
+        if self._writer is None or self._writer.done():
+            self._writer = loop.create_task(self._write_loop())
+
+    async def _write_loop(self):
+        while self._written < self._version:
+            await asyncio.sleep(self.delay)
+            version = self._version
+            data = self._take()  # снимок в event loop — дальше данные можно менять
+            try:
+                if self.executor is not None:
+                    await self.executor.run(self._store, data)
+                else:
+                    self._store(data)
+            except Exception as e:
+                logger.exception("[Persist] Не удалось записать %s, повтор", self.path)
+                self._restore(data)
+                self._wake(version, error=e)
+                await asyncio.sleep(1)
+                continue
+            self._written = version
+            self._wake(version)
+
+    def _wake(self, version, error=None):
+        waiting = []
+        for target, future in self._waiters:
+            if target > version:
+                waiting.append((target, future))
+            elif future.done():
+                continue
+            elif error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(None)
+        self._waiters = waiting
+
+    async def durable(self):
+        """Ждёт, пока все изменения до этого момента будут записаны."""
+        if self._written >= self._version:
+            return
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._waiters.append((self._version, future))
+        self._start_writer(loop)  # писатель мог быть отменён вместе с прошлым event loop
+        await future
+
+    def flush_now(self):
+        """Синхронная запись (остановка бота, вызов вне event loop)."""
+        if self._written < self._version:
+            version = self._version
+            self._store(self._take())
+            self._written = version
+
+
+class PersistentFile(_BackgroundWriter):
+    """Значение (value) из файла path; default — если файла ещё нет. Файл переписывается целиком."""
+
+    def __init__(self, path, default, codec=None, executor=None, delay=0.05):
+        super().__init__(path, executor, delay)
+        self.encode, self.decode = codec or json_codec(indent=4)
+        self.value = self._read(default)
+
+    def _read(self, default):
+        if not self.path or not os.path.exists(self.path):
+            return default
+        with open(self.path, "rb") as f:
+            return self.decode(f.read())
+
+    def _take(self):
+        return self.encode(self.value)
+
+    def _store(self, data):
+        atomic_write(self.path, data)
+
+
+class AppendLog(_BackgroundWriter):
+    """
+    Файл JSON lines, в который только дописывают: запись нового элемента стоит
+    одну строку, а не перезапись всего файла. Строки, накопленные за delay
+    секунд, дописываются одним write + fsync.
+    """
+
+    def __init__(self, path, executor=None, delay=0.05):
+        super().__init__(path, executor, delay)
+        self._pending = []
+
+    def read(self):
+        """Все записи файла; недописанная последняя строка (падение во время записи) пропускается."""
+        if not self.path or not os.path.exists(self.path):
+            return []
+        with open(self.path, "rb") as f:
+            lines = f.read().split(b"\n")
+        records = []
+        for n, line in enumerate(lines):
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                if n < len(lines) - 1:
+                    raise
+                logger.warning("[Persist] Недописанная строка в конце %s пропущена", self.path)
+                with open(self.path, "rb+") as f:
+                    f.truncate(sum(len(l) + 1 for l in lines[:n]))
+        return records
+
+    def append(self, record):
+        self._pending.append(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+        self.changed()
+
+    def _take(self):
+        data, self._pending = b"".join(self._pending), []
+        return data
+
+    def _restore(self, data):
+        self._pending.insert(0, data)
+
+    def _store(self, data):
+        with open(self.path, "ab") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
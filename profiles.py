@@ -0,0 +1,207 @@
+# profiles.py
+"""
+Профили пользователей: каждая запись зашифрована отдельно (Fernet) и лежит
+в SQLite под своим user_id.
+
+При старте читаются только зашифрованные записи; расшифровывается профиль
+при первом обращении к нему, дальше чтения — обращения к dict. Поэтому
+прочитать или изменить один профиль стоит одну расшифровку/шифровку,
+сколько бы клиентов ни было в базе.
+
+Изменённые профили помечаются, и через flush_delay секунд после изменения
+шифруются и записываются только они — одной транзакцией на все изменения,
+пришедшие за это время. При остановке бота несохранённое дописывается сразу.
+
+Старый формат (весь словарь профилей одним Fernet-токеном) переносится
+в базу один раз — migrate_from_blob().
+"""
+import asyncio
+import copy
+import json
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS profiles (user_id TEXT PRIMARY KEY, token BLOB NOT NULL);
+"""
+
+
+class ProfileRepository:
+    """Профили: user_id (str) → {"first_name", "last_name", "phone", "history": [...]}."""
+
+    def __init__(self, path, fernet, flush_delay=2.0, executor=None):
+        self.path = path
+        self.fernet = fernet
+        self.flush_delay = flush_delay
+        self.executor = executor  # BoundedExecutor для шифрования и записи
+        self._db_lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        self._tokens = {}         # user_id → зашифрованная запись (ещё не расшифрованная)
+        self._profiles = {}       # user_id → расшифрованный профиль
+        self._dirty = set()       # user_id, изменённые после последней записи
+        self._flush_task = None
+        self._flush_lock = asyncio.Lock()
+        self.load()
+
+    def load(self):
+        with self._db_lock:
+            rows = self._db.execute("SELECT user_id, token FROM profiles").fetchall()
+        self._tokens = dict(rows)
+        self._profiles = {}
+        logger.info("[Profile] Профилей в базе: %d", len(self._tokens))
+
+    def migrate_from_blob(self, blob_path):
+        """
+        Однократно переносит профили из старого файла (все профили одним токеном).
+        Старый файл не трогается; факт миграции записан в meta.
+        """
+        if not blob_path or not os.path.exists(blob_path):
+            return False
+        with self._db_lock:
+            if self._db.execute("SELECT value FROM meta WHERE key = 'migrated_from_blob'").fetchall():
+                return False
+        with open(blob_path, "rb") as f:
+            encrypted = f.read()
+        try:
+            profiles = json.loads(self.fernet.decrypt(encrypted).decode("utf-8"))
+        except Exception as e:
+            logger.error("Не удалось расшифровать %s, профили не перенесены: %s", blob_path, e)
+            return False
+        records = {user_id: self._encode(profile) for user_id, profile in profiles.items()}
+        self._store(records, meta=("migrated_from_blob", datetime.now().isoformat(timespec="seconds")))
+        self.load()
+        logger.info("[Profile] Перенесено профилей из %s: %d", blob_path, len(records))
+        return True
+
+    # ── чтение ───────────────────────────────────────────────────────────
+    def _profile(self, user_id):
+        """Профиль из памяти; при первом обращении расшифровывается его запись (и только она)."""
+        profile = self._profiles.get(user_id)
+        if profile is None and user_id in self._tokens:
+            try:
+                profile = json.loads(self.fernet.decrypt(self._tokens[user_id]).decode("utf-8"))
+            except Exception as e:
+                logger.error("Не удалось расшифровать профиль %s: %s", user_id, e)
+                return None
+            self._profiles[user_id] = profile
+        return profile
+
+    def __contains__(self, user_id):
+        user_id = str(user_id)
+        return user_id in self._profiles or user_id in self._tokens
+
+    def get(self, user_id, default=None):
+        profile = self._profile(str(user_id))
+        return copy.deepcopy(profile) if profile is not None else default
+
+    def all(self):
+        """Все профили (расшифровывает те, к которым ещё не обращались)."""
+        user_ids = list(self._tokens) + [u for u in self._profiles if u not in self._tokens]
+        return {user_id: copy.deepcopy(p) for user_id in user_ids if (p := self._profile(user_id)) is not None}
+
+    # ── изменения ────────────────────────────────────────────────────────
+    def put(self, user_id, profile):
+        self._profiles[str(user_id)] = copy.deepcopy(profile)
+        self._changed(str(user_id))
+
+    def update(self, user_id, **fields):
+        """Меняет поля профиля; False, если профиля нет."""
+        profile = self._profile(str(user_id))
+        if profile is None:
+            return False
+        profile.update(fields)
+        self._changed(str(user_id))
+        return True
+
+    def add_history(self, user_id, entry):
+        """Добавляет запись в историю; False, если профиля нет."""
+        profile = self._profile(str(user_id))
+        if profile is None:
+            return False
+        profile.setdefault("history", []).append(entry)
+        self._changed(str(user_id))
+        return True
+
+    def _changed(self, user_id):
+        self._dirty.add(user_id)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._tokens.update(self._write(self._snapshot()))  # вне event loop (скрипты) — пишем сразу
+            return
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = loop.create_task(self._flush_later())
+
+    # ── запись на диск ───────────────────────────────────────────────────
+    async def _flush_later(self):
+        # изменения, пришедшие во время записи, уходят следующим кругом
+        while self._dirty:
+            await asyncio.sleep(self.flush_delay)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("[Profile] Не удалось сохранить профили, повтор через %s с", self.flush_delay)
+
+    def _snapshot(self):
+        """Изменённые профили как JSON (берётся в event loop, шифруется уже в исполнителе)."""
+        snapshot = {user_id: json.dumps(self._profiles[user_id], ensure_ascii=False).encode("utf-8")
+                    for user_id in self._dirty}
+        self._dirty.clear()
+        return snapshot
+
+    def _encode(self, profile):
+        return self.fernet.encrypt(json.dumps(profile, ensure_ascii=False).encode("utf-8"))
+
+    def _write(self, snapshot):
+        """
+        Шифрует и записывает snapshot; идёт в потоке исполнителя, поэтому память не трогает —
+        записи возвращаются, и _tokens обновляет вызывающий.
+        """
+        records = {user_id: self.fernet.encrypt(data) for user_id, data in snapshot.items()}
+        self._store(records)
+        logger.debug("[Profile] Записано профилей: %d", len(records))
+        return records
+
+    def _store(self, records, meta=None):
+        with self._db_lock:
+            self._db.execute("BEGIN")
+            try:
+                self._db.executemany("INSERT OR REPLACE INTO profiles (user_id, token) VALUES (?, ?)",
+                                     records.items())
+                if meta is not None:
+                    self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", meta)
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    async def flush(self):
+        """Записывает изменённые профили, если такие есть."""
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            snapshot = self._snapshot()
+            try:
+                if self.executor is not None:
+                    records = await self.executor.run(self._write, snapshot)
+                else:
+                    records = self._write(snapshot)
+            except Exception:
+                self._dirty.update(snapshot)  # не записалось — попробуем при следующем flush
+                raise
+            self._tokens.update(records)  # уже в event loop
+
+    async def close(self):
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+        await self.flush()
+        with self._db_lock:
+            self._db.close()
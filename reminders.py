@@ -0,0 +1,143 @@
+# reminders.py
+"""
+Напоминания клиентам перед визитом.
+
+Для подтверждённой заявки ставится по отложенному действию (scheduler.py)
+на каждый сдвиг из offsets — например, за 24 и за 2 часа до начала.
+Заявки не перебираются: напоминания добавляются, когда администратор
+подтверждает заявку, и снимаются, когда её отменяют. Отдельных задач
+со sleep на каждую запись нет — все напоминания лежат в куче планировщика.
+
+Напоминания, наступившие одновременно, приходят одной пачкой и рассылаются
+несколькими воркерами через RateLimiter рассылки (лимиты Telegram). Перед
+отправкой заявка проверяется ещё раз: если её успели отменить или перенести,
+напоминание не уходит.
+
+schedule_missing() один раз ставит напоминания подтверждённым заявкам,
+у которых их нет (заявки, подтверждённые до появления напоминаний), и
+записывает отметку в хранилище (Storage.set_meta) — при следующих запусках
+заявки уже не перебираются. Уже наступившие сдвиги пропускаются, поэтому
+отправленное не повторится.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+from telegram.error import BadRequest, Forbidden, RetryAfter
+
+from broadcast import RateLimiter, retry_after_seconds
+
+logger = logging.getLogger(__name__)
+
+KIND = "appointment_reminder"
+BACKFILL_MARK = "reminders_backfilled"
+
+
+def _hours_text(hours):
+    if hours % 24 == 0:
+        days = hours // 24
+        return "завтра" if days == 1 else f"через {days} дн."
+    return f"через {hours:g} ч."
+
+
+class AppointmentReminders:
+    """Напоминания за offsets часов до каждой подтверждённой записи."""
+
+    def __init__(self, scheduler, storage, tz, offsets=(24, 2), rate=25, workers=4):
+        self.scheduler = scheduler
+        self.storage = storage
+        self.tz = tz
+        self.offsets = sorted(offsets, reverse=True)
+        self.rate = rate
+        self.workers = workers
+        scheduler.register(KIND, self.send_due, batch=True)
+
+    def _start(self, booking):
+        return self.tz.localize(datetime.strptime(f"{booking['date']} {booking['slot']}", "%d.%m.%Y %H:%M"))
+
+    @staticmethod
+    def _key(booking_id, offset):
+        return f"{KIND}:{booking_id}:{offset:g}"
+
+    # ── изменения заявок ─────────────────────────────────────────────────
+    def booking_confirmed(self, booking, only_missing=False):
+        """Ставит напоминания заявке; сдвиги, время которых уже прошло, пропускаются."""
+        start = self._start(booking)
+        now = datetime.now(self.tz)
+        scheduled = 0
+        for offset in self.offsets:
+            due = start - timedelta(hours=offset)
+            key = self._key(booking["id"], offset)
+            if due <= now or (only_missing and self.scheduler.get(key) is not None):
+                continue
+            self.scheduler.schedule(KIND, due, {"booking_id": booking["id"], "offset": offset,
+                                                "date": booking["date"], "slot": booking["slot"]}, key=key)
+            scheduled += 1
+        return scheduled
+
+    def booking_cancelled(self, booking_id):
+        """Снимает напоминания заявки (отменена или отклонена)."""
+        for offset in self.offsets:
+            self.scheduler.cancel(self._key(booking_id, offset))
+
+    def schedule_missing(self):
+        """
+        Однократно ставит напоминания подтверждённым будущим заявкам, у которых их ещё нет.
+        Повторный вызов ничего не делает — факт записан в meta хранилища.
+        """
+        if self.storage.get_meta(BACKFILL_MARK):
+            return 0
+        now = datetime.now(self.tz)
+        scheduled = sum(self.booking_confirmed(b, only_missing=True)
+                        for b in self.storage.bookings_by_status("confirmed") if self._start(b) > now)
+        self.storage.set_meta(BACKFILL_MARK, now.isoformat(timespec="seconds"))
+        logger.info("[Reminders] Поставлено недостающих напоминаний: %d", scheduled)
+        return scheduled
+
+    # ── отправка ─────────────────────────────────────────────────────────
+    async def send_due(self, context, items):
+        """Обработчик планировщика: пачка наступивших напоминаний."""
+        queue = asyncio.Queue()
+        for item in items:
+            booking = self.storage.get_booking(item["booking_id"])
+            if (booking is None or booking["status"] != "confirmed"
+                    or (booking["date"], booking["slot"]) != (item["date"], item["slot"])):
+                continue  # отменили или перенесли после того, как напоминание поставили
+            queue.put_nowait((booking, item["offset"]))
+        if queue.empty():
+            return
+        total = queue.qsize()
+        limiter = RateLimiter(self.rate)
+        sent = []
+        await asyncio.gather(*(self._worker(context.bot, queue, limiter, sent) for _ in range(self.workers)))
+        logger.info("[Reminders] Отправлено напоминаний: %d из %d", len(sent), total)
+
+    async def _worker(self, bot, queue, limiter, sent):
+        while True:
+            try:
+                booking, offset = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            if await self._send(bot, limiter, booking, offset):
+                sent.append(booking["id"])
+
+    async def _send(self, bot, limiter, booking, offset, attempts=3):
+        text = (
+            f"⏰ Напоминаем: вы записаны {_hours_text(offset)} — "
+            f"{booking['date']} в {booking['slot']}.\n"
+            "Если планы изменились, отмените запись в «📋 Мои заявки», чтобы окно досталось другому."
+        )
+        for _ in range(attempts):
+            await limiter.wait(booking["user_id"])
+            try:
+                await bot.send_message(chat_id=booking["user_id"], text=text)
+                return True
+            except RetryAfter as e:
+                limiter.pause(retry_after_seconds(e))
+            except (Forbidden, BadRequest) as e:
+                logger.info("[Reminders] %s: напоминание не доставлено: %s", booking["user_id"], e)
+                return False
+            except Exception as e:
+                logger.warning("[Reminders] %s: ошибка отправки: %s", booking["user_id"], e)
+                return False
+        return False
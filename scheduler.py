@@ -0,0 +1,168 @@
+# scheduler.py
+"""
+Отложенные действия бота, которые переживают перезапуск.
+
+Действие — запись {"id", "kind", "due", "key", "data"}: что сделать (kind —
+имя обработчика, зарегистрированного через register()), когда (due, unix time)
+и с какими данными (data — JSON). Записи лежат в хранилище (Storage.save_job),
+в памяти — куча по due. На JobQueue всегда стоит одна задача — на ближайшее
+действие; когда она срабатывает, выполняются все наступившие действия
+и ставится задача на следующее.
+
+Обработчик, зарегистрированный с batch=True, получает все наступившие
+действия своего вида одним вызовом — списком data (например, напоминания,
+которые разом наступили для сотен записей, отправляются одной пачкой).
+Каждый вызов обработчика идёт отдельной задачей, и задача на следующее
+действие ставится, не дожидаясь их окончания.
+
+key — необязательное имя действия: новое действие с тем же key заменяет
+старое, cancel(key) отменяет его (например, напоминание об анкете, когда
+анкета уже заполнена). Отменённые записи из кучи не вынимаются — они
+пропускаются, когда доходит их очередь.
+
+Действие удаляется из хранилища перед выполнением: если бот упадёт
+посреди обработчика, повторно оно не выполнится.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+import uuid
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class JobScheduler:
+    """Куча отложенных действий поверх Storage и одной задачи JobQueue."""
+
+    def __init__(self, storage):
+        self.storage = storage
+        self._handlers = {}       # kind → (async handler(context, data или [data, ...]), batch)
+        self._jobs = {}           # id → действие
+        self._keys = {}           # key → id
+        self._heap = []           # (due, seq, id); записи отменённых действий остаются до своей очереди
+        self._seq = itertools.count()
+        self._job_queue = None
+        self._timer = None        # задача JobQueue на ближайшее действие
+        self._timer_due = None
+        for job in storage.scheduled_jobs():
+            self._push(job)
+        logger.info("[Scheduler] Отложенных действий в хранилище: %d", len(self._jobs))
+
+    def register(self, kind, handler, batch=False):
+        """
+        handler(context, data) — корутина, выполняющая действие kind;
+        при batch=True — handler(context, [data, ...]) на все наступившие сразу.
+        """
+        self._handlers[kind] = (handler, batch)
+
+    def attach(self, job_queue):
+        """Подключает JobQueue и ставит задачу на ближайшее действие (в том числе просроченное)."""
+        self._job_queue = job_queue
+        self._arm()
+
+    def __len__(self):
+        return len(self._jobs)
+
+    # ── действия ─────────────────────────────────────────────────────────
+    def schedule(self, kind, when, data=None, key=None):
+        """
+        Планирует действие kind: when — через сколько секунд или datetime (aware).
+        Действие с тем же key заменяется. Возвращает id.
+        """
+        due = when.timestamp() if isinstance(when, datetime) else time.time() + when
+        if key is not None:
+            self.cancel(key)
+        job = {"id": uuid.uuid4().hex, "kind": kind, "due": due, "key": key, "data": data or {}}
+        self.storage.save_job(job)
+        self._push(job)
+        self._arm()
+        return job["id"]
+
+    def cancel(self, key):
+        """Отменяет действие с этим key; False, если его не было."""
+        job_id = self._keys.get(key)
+        if job_id is None:
+            return False
+        self._forget(job_id)
+        self.storage.delete_job(job_id)
+        return True
+
+    def get(self, key):
+        """Запланированное действие с этим key или None."""
+        job_id = self._keys.get(key)
+        return dict(self._jobs[job_id]) if job_id is not None else None
+
+    def _push(self, job):
+        self._jobs[job["id"]] = job
+        if job.get("key") is not None:
+            self._keys[job["key"]] = job["id"]
+        heapq.heappush(self._heap, (job["due"], next(self._seq), job["id"]))
+
+    def _forget(self, job_id):
+        job = self._jobs.pop(job_id, None)
+        if job is not None and job.get("key") is not None and self._keys.get(job["key"]) == job_id:
+            del self._keys[job["key"]]
+        return job
+
+    def _next_due(self):
+        """due ближайшего действия; отменённые записи с вершины кучи выбрасываются."""
+        while self._heap and self._heap[0][2] not in self._jobs:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    # ── задача JobQueue ──────────────────────────────────────────────────
+    def _arm(self):
+        if self._job_queue is None:
+            return  # до attach(): задача будет поставлена при подключении
+        due = self._next_due()
+        if due is None or (self._timer is not None and self._timer_due <= due):
+            return
+        if self._timer is not None:
+            self._timer.schedule_removal()
+        self._timer_due = due
+        self._timer = self._job_queue.run_once(self._run_due, when=max(0.0, due - time.time()),
+                                               name="scheduler")
+
+    async def _run_due(self, context):
+        self._timer = self._timer_due = None
+        now = time.time()
+        due_jobs = []
+        while (due := self._next_due()) is not None and due <= now:
+            _, _, job_id = heapq.heappop(self._heap)
+            due_jobs.append(self._forget(job_id))
+            self.storage.delete_job(job_id)
+
+        batches = {}
+        calls = []
+        for job in due_jobs:
+            handler, batch = self._handlers.get(job["kind"], (None, False))
+            if handler is None:
+                logger.warning("[Scheduler] Нет обработчика для %s, действие %s пропущено", job["kind"], job["id"])
+            elif batch:
+                batches.setdefault(job["kind"], []).append(job["data"])
+            else:
+                calls.append(self._call(job["kind"], handler, context, job["data"]))
+        for kind, items in batches.items():
+            calls.append(self._call(kind, self._handlers[kind][0], context, items))
+        # каждый обработчик — своей задачей, а таймер ставится сразу: долгая пачка
+        # напоминаний не задерживает ни другие виды действий, ни следующие сроки
+        tasks = [self._create_task(context, call) for call in calls]
+        self._arm()
+        if tasks:
+            await asyncio.gather(*tasks)
+
+    @staticmethod
+    def _create_task(context, coro):
+        application = getattr(context, "application", None)
+        if application is not None:
+            return application.create_task(coro)
+        return asyncio.create_task(coro)
+
+    async def _call(self, kind, handler, context, data):
+        try:
+            await handler(context, data)
+        except Exception:
+            logger.exception("[Scheduler] Ошибка в действии %s", kind)
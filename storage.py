@@ -0,0 +1,769 @@
+# storage.py
+"""
+Хранилище заявок, листа ожидания, подписчиков, открытых месяцев
+и отложенных действий (scheduler.py).
+
+JsonStorage   — прежние JSON-файлы; данные в памяти, файл переписывается в фоне
+                пачкой изменений (persistence.PersistentFile).
+SqliteStorage — одна база SQLite (WAL) с индексами: запросы по индексу,
+                изменения — одной строкой. migrate_from() переносит JSON-файлы.
+JournalStorage (journal.py) — заявки и лист ожидания в памяти + журнал изменений.
+
+Какое хранилище использовать — "storage" в config.json ("json", "sqlite" или "journal").
+Заявка — dict как в bookings.json: id, user_id, name, date ("dd.mm.YYYY"), slot, status, ...
+"""
+import copy
+import json
+import logging
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import Counter
+from datetime import datetime
+from itertools import islice
+
+from persistence import AppendLog, PersistentFile, json_codec
+
+logger = logging.getLogger(__name__)
+
+
+def iso_date(booking_date):
+    """'dd.mm.YYYY' → 'YYYY-MM-DD' (так даты сортируются и ищутся по диапазону)."""
+    return datetime.strptime(booking_date, "%d.%m.%Y").strftime("%Y-%m-%d")
+
+
+def month_key(booking_date):
+    """'dd.mm.YYYY' → 'YYYY-MM'."""
+    day, month, year = booking_date.split(".")
+    return f"{year}-{month}"
+
+
+class BookingIndex:
+    """
+    Заявки в памяти с индексами по id, user_id, месяцу и статусу.
+
+    Индексы обновляются при каждом add()/update(), поэтому запрос по одному
+    пользователю или месяцу перебирает только его заявки. Результаты — в порядке
+    создания заявок.
+    """
+
+    _FIELDS = ("user_id", "month", "status")
+
+    def __init__(self, bookings=()):
+        self._by_id = {}     # id → заявка (тот же dict, что лежит в списке/файле)
+        self._seq = {}       # id → порядковый номер создания
+        self._by = {field: {} for field in self._FIELDS}  # поле → значение → {id, ...}
+        for booking in bookings:
+            self.add(booking)
+
+    def _keys(self, booking):
+        return {"user_id": booking["user_id"], "month": month_key(booking["date"]), "status": booking["status"]}
+
+    def _link(self, booking_id, keys):
+        for field, value in keys.items():
+            self._by[field].setdefault(value, set()).add(booking_id)
+
+    def _unlink(self, booking_id, keys):
+        for field, value in keys.items():
+            ids = self._by[field].get(value)
+            if ids is not None:
+                ids.discard(booking_id)
+                if not ids:
+                    del self._by[field][value]
+
+    def add(self, booking):
+        if booking["id"] in self._by_id:
+            self._unlink(booking["id"], self._keys(self._by_id[booking["id"]]))
+        else:
+            self._seq[booking["id"]] = len(self._seq)
+        self._by_id[booking["id"]] = booking
+        self._link(booking["id"], self._keys(booking))
+
+    def update(self, booking_id, fields):
+        """Меняет поля заявки на месте; возвращает её или None."""
+        booking = self._by_id.get(booking_id)
+        if booking is None:
+            return None
+        old = self._keys(booking)
+        booking.update(fields)
+        new = self._keys(booking)
+        if new != old:
+            self._unlink(booking_id, old)
+            self._link(booking_id, new)
+        return booking
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def get(self, booking_id):
+        return self._by_id.get(booking_id)
+
+    def all(self):
+        return list(self._by_id.values())
+
+    def query(self, user_id=None, month=None, statuses=None):
+        """
+        Заявки, подходящие под все заданные условия: user_id, month ("YYYY-MM"),
+        statuses (набор статусов). Без условий — все заявки.
+        """
+        sets = []
+        if user_id is not None:
+            sets.append(self._by["user_id"].get(user_id, set()))
+        if month is not None:
+            sets.append(self._by["month"].get(month, set()))
+        if statuses is not None:
+            sets.append(set().union(*(self._by["status"].get(s, set()) for s in statuses)))
+        if not sets:
+            return self.all()
+        sets.sort(key=len)
+        ids = sets[0].intersection(*sets[1:])
+        return [self._by_id[i] for i in sorted(ids, key=self._seq.__getitem__)]
+
+
+class SubscriberCounters:
+    """Счётчики подписчиков: всего, по дням и по месяцам (по date_subscribed "YYYY-MM-DD HH:MM")."""
+
+    def __init__(self, subscribers=()):
+        self.total = 0
+        self._by_day = Counter()
+        self._by_month = Counter()
+        for sub in subscribers:
+            self.add(sub)
+
+    def add(self, subscriber, n=1):
+        day = subscriber.get("date_subscribed", "")[:10]
+        self.total += n
+        self._by_day[day] += n
+        self._by_month[day[:7]] += n
+
+    def remove(self, subscriber):
+        self.add(subscriber, -1)
+
+    def stats(self, today):
+        """today — "YYYY-MM-DD"; возвращает {"total", "today", "month"}."""
+        return {"total": self.total, "today": self._by_day[today], "month": self._by_month[today[:7]]}
+
+
+class SubscriberRegistry:
+    """Подписчики в памяти: проверка по id за O(1), порядок подписки, счётчики."""
+
+    def __init__(self, subscribers=()):
+        self._by_id = {}
+        self.counters = SubscriberCounters()
+        for sub in subscribers:
+            self.add(sub)
+
+    def __contains__(self, user_id):
+        return user_id in self._by_id
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def add(self, subscriber):
+        """False, если подписчик с таким id уже есть."""
+        if subscriber["id"] in self._by_id:
+            return False
+        self._by_id[subscriber["id"]] = subscriber
+        self.counters.add(subscriber)
+        return True
+
+    def remove(self, user_id):
+        """False, если такого подписчика нет."""
+        subscriber = self._by_id.pop(user_id, None)
+        if subscriber is None:
+            return False
+        self.counters.remove(subscriber)
+        return True
+
+    def all(self):
+        return list(self._by_id.values())
+
+    def recent(self, n):
+        """Последние n подписчиков, новые первыми."""
+        return list(islice(reversed(self._by_id.values()), n))
+
+
+class PendingApprovals:
+    """
+    Заявки, ждущие решения администратора: booking_id → {user_id, name, date, slot}.
+
+    Источник — хранилище: заявки со статусом "pending" (выборка по индексу
+    статуса). В памяти — кэш, который прогревается при старте (warm())
+    и дочитывается из хранилища при промахе, поэтому после перезапуска
+    администратор может решить заявку, поданную до него.
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+        self._cache = {}
+
+    @staticmethod
+    def _entry(booking):
+        return {"user_id": booking["user_id"], "name": booking["name"],
+                "date": booking["date"], "slot": booking["slot"]}
+
+    def warm(self):
+        """Загружает все ожидающие заявки; возвращает их число."""
+        self._cache = {b["id"]: self._entry(b) for b in self.storage.bookings_by_status("pending")}
+        return len(self._cache)
+
+    def get(self, booking_id, default=None):
+        entry = self._cache.get(booking_id)
+        if entry is None:
+            booking = self.storage.get_booking(booking_id)
+            if booking is None or booking["status"] != "pending":
+                return default
+            entry = self._cache[booking_id] = self._entry(booking)
+        return entry
+
+    def __setitem__(self, booking_id, entry):
+        self._cache[booking_id] = entry
+
+    def __delitem__(self, booking_id):
+        del self._cache[booking_id]
+
+    def pop(self, booking_id, default=None):
+        return self._cache.pop(booking_id, default)
+
+    def __len__(self):
+        return len(self._cache)
+
+
+class Storage(ABC):
+    """Общий интерфейс хранилищ: бэкенд без какого-то из методов не создастся."""
+
+    # ── заявки ───────────────────────────────────────────────────────────
+    @abstractmethod
+    def bookings(self):
+        """Все заявки в порядке создания."""
+
+    @abstractmethod
+    def get_booking(self, booking_id):
+        ...
+
+    @abstractmethod
+    def user_bookings(self, user_id, statuses=None):
+        ...
+
+    @abstractmethod
+    def bookings_by_status(self, status):
+        ...
+
+    @abstractmethod
+    def month_bookings(self, month, statuses=None):
+        """Заявки за месяц "YYYY-MM" (при statuses — только с этими статусами)."""
+
+    @abstractmethod
+    def add_booking(self, booking):
+        ...
+
+    @abstractmethod
+    def update_booking(self, booking_id, **fields):
+        """Обновляет поля заявки; возвращает обновлённую заявку или None."""
+
+    # ── лист ожидания: "YYYY-MM-DD" → [user_id (str), ...] ─────────────────
+    @abstractmethod
+    def waitlist(self):
+        ...
+
+    @abstractmethod
+    def waitlist_for(self, key):
+        ...
+
+    @abstractmethod
+    def user_waitlist(self, user_id):
+        """Даты, на которые пользователь стоит в очереди."""
+
+    @abstractmethod
+    def join_waitlist(self, key, user_id):
+        """False, если пользователь уже в очереди."""
+
+    @abstractmethod
+    def leave_waitlist(self, key, user_id):
+        """False, если пользователя в очереди не было."""
+
+    @abstractmethod
+    def pop_waitlist(self, key):
+        """Снимает и возвращает первого в очереди (или None)."""
+
+    # ── подписчики ───────────────────────────────────────────────────────
+    @abstractmethod
+    def subscribers(self):
+        ...
+
+    @abstractmethod
+    def add_subscriber(self, subscriber):
+        """False, если подписчик с таким id уже есть."""
+
+    @abstractmethod
+    def remove_subscriber(self, user_id):
+        """Убирает подписчика (например, заблокировал бота); False, если его не было."""
+
+    @abstractmethod
+    def subscriber_count(self):
+        ...
+
+    @abstractmethod
+    def is_subscriber(self, user_id):
+        ...
+
+    @abstractmethod
+    def recent_subscribers(self, n):
+        """Последние n подписчиков, новые первыми."""
+
+    @abstractmethod
+    def subscriber_stats(self, today):
+        """{"total", "today", "month"} на дату today ("YYYY-MM-DD")."""
+
+    # ── открытые месяцы: ["YYYY-MM", ...] ────────────────────────────────
+    @abstractmethod
+    def open_months(self):
+        ...
+
+    @abstractmethod
+    def open_month(self, key):
+        """False, если месяц уже был открыт."""
+
+    # ── отложенные действия: {"id", "kind", "due", "key", "data"} ─────────
+    @abstractmethod
+    def scheduled_jobs(self):
+        """Все сохранённые отложенные действия (порядок не важен — очередь по due у планировщика)."""
+
+    @abstractmethod
+    def save_job(self, job):
+        """Добавляет действие или заменяет действие с тем же id."""
+
+    @abstractmethod
+    def delete_job(self, job_id):
+        """False, если такого действия не было."""
+
+    # ── служебные отметки: key → строка ──────────────────────────────────
+    @abstractmethod
+    def get_meta(self, key):
+        """Значение отметки (например, что однократная работа уже сделана) или None."""
+
+    @abstractmethod
+    def set_meta(self, key, value):
+        ...
+
+    async def durable(self):
+        """Ждёт, пока все сделанные изменения окажутся на диске."""
+
+    def close(self):
+        pass
+
+
+class JsonStorage(Storage):
+    """
+    Прежний формат: по JSON-файлу на каждый вид данных.
+
+    Файлы читаются один раз при старте, дальше данные в памяти; каждый файл
+    пишет только его PersistentFile — в фоне, атомарно, пачкой изменений.
+
+    Подписчики: users_file (прежний список) больше не переписывается, новые
+    подписчики дописываются по строке в subscribers_log (по умолчанию users.jsonl),
+    удалённые — строкой {"id": ..., "removed": true}.
+
+    Отложенные действия — в jobs_file (по умолчанию jobs.json рядом с bookings_file),
+    служебные отметки — в meta_file (по умолчанию meta.json там же).
+    """
+
+    def __init__(self, bookings_file, waitlist_file, users_file, open_months_file, executor=None, delay=0.05,
+                 subscribers_log=None, jobs_file=None, meta_file=None):
+        self.bookings_file = bookings_file
+        self.waitlist_file = waitlist_file
+        self.users_file = users_file
+        self.open_months_file = open_months_file
+        self.subscribers_log = subscribers_log or os.path.splitext(users_file)[0] + ".jsonl"
+        self.jobs_file = jobs_file or os.path.join(os.path.dirname(bookings_file or ""), "jobs.json")
+        self.meta_file = meta_file or os.path.join(os.path.dirname(bookings_file or ""), "meta.json")
+        self._bookings = PersistentFile(bookings_file, [], executor=executor, delay=delay)
+        self._waitlist = PersistentFile(waitlist_file, {}, codec=json_codec(indent=2),
+                                        executor=executor, delay=delay)
+        self._open_months = PersistentFile(open_months_file, [], executor=executor, delay=delay)
+        self._new_subscribers = AppendLog(self.subscribers_log, executor=executor, delay=delay)
+        self._jobs = PersistentFile(self.jobs_file, {}, codec=json_codec(indent=2), executor=executor, delay=delay)
+        self._meta = PersistentFile(self.meta_file, {}, codec=json_codec(indent=2), executor=executor, delay=delay)
+        self._files = (self._bookings, self._waitlist, self._open_months, self._new_subscribers, self._jobs,
+                       self._meta)
+        self._index = BookingIndex(self._bookings.value)
+        self._subscribers = SubscriberRegistry(PersistentFile(users_file, []).value)
+        for record in self._new_subscribers.read():
+            if record.get("removed"):
+                self._subscribers.remove(record["id"])
+            else:
+                self._subscribers.add(record)
+
+    # ── заявки ───────────────────────────────────────────────────────────
+    def bookings(self):
+        return copy.deepcopy(self._bookings.value)
+
+    def get_booking(self, booking_id):
+        return copy.deepcopy(self._index.get(booking_id))
+
+    def user_bookings(self, user_id, statuses=None):
+        return copy.deepcopy(self._index.query(user_id=user_id, statuses=statuses))
+
+    def bookings_by_status(self, status):
+        return copy.deepcopy(self._index.query(statuses=(status,)))
+
+    def month_bookings(self, month, statuses=None):
+        return copy.deepcopy(self._index.query(month=month, statuses=statuses))
+
+    def add_booking(self, booking):
+        booking = copy.deepcopy(booking)
+        self._bookings.value.append(booking)
+        self._index.add(booking)
+        self._bookings.changed()
+
+    def update_booking(self, booking_id, **fields):
+        booking = self._index.update(booking_id, fields)
+        if booking is None:
+            return None
+        self._bookings.changed()
+        return copy.deepcopy(booking)
+
+    # ── лист ожидания ────────────────────────────────────────────────────
+    def waitlist(self):
+        return copy.deepcopy(self._waitlist.value)
+
+    def waitlist_for(self, key):
+        return list(self._waitlist.value.get(key, []))
+
+    def user_waitlist(self, user_id):
+        return [key for key, lst in self._waitlist.value.items() if user_id in lst]
+
+    def join_waitlist(self, key, user_id):
+        lst = self._waitlist.value.setdefault(key, [])
+        if user_id in lst:
+            return False
+        lst.append(user_id)
+        self._waitlist.changed()
+        return True
+
+    def leave_waitlist(self, key, user_id):
+        waitlist = self._waitlist.value
+        lst = waitlist.get(key, [])
+        if user_id not in lst:
+            return False
+        lst.remove(user_id)
+        if not lst:
+            del waitlist[key]
+        self._waitlist.changed()
+        return True
+
+    def pop_waitlist(self, key):
+        waitlist = self._waitlist.value
+        lst = waitlist.get(key)
+        if not lst:
+            return None
+        user_id = lst.pop(0)
+        if not lst:
+            del waitlist[key]
+        self._waitlist.changed()
+        return user_id
+
+    # ── подписчики ───────────────────────────────────────────────────────
+    def subscribers(self):
+        return copy.deepcopy(self._subscribers.all())
+
+    def add_subscriber(self, subscriber):
+        subscriber = copy.deepcopy(subscriber)
+        if not self._subscribers.add(subscriber):
+            return False
+        self._new_subscribers.append(subscriber)
+        return True
+
+    def remove_subscriber(self, user_id):
+        if not self._subscribers.remove(user_id):
+            return False
+        self._new_subscribers.append({"id": user_id, "removed": True})
+        return True
+
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def is_subscriber(self, user_id):
+        return user_id in self._subscribers
+
+    def recent_subscribers(self, n):
+        return copy.deepcopy(self._subscribers.recent(n))
+
+    def subscriber_stats(self, today):
+        return self._subscribers.counters.stats(today)
+
+    # ── открытые месяцы ──────────────────────────────────────────────────
+    def open_months(self):
+        return list(self._open_months.value)
+
+    def open_month(self, key):
+        if key in self._open_months.value:
+            return False
+        self._open_months.value.append(key)
+        self._open_months.changed()
+        return True
+
+    # ── отложенные действия ──────────────────────────────────────────────
+    def scheduled_jobs(self):
+        return copy.deepcopy(list(self._jobs.value.values()))
+
+    def save_job(self, job):
+        self._jobs.value[job["id"]] = copy.deepcopy(job)
+        self._jobs.changed()
+
+    def delete_job(self, job_id):
+        if self._jobs.value.pop(job_id, None) is None:
+            return False
+        self._jobs.changed()
+        return True
+
+    # ── служебные отметки ────────────────────────────────────────────────
+    def get_meta(self, key):
+        return self._meta.value.get(key)
+
+    def set_meta(self, key, value):
+        self._meta.value[key] = value
+        self._meta.changed()
+
+    async def durable(self):
+        for f in self._files:
+            await f.durable()
+
+    def close(self):
+        for f in self._files:
+            f.flush_now()
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS bookings (
+    id      TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    date    TEXT NOT NULL,          -- YYYY-MM-DD
+    status  TEXT NOT NULL,
+    data    TEXT NOT NULL           -- заявка целиком (JSON)
+);
+CREATE INDEX IF NOT EXISTS idx_bookings_user ON bookings(user_id);
+CREATE INDEX IF NOT EXISTS idx_bookings_date ON bookings(date);
+CREATE INDEX IF NOT EXISTS idx_bookings_status ON bookings(status);
+CREATE TABLE IF NOT EXISTS waitlist (
+    seq     INTEGER PRIMARY KEY AUTOINCREMENT,
+    date    TEXT NOT NULL,          -- YYYY-MM-DD
+    user_id TEXT NOT NULL,
+    UNIQUE (date, user_id)
+);
+CREATE INDEX IF NOT EXISTS idx_waitlist_user ON waitlist(user_id);
+CREATE TABLE IF NOT EXISTS subscribers (
+    seq  INTEGER PRIMARY KEY AUTOINCREMENT,
+    id   INTEGER NOT NULL UNIQUE,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS open_months (key TEXT PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS jobs (
+    id   TEXT PRIMARY KEY,
+    due  REAL NOT NULL,             -- unix time
+    data TEXT NOT NULL              -- действие целиком (JSON)
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_due ON jobs(due);
+"""
+
+
+class SqliteStorage(Storage):
+    """
+    SQLite в режиме WAL: читатели не ждут писателя, запись — одна строка в транзакции.
+    Индексы: заявки по user_id, дате и статусу, лист ожидания по дате (и user_id),
+    подписчики по id, отложенные действия по времени.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self._sub_counters = SubscriberCounters(self.subscribers())
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def _write(self, sql, params=()):
+        with self._lock:
+            return self._db.execute(sql, params)
+
+    # ── заявки ───────────────────────────────────────────────────────────
+    def _bookings(self, where="", params=()):
+        rows = self._query(f"SELECT data FROM bookings {where} ORDER BY rowid", params)
+        return [json.loads(data) for data, in rows]
+
+    def bookings(self):
+        return self._bookings()
+
+    def get_booking(self, booking_id):
+        found = self._bookings("WHERE id = ?", (booking_id,))
+        return found[0] if found else None
+
+    def user_bookings(self, user_id, statuses=None):
+        if statuses is None:
+            return self._bookings("WHERE user_id = ?", (user_id,))
+        marks = ",".join("?" * len(statuses))
+        return self._bookings(f"WHERE user_id = ? AND status IN ({marks})", (user_id, *statuses))
+
+    def bookings_by_status(self, status):
+        return self._bookings("WHERE status = ?", (status,))
+
+    def month_bookings(self, month, statuses=None):
+        # диапазон по индексу idx_bookings_date: 'YYYY-MM-01' ≤ date ≤ 'YYYY-MM-31'
+        where, params = "WHERE date BETWEEN ? AND ?", [f"{month}-01", f"{month}-31"]
+        if statuses is not None:
+            where += f" AND status IN ({','.join('?' * len(statuses))})"
+            params += list(statuses)
+        return self._bookings(where, params)
+
+    def add_booking(self, booking):
+        self._write("INSERT INTO bookings (id, user_id, date, status, data) VALUES (?, ?, ?, ?, ?)",
+                    (booking["id"], booking["user_id"], iso_date(booking["date"]), booking["status"],
+                     json.dumps(booking, ensure_ascii=False)))
+
+    def update_booking(self, booking_id, **fields):
+        with self._lock:
+            booking = self.get_booking(booking_id)
+            if booking is None:
+                return None
+            booking.update(fields)
+            self._write("UPDATE bookings SET user_id = ?, date = ?, status = ?, data = ? WHERE id = ?",
+                        (booking["user_id"], iso_date(booking["date"]), booking["status"],
+                         json.dumps(booking, ensure_ascii=False), booking_id))
+            return booking
+
+    # ── лист ожидания ────────────────────────────────────────────────────
+    def waitlist(self):
+        waitlist = {}
+        for key, user_id in self._query("SELECT date, user_id FROM waitlist ORDER BY seq"):
+            waitlist.setdefault(key, []).append(user_id)
+        return waitlist
+
+    def waitlist_for(self, key):
+        return [u for u, in self._query("SELECT user_id FROM waitlist WHERE date = ? ORDER BY seq", (key,))]
+
+    def user_waitlist(self, user_id):
+        return [k for k, in self._query("SELECT date FROM waitlist WHERE user_id = ? ORDER BY date", (user_id,))]
+
+    def join_waitlist(self, key, user_id):
+        cursor = self._write("INSERT OR IGNORE INTO waitlist (date, user_id) VALUES (?, ?)", (key, user_id))
+        return cursor.rowcount == 1
+
+    def leave_waitlist(self, key, user_id):
+        cursor = self._write("DELETE FROM waitlist WHERE date = ? AND user_id = ?", (key, user_id))
+        return cursor.rowcount == 1
+
+    def pop_waitlist(self, key):
+        with self._lock:
+            row = self._query("SELECT seq, user_id FROM waitlist WHERE date = ? ORDER BY seq LIMIT 1", (key,))
+            if not row:
+                return None
+            self._write("DELETE FROM waitlist WHERE seq = ?", (row[0][0],))
+            return row[0][1]
+
+    # ── подписчики ───────────────────────────────────────────────────────
+    def subscribers(self):
+        return [json.loads(data) for data, in self._query("SELECT data FROM subscribers ORDER BY seq")]
+
+    def add_subscriber(self, subscriber):
+        with self._lock:
+            cursor = self._write("INSERT OR IGNORE INTO subscribers (id, data) VALUES (?, ?)",
+                                 (subscriber["id"], json.dumps(subscriber, ensure_ascii=False)))
+            if cursor.rowcount != 1:
+                return False
+            self._sub_counters.add(subscriber)
+            return True
+
+    def remove_subscriber(self, user_id):
+        with self._lock:
+            row = self._query("SELECT data FROM subscribers WHERE id = ?", (user_id,))
+            if not row:
+                return False
+            self._write("DELETE FROM subscribers WHERE id = ?", (user_id,))
+            self._sub_counters.remove(json.loads(row[0][0]))
+            return True
+
+    def subscriber_count(self):
+        return self._query("SELECT COUNT(*) FROM subscribers")[0][0]
+
+    def is_subscriber(self, user_id):
+        return bool(self._query("SELECT 1 FROM subscribers WHERE id = ?", (user_id,)))
+
+    def recent_subscribers(self, n):
+        rows = self._query("SELECT data FROM subscribers ORDER BY seq DESC LIMIT ?", (n,))
+        return [json.loads(data) for data, in rows]
+
+    def subscriber_stats(self, today):
+        return self._sub_counters.stats(today)
+
+    # ── открытые месяцы ──────────────────────────────────────────────────
+    def open_months(self):
+        return [k for k, in self._query("SELECT key FROM open_months ORDER BY key")]
+
+    def open_month(self, key):
+        return self._write("INSERT OR IGNORE INTO open_months (key) VALUES (?)", (key,)).rowcount == 1
+
+    # ── отложенные действия ──────────────────────────────────────────────
+    def scheduled_jobs(self):
+        return [json.loads(data) for data, in self._query("SELECT data FROM jobs ORDER BY due")]
+
+    def save_job(self, job):
+        self._write("INSERT OR REPLACE INTO jobs (id, due, data) VALUES (?, ?, ?)",
+                    (job["id"], job["due"], json.dumps(job, ensure_ascii=False)))
+
+    def delete_job(self, job_id):
+        return self._write("DELETE FROM jobs WHERE id = ?", (job_id,)).rowcount == 1
+
+    # ── служебные отметки ────────────────────────────────────────────────
+    def get_meta(self, key):
+        found = self._query("SELECT value FROM meta WHERE key = ?", (key,))
+        return found[0][0] if found else None
+
+    def set_meta(self, key, value):
+        self._write("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    # ── миграция ─────────────────────────────────────────────────────────
+    def migrate_from(self, source):
+        """
+        Однократно переносит данные из другого хранилища (обычно JsonStorage).
+        Повторный вызов ничего не делает — факт миграции записан в meta.
+        """
+        with self._lock:
+            if self._query("SELECT value FROM meta WHERE key = 'migrated_from_json'"):
+                return False
+            self._db.execute("BEGIN")
+            try:
+                for b in source.bookings():
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO bookings (id, user_id, date, status, data) VALUES (?, ?, ?, ?, ?)",
+                        (b["id"], b["user_id"], iso_date(b["date"]), b["status"], json.dumps(b, ensure_ascii=False)))
+                for key, users in source.waitlist().items():
+                    for user_id in users:
+                        self._db.execute("INSERT OR IGNORE INTO waitlist (date, user_id) VALUES (?, ?)", (key, user_id))
+                for sub in source.subscribers():
+                    self._db.execute("INSERT OR IGNORE INTO subscribers (id, data) VALUES (?, ?)",
+                                     (sub["id"], json.dumps(sub, ensure_ascii=False)))
+                for key in source.open_months():
+                    self._db.execute("INSERT OR IGNORE INTO open_months (key) VALUES (?)", (key,))
+                for job in source.scheduled_jobs():
+                    self._db.execute("INSERT OR IGNORE INTO jobs (id, due, data) VALUES (?, ?, ?)",
+                                     (job["id"], job["due"], json.dumps(job, ensure_ascii=False)))
+                self._db.execute("INSERT INTO meta (key, value) VALUES ('migrated_from_json', ?)",
+                                 (datetime.now().isoformat(timespec="seconds"),))
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        self._sub_counters = SubscriberCounters(self.subscribers())
+        logger.info("Storage: JSON-файлы перенесены в %s", self.path)
+        return True
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,259 @@
+# waitlist_offers.py
+"""
+Освободившийся слот — тем, кто стоит в листе ожидания на эту дату.
+
+Слот предлагается сразу fanout людям из очереди (fanout=1 — по одному).
+У них есть claim_minutes минут, чтобы нажать «Занять»: кто успел первым,
+тот и записывается, остальным приходит «слот уже занят». Если за окно
+никто не ответил, предложение само уходит следующим в очереди (отложенное
+действие планировщика, scheduler.py), пока очередь не кончится или не
+наступит время слота.
+
+Пока слот предложен или занят откликнувшимся, он придержан: в календаре
+его видят только те, кому он предложен. Занявший слот создаёт обычную
+заявку; подтвердил её администратор — предложение закрыто, отклонил —
+слот уходит следующим в очереди. На оформление заявки у занявшего снова
+claim_minutes минут: если к этому сроку заявка не ушла администратору
+(например, брошена анкета), слот тоже уходит дальше. Записаться можно и
+мимо кнопки «Занять», выбрав слот в календаре, — предложение занимается так же.
+
+Предложения сохраняются в файл, окна ответа — в хранилище планировщика,
+поэтому после перезапуска они досчитываются сами.
+"""
+import logging
+import time
+import uuid
+from datetime import datetime
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest, Forbidden
+
+from persistence import PersistentFile
+
+logger = logging.getLogger(__name__)
+
+OFFERED, CLAIMED = "offered", "claimed"
+EXPIRE_KIND = "waitlist_offer_expire"
+
+
+class WaitlistDispatcher:
+    """Предложения освободившихся слотов: offer_id → предложение, в state_path."""
+
+    def __init__(self, storage, scheduler, state_path, tz, fanout=1, claim_minutes=15, executor=None, delay=0.05):
+        self.storage = storage
+        self.scheduler = scheduler
+        self.tz = tz
+        self.fanout = max(1, fanout)
+        self.claim_seconds = claim_minutes * 60
+        self.state = PersistentFile(state_path, {}, executor=executor, delay=delay)
+        scheduler.register(EXPIRE_KIND, self._expire)
+        now = datetime.now(tz)
+        for offer in list(self.offers.values()):
+            if self._start(offer) <= now:
+                self._drop(offer)  # слот прошёл, пока бот был выключен
+
+    @property
+    def offers(self):
+        return self.state.value
+
+    def _start(self, offer):
+        """Начало слота (aware datetime)."""
+        return self.tz.localize(datetime.strptime(f"{offer['key']} {offer['slot']}", "%Y-%m-%d %H:%M"))
+
+    def _drop(self, offer):
+        self.offers.pop(offer["id"], None)
+        self.state.changed()
+        self.scheduler.cancel(self._job_key(offer))
+
+    # ── придержанные слоты ───────────────────────────────────────────────
+    def held_slots(self, key, user_id):
+        """Слоты даты key (YYYY-MM-DD), придержанные для других, — их user_id не показываем."""
+        user_id = str(user_id)
+        held = set()
+        for offer in self.offers.values():
+            if offer["key"] != key:
+                continue
+            if offer["status"] == OFFERED and user_id in offer["offered"]:
+                continue
+            if offer["status"] == CLAIMED and offer["holder"] == user_id:
+                continue
+            held.add(offer["slot"])
+        return held
+
+    def is_offered(self, key, slot):
+        """Слот уже предложен очереди или занят по предложению."""
+        return any(offer["key"] == key and offer["slot"] == slot for offer in self.offers.values())
+
+    # ── жизненный цикл предложения ───────────────────────────────────────
+    async def slot_freed(self, context, date_str, slot):
+        """Слот (date_str — dd.mm.YYYY, slot — HH:MM) освободился: предлагаем его очереди."""
+        key = datetime.strptime(date_str, "%d.%m.%Y").strftime("%Y-%m-%d")
+        for offer in list(self.offers.values()):
+            if offer["key"] == key and offer["slot"] == slot:
+                self._drop(offer)  # заявка на придержанный слот отменена — начинаем заново
+        offer = {
+            "id": uuid.uuid4().hex,
+            "key": key,
+            "date": date_str,
+            "slot": slot,
+            "status": OFFERED,
+            "offered": {},        # user_id → message_id предложения
+            "deadline": None,
+            "holder": None,
+            "booking_id": None,
+        }
+        self.offers[offer["id"]] = offer
+        await self._advance(context, offer)
+
+    async def _advance(self, context, offer):
+        """Закрывает текущий раунд и предлагает слот следующим fanout людям из очереди."""
+        expired = offer["offered"]
+        offer.update(status=OFFERED, offered={}, holder=None, booking_id=None)
+        await self._edit_offers(context, expired, "⌛ Время на ответ вышло, слот предложен следующему в очереди.")
+
+        now = time.time()
+        start = self._start(offer).timestamp()
+        if start <= now:
+            logger.info("[Waitlist] Слот %s %s уже прошёл, предложение закрыто", offer["date"], offer["slot"])
+            self._drop(offer)
+            return
+
+        deadline = min(now + self.claim_seconds, start)
+        minutes = max(1, round((deadline - now) / 60))
+        while len(offer["offered"]) < self.fanout:
+            user_id = self.storage.pop_waitlist(offer["key"])
+            if not user_id:
+                break
+            message_id = await self._send_offer(context, offer, user_id, minutes)
+            if offer["status"] != OFFERED or offer["id"] not in self.offers:
+                return  # пока отправляли, слот заняли (или предложение закрыто)
+            if message_id is not None:
+                offer["offered"][str(user_id)] = message_id
+
+        if not offer["offered"]:
+            logger.info("[Waitlist] Очередь на %s пуста, слот %s свободен для всех", offer["date"], offer["slot"])
+            self._drop(offer)
+            return
+
+        offer["deadline"] = deadline
+        self.state.changed()
+        self._schedule(offer)
+        logger.info("[Waitlist] Слот %s %s предложен: %s", offer["date"], offer["slot"], ", ".join(offer["offered"]))
+
+    async def _send_offer(self, context, offer, user_id, minutes):
+        text = (
+            f"🔔 Освободилось окно: {offer['date']} в {offer['slot']}!\n"
+            f"Оно придержано для листа ожидания — успейте занять его за {minutes} мин."
+        )
+        if self.fanout > 1:
+            text += "\nПредложение получили несколько человек, запишется тот, кто нажмёт первым."
+        try:
+            message = await context.bot.send_message(
+                chat_id=int(user_id), text=text,
+                reply_markup=InlineKeyboardMarkup([[
+                    InlineKeyboardButton(f"✅ Занять {offer['slot']}", callback_data=f"claim_{offer['id']}")
+                ]])
+            )
+        except Forbidden:
+            logger.info("[Waitlist] %s заблокировал бота, пропускаем", user_id)
+            return None
+        except Exception as e:
+            logger.warning("[Waitlist] Не удалось отправить предложение %s: %s", user_id, e)
+            return None
+        return message.message_id
+
+    async def claim(self, context, offer_id, user_id):
+        """Пользователь нажал «Занять»: предложение, если он успел первым, иначе None."""
+        offer = self.offers.get(offer_id)
+        user_id = str(user_id)
+        if offer is None or offer["status"] != OFFERED or user_id not in offer["offered"]:
+            return None
+        others = offer["offered"]
+        others.pop(user_id)
+        # статус меняется до первого await — второй нажавший уже не пройдёт проверку выше
+        deadline = min(time.time() + self.claim_seconds, self._start(offer).timestamp())
+        offer.update(status=CLAIMED, holder=user_id, offered={}, deadline=deadline)
+        self.state.changed()
+        self._schedule(offer)  # окно ответа заменяется сроком на оформление заявки
+        await self._edit_offers(context, others, "😔 Этот слот уже занял другой клиент из листа ожидания.")
+        logger.info("[Waitlist] Слот %s %s занял %s", offer["date"], offer["slot"], user_id)
+        return dict(offer)
+
+    async def claim_for_booking(self, context, key, slot, user_id):
+        """
+        Пользователь записывается на слот обычным путём, а слот предложен ему (или уже
+        занят им по предложению): предложение занимается, как по «Занять», иначе по
+        истечении окна слот ушёл бы следующему. Возвращает id предложения или None.
+        """
+        user_id = str(user_id)
+        for offer in list(self.offers.values()):
+            if offer["key"] != key or offer["slot"] != slot:
+                continue
+            if offer["status"] == CLAIMED and offer["holder"] == user_id:
+                return offer["id"]
+            if offer["status"] == OFFERED and user_id in offer["offered"]:
+                await self.claim(context, offer["id"], user_id)
+                return offer["id"]
+        return None
+
+    def attach_booking(self, offer_id, booking_id):
+        """Заявка, созданная по предложению: её решение администратором закрывает или двигает очередь."""
+        offer = self.offers.get(offer_id)
+        if offer is not None and offer["status"] == CLAIMED:
+            offer["booking_id"] = booking_id
+            self.state.changed()
+
+    def booking_submitted(self, booking_id):
+        """Заявка по предложению ушла администратору: срок на оформление снят, дальше решает он."""
+        for offer in self.offers.values():
+            if offer["booking_id"] == booking_id and offer["status"] == CLAIMED:
+                offer["deadline"] = None
+                self.state.changed()
+                self.scheduler.cancel(self._job_key(offer))
+
+    async def booking_resolved(self, context, booking_id, confirmed):
+        """Администратор решил заявку; если она была по предложению — закрываем его или идём дальше."""
+        for offer in list(self.offers.values()):
+            if offer["booking_id"] != booking_id:
+                continue
+            if confirmed:
+                self._drop(offer)
+            else:
+                await self._advance(context, offer)
+
+    # ── окно ответа и срок заявки в планировщике ─────────────────────────
+    @staticmethod
+    def _job_key(offer):
+        return f"offer:{offer['id']}"
+
+    def _schedule(self, offer):
+        """Окно ответа или срок заявки; действие с тем же key заменяет прошлое."""
+        self.scheduler.schedule(EXPIRE_KIND, datetime.fromtimestamp(offer["deadline"], tz=self.tz),
+                                {"offer_id": offer["id"]}, key=self._job_key(offer))
+
+    async def _expire(self, context, data):
+        offer = self.offers.get(data["offer_id"])
+        if offer is None:
+            return
+        if offer["status"] == CLAIMED:
+            logger.info("[Waitlist] %s не оформил заявку на слот %s %s", offer["holder"], offer["date"], offer["slot"])
+            await self._notify_holder(context, offer, "⌛ Время на оформление записи вышло, слот предложен следующему в очереди.")
+        else:
+            logger.info("[Waitlist] Никто не ответил на слот %s %s", offer["date"], offer["slot"])
+        await self._advance(context, offer)
+
+    async def _notify_holder(self, context, offer, text):
+        try:
+            await context.bot.send_message(chat_id=int(offer["holder"]), text=text)
+        except Exception as e:
+            logger.warning("[Waitlist] Не удалось уведомить %s: %s", offer["holder"], e)
+
+    async def _edit_offers(self, context, offered, text):
+        """Заменяет текст разосланных предложений (offered: user_id → message_id)."""
+        for user_id, message_id in list(offered.items()):
+            try:
+                await context.bot.edit_message_text(chat_id=int(user_id), message_id=message_id, text=text)
+            except BadRequest as e:
+                logger.debug("[Waitlist] Не удалось обновить предложение у %s: %s", user_id, e)
+            except Exception as e:
+                logger.warning("[Waitlist] Не удалось обновить предложение у %s: %s", user_id, e)
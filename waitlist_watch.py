@@ -0,0 +1,82 @@
+# waitlist_watch.py
+"""
+Окна, освобождённые прямо в календаре, — листу ожидания.
+
+Бот сам предлагает слот очереди, только когда запись отменяют через него.
+Если мастер удалил или перенёс событие в CalDAV, об этом никто не узнаёт.
+Поэтому фоновая задача раз в interval секунд берёт свободные слоты на те
+даты, где кто-то стоит в очереди (и только на них), и сравнивает с прошлым
+снимком. Слот, которого раньше не было, — «слот открылся»: он уходит
+WaitlistDispatcher, как отменённая запись.
+
+Первая проверка даты только запоминает снимок: сравнивать не с чем,
+а окна, свободные с самого начала, очереди предлагать незачем (их видно
+в календаре). Снимки сохраняются в файл, поэтому окна, освобождённые,
+пока бот был выключен, тоже найдутся.
+"""
+import logging
+from datetime import date, datetime
+
+from persistence import PersistentFile
+
+logger = logging.getLogger(__name__)
+
+
+class AvailabilityWatcher:
+    """
+    Снимки свободных слотов по датам с очередью: "YYYY-MM-DD" → ["HH:MM", ...], в state_path.
+    fetch_free(dates) — корутина, {date: [datetime, ...]} свежими из календаря.
+    """
+
+    def __init__(self, storage, dispatcher, fetch_free, tz, state_path, executor=None, delay=0.05):
+        self.storage = storage
+        self.dispatcher = dispatcher
+        self.fetch_free = fetch_free
+        self.tz = tz
+        self.state = PersistentFile(state_path, {}, executor=executor, delay=delay)
+
+    @property
+    def snapshots(self):
+        return self.state.value
+
+    def waited_dates(self, today):
+        """Даты (не раньше today), на которые кто-то стоит в листе ожидания."""
+        return sorted(
+            day for key, users in self.storage.waitlist().items()
+            if users and (day := date.fromisoformat(key)) >= today
+        )
+
+    async def check(self, context):
+        """Одна проверка; возвращает открывшиеся слоты {date: ["HH:MM", ...]}."""
+        now = datetime.now(self.tz)
+        dates = self.waited_dates(now.date())
+        keys = {day.isoformat() for day in dates}
+        for key in [key for key in self.snapshots if key not in keys]:
+            del self.snapshots[key]  # очередь на дату опустела или дата прошла
+            self.state.changed()
+        if not dates:
+            return {}
+
+        free = await self.fetch_free(dates)
+
+        opened = {}
+        for day in dates:
+            key = day.isoformat()
+            slots = sorted(slot.strftime("%H:%M") for slot in free.get(day, []) if slot > now)
+            previous = self.snapshots.get(key)
+            if previous != slots:
+                self.snapshots[key] = slots
+                self.state.changed()
+            if previous is None:
+                continue  # первая проверка даты — только снимок
+            new = [slot for slot in slots if slot not in previous]
+            if new:
+                opened[day] = new
+
+        for day, slots in opened.items():
+            logger.info("[Waitlist] В календаре освободились окна на %s: %s", day, ", ".join(slots))
+            for slot in slots:
+                if self.dispatcher.is_offered(day.isoformat(), slot):
+                    continue  # уже предложен (отмена через бота)
+                await self.dispatcher.slot_freed(context, day.strftime("%d.%m.%Y"), slot)
+        return opened